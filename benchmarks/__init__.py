@@ -0,0 +1,4 @@
+"""
+Benchmarks for the hot paths of the application. Run individual modules from the root
+directory of the project, for example `python -m benchmarks.bench_pool`.
+"""
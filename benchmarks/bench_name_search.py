@@ -0,0 +1,123 @@
+"""
+Compares the latency of substring name searches answered by a table scan against the
+trigram index, along with the latency of fuzzy searches for misspelled names. Run from
+the root directory of the project;
+
+    python -m benchmarks.bench_name_search --rows 100000 1000000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from contextlib import closing
+from sqlite3 import connect
+
+from src.database import SQLite
+
+SCAN_QUERY = (
+    'select "email", "contact_name", "contact_number" from "contacts" '
+    'where "contact_name" like ?'
+)
+
+SAMPLE_QUERY = 'select "email", "contact_name" from "contacts" where rowid=?'
+
+WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel"]
+
+
+def populate(db_file: str, rows: int) -> None:
+    # Creating the database through `SQLite` sets up the index and its triggers
+    SQLite(db_file, pool_size=1).close()
+
+    with closing(connect(db_file)) as connection:
+        connection.executemany(
+            "insert into contacts(email, contact_name, contact_number) "
+            "values (?, ?, ?)",
+            (
+                (
+                    f"user-{index}@github.com",
+                    f"{random.choice(WORDS)} {random.choice(WORDS)} {index}",
+                    str(index),
+                )
+                for index in range(rows)
+            ),
+        )
+        connection.commit()
+
+
+def misspell(name: str) -> str:
+    # Swaps two adjacent letters of the name
+    index = random.randrange(len(name) - 1)
+    return name[:index] + name[index + 1] + name[index] + name[index + 2 :]
+
+
+def measure(func, terms) -> str:
+    timings = []
+    for term in terms:
+        start = time.perf_counter()
+        func(term)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    return f"p50 {statistics.median(timings):8.2f} ms    p95 {p95:8.2f} ms"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as directory:
+            db_file = os.path.join(directory, "contacts.db")
+            populate(db_file, rows)
+
+            # Selective searches, matching a handful of rows each
+            terms = [str(random.randrange(rows)) for _ in range(args.queries)]
+            terms = [term.zfill(4) if len(term) < 3 else term for term in terms]
+
+            with closing(connect(db_file)) as connection:
+                scan = measure(
+                    lambda term: connection.execute(
+                        SCAN_QUERY, (f"%{term}%",)
+                    ).fetchall(),
+                    terms,
+                )
+
+                # Names of existing contacts, misspelled
+                contacts = [
+                    connection.execute(
+                        SAMPLE_QUERY, (random.randrange(1, rows + 1),)
+                    ).fetchone()
+                    for _ in range(args.queries)
+                ]
+                misspelled = [(email, misspell(name)) for email, name in contacts]
+
+            # Caching disabled, only the query itself is measured
+            database = SQLite(db_file, pool_size=1, cache_size=0)
+            index = measure(
+                lambda term: database.search_entry(name=term),
+                terms,
+            )
+
+            fuzzy = measure(lambda search: database.fuzzy_search(search[1]), misspelled)
+            found = sum(
+                any(row[0] == email for row in database.fuzzy_search(name, raw=True))
+                for email, name in misspelled
+            )
+            database.close()
+
+            print(f"{rows:>9,} rows    scan:  {scan}")
+            print(f"{rows:>9,} rows    index: {index}")
+            print(
+                f"{rows:>9,} rows    fuzzy: {fuzzy}    "
+                f"found {found / len(misspelled):.0%} of the contacts"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Compares the throughput of opening a connection per request against reusing
+connections from the pool. Run from the root directory of the project;
+
+    python -m benchmarks.bench_pool --rows 10000 --threads 8 --requests 20000
+"""
+
+from typing import Callable
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from sqlite3 import connect
+
+from src.database import SQLite
+
+QUERY = (
+    'select "email", "contact_name", "contact_number" from "contacts" where "email"=?'
+)
+
+
+def populate(db_file: str, rows: int) -> None:
+    database = SQLite(db_file, pool_size=1)
+    with closing(connect(db_file)) as connection:
+        connection.executemany(
+            "insert into contacts(email, contact_name, contact_number) "
+            "values (?, ?, ?)",
+            (
+                (f"user-{index}@github.com", f"user-{index}", str(index))
+                for index in range(rows)
+            ),
+        )
+        connection.commit()
+    database.close()
+
+
+def run(name: str, func: Callable[[str], None], rows: int, args) -> None:
+    emails = [f"user-{random.randrange(rows)}@github.com" for _ in range(args.requests)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(func, emails))
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:<20} {args.requests / elapsed:>12,.0f} requests/sec")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--pool-size", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_file = os.path.join(directory, "contacts.db")
+        populate(db_file, args.rows)
+
+        def connect_per_call(email: str) -> None:
+            # Mirrors the behaviour before pooling - a fresh connection per request
+            with closing(connect(db_file)) as connection:
+                connection.execute(QUERY, (email,)).fetchall()
+
+        # Caching disabled, only the connection handling is measured
+        database = SQLite(db_file, pool_size=args.pool_size, cache_size=0)
+
+        def pooled(email: str) -> None:
+            database.search_entry(email=email)
+
+        run("connect-per-call", connect_per_call, args.rows, args)
+        run("pooled", pooled, args.rows, args)
+        database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Measures searches running alongside bulk writes. Compares a single pool of read-write
+connections shared by searches and writes (as done before the split) against a pool
+of read-only connections for searches along with a single writer connection, then
+runs the same load against `SQLite` (which splits its connections alike). Reports the
+throughput and p95/p99 latencies of searches, and the number of contacts written per
+second. Run from the root directory of the project;
+
+    python -m benchmarks.bench_read_write --rows 100000 --readers 8 --writers 4
+"""
+
+from typing import Callable, List
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from contextlib import closing
+from pathlib import Path
+from sqlite3 import Connection, connect
+from threading import Event, Lock, Thread
+
+from src.database import ConnectionPool, SQLite
+from src.objects import Contact
+
+QUERY = (
+    'select "email", "contact_name", "contact_number" from "contacts" where "email"=?'
+)
+INSERT = "insert into contacts(email, contact_name, contact_number) values (?, ?, ?)"
+
+
+def populate(db_file: str, rows: int) -> None:
+    SQLite(db_file, pool_size=1).close()
+    with closing(connect(db_file)) as connection:
+        connection.executemany(
+            INSERT,
+            (
+                (f"user-{index}@github.com", f"user {index}", str(index))
+                for index in range(rows)
+            ),
+        )
+        connection.commit()
+
+
+def measure(
+    name: str,
+    search: Callable[[str], None],
+    write: Callable[[List[tuple]], None],
+    args,
+) -> None:
+    stop = Event()
+    lock = Lock()
+    latencies: List[float] = []
+    written = 0
+
+    def reader() -> None:
+        local = []
+        while not stop.is_set():
+            email = f"user-{random.randrange(args.rows)}@github.com"
+            start = time.perf_counter()
+            search(email)
+            local.append(time.perf_counter() - start)
+
+        with lock:
+            latencies.extend(local)
+
+    def writer(index: int) -> None:
+        nonlocal written
+        batch = 0
+        while not stop.is_set():
+            write(
+                [
+                    (
+                        f"w{index}-{batch}-{row}@github.com",
+                        "new",
+                        f"w{index}-{batch}-{row}",
+                    )
+                    for row in range(args.batch)
+                ]
+            )
+            batch += 1
+            with lock:
+                written += args.batch
+
+    threads = [Thread(target=reader) for _ in range(args.readers)]
+    threads += [Thread(target=writer, args=(index,)) for index in range(args.writers)]
+    for thread in threads:
+        thread.start()
+
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    p95, p99 = (
+        latencies[int(len(latencies) * share)] if latencies else 0.0
+        for share in (0.95, 0.99)
+    )
+    print(
+        f"{name:<24} {len(latencies) / args.seconds:>10,.0f} searches/sec"
+        f"   p95 {p95 * 1000:>8.2f} ms   p99 {p99 * 1000:>8.2f} ms"
+        f"   {written / args.seconds:>10,.0f} writes/sec"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=5_000)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_file = os.path.join(directory, "contacts.db")
+        populate(db_file, args.rows)
+
+        def connect_writer(path: str) -> Connection:
+            connection = connect(path, check_same_thread=False)
+            connection.execute("pragma busy_timeout=5000")
+            return connection
+
+        def connect_reader(path: str) -> Connection:
+            connection = connect(
+                f"{Path(path).as_uri()}?mode=ro", uri=True, check_same_thread=False
+            )
+            connection.execute("pragma query_only=1")
+            return connection
+
+        def run_pools(name: str, reads: ConnectionPool, writes: ConnectionPool) -> None:
+            def search(email: str) -> None:
+                with reads.connection() as connection:
+                    connection.execute(QUERY, (email,)).fetchall()
+
+            def write(rows: List[tuple]) -> None:
+                with writes.connection() as connection:
+                    connection.executemany(INSERT, rows)
+                    connection.commit()
+
+            measure(name, search, write, args)
+            with writes.connection() as connection:
+                connection.execute("delete from contacts where email like 'w%'")
+                connection.commit()
+
+            reads.close()
+            writes.close()
+
+        # Searches and writes check out connections from the same pool, bulk writes
+        # can hold every connection while searches wait
+        shared = ConnectionPool(
+            db_file, size=args.pool_size, timeout=60, factory=connect_writer
+        )
+        run_pools("shared pool", shared, shared)
+
+        # Read-only connections for searches, a single connection for writes
+        run_pools(
+            "split pools",
+            ConnectionPool(
+                db_file, size=args.pool_size, timeout=60, factory=connect_reader
+            ),
+            ConnectionPool(db_file, size=1, timeout=60, factory=connect_writer),
+        )
+
+        # Caching disabled, every search reaches the database
+        database = SQLite(
+            db_file, pool_size=args.pool_size, pool_timeout=60, cache_size=0
+        )
+
+        def split_search(email: str) -> None:
+            database.search_entry(email=email)
+
+        def split_write(rows: List[tuple]) -> None:
+            database.add_entries(
+                Contact(email=email, name=name, phone_number=number)
+                for email, name, number in rows
+            )
+
+        measure("SQLite", split_search, split_write, args)
+        database.close()
+
+
+if __name__ == "__main__":
+    main()
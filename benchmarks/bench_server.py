@@ -0,0 +1,131 @@
+"""
+Load-tests the Flask development server against the ASGI server (uvicorn) at growing
+levels of concurrency, using email searches against a pre-populated database. Run
+from the root directory of the project;
+
+    python -m benchmarks.bench_server --concurrency 1 8 32 64
+"""
+
+from typing import List
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from http.client import HTTPConnection
+from sqlite3 import connect
+
+from src.database import SQLite
+
+SERVER = """
+import logging, sys
+from src import ContactBook
+
+book = ContactBook(
+    root_path=sys.argv[1], db_options={"cache_size": 0, "pool_size": 16}
+)
+logging.getLogger().setLevel(logging.WARNING)
+logging.getLogger("werkzeug").setLevel(logging.ERROR)
+if sys.argv[2] == "asgi":
+    book.run_async(port=int(sys.argv[3]), max_workers=16)
+else:
+    book.run(port=int(sys.argv[3]))
+"""
+
+
+def populate(root_path: str, rows: int) -> None:
+    db_file = os.path.join(root_path, "contacts.db")
+    SQLite(db_file, pool_size=1).close()
+
+    with closing(connect(db_file)) as connection:
+        connection.executemany(
+            "insert into contacts(email, contact_name, contact_number) "
+            "values (?, ?, ?)",
+            (
+                (f"user-{index}@github.com", f"user-{index}", str(index))
+                for index in range(rows)
+            ),
+        )
+        connection.commit()
+
+
+def wait_for(port: int) -> None:
+    for _ in range(100):
+        try:
+            with closing(HTTPConnection("127.0.0.1", port, timeout=1)) as connection:
+                connection.request("GET", "/")
+                connection.getresponse().read()
+                return
+        except OSError:
+            time.sleep(0.1)
+
+    raise RuntimeError("server did not start")
+
+
+def client(port: int, rows: int, count: int) -> List[float]:
+    timings = []
+    connection = HTTPConnection("127.0.0.1", port, timeout=30)
+    for _ in range(count):
+        body = json.dumps({"email": f"user-{random.randrange(rows)}@github.com"})
+        start = time.perf_counter()
+        connection.request(
+            "GET", "/search", body=body, headers={"Content-Type": "application/json"}
+        )
+        connection.getresponse().read()
+        timings.append(time.perf_counter() - start)
+
+    connection.close()
+    return timings
+
+
+def load_test(port: int, rows: int, concurrency: int, requests: int) -> str:
+    per_client = max(requests // concurrency, 1)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = executor.map(
+            lambda _: client(port, rows, per_client), range(concurrency)
+        )
+        timings = sorted(timing for result in results for timing in result)
+    elapsed = time.perf_counter() - start
+
+    p99 = timings[int(len(timings) * 0.99) - 1] * 1000
+    return f"{len(timings) / elapsed:>10,.0f} requests/sec    p99 {p99:8.2f} ms"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=4_000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--servers", nargs="+", default=["flask", "asgi"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root_path:
+        populate(root_path, args.rows)
+
+        for port, server in enumerate(args.servers, start=5100):
+            process = subprocess.Popen(
+                [sys.executable, "-c", SERVER, root_path, server, str(port)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+
+            try:
+                wait_for(port)
+                for concurrency in args.concurrency:
+                    result = load_test(port, args.rows, concurrency, args.requests)
+                    print(f"{server:<6} concurrency {concurrency:>3}: {result}")
+            finally:
+                process.terminate()
+                process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Measures the saving from precomputed query texts and the statement cache. Compares
+forming the text of a search/update query on every call (as done before the texts were
+precomputed) against looking it up, and runs searches and updates against `SQLite`
+with the statement cache disabled and enabled. Run from the root directory of the
+project;
+
+    python -m benchmarks.bench_statements --rows 10000 --count 20000
+"""
+
+from typing import Any, Callable, List, Tuple
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from contextlib import closing
+from sqlite3 import connect
+
+from src.database import SQLite
+from src.objects import Contact
+
+
+def populate(db_file: str, rows: int) -> None:
+    SQLite(db_file, pool_size=1).close()
+    with closing(connect(db_file)) as connection:
+        connection.executemany(
+            "insert into contacts(email, contact_name, contact_number) "
+            "values (?, ?, ?)",
+            (
+                (f"user-{index}@github.com", f"user {index}", str(index))
+                for index in range(rows)
+            ),
+        )
+        connection.commit()
+
+
+def build_search(email: str, name: str, limit: Any, after: Any) -> Tuple[str, list]:
+    # Mirrors the query building done on every search before the texts were
+    # precomputed, used as the baseline.
+    query = """
+        select "email", "contact_name", "contact_number" from "contacts" where
+    """
+    conditions: List[str] = []
+    placeholder: List[Any] = []
+    if email:
+        conditions.append('"email"=?')
+        placeholder.append(email)
+
+    if name:
+        conditions.append(
+            'rowid in (select rowid from "contacts_fts" where "contact_name" like ?)'
+        )
+        placeholder.append(f"%{name}%")
+
+    if after:
+        conditions.append('"email">?')
+        placeholder.append(after)
+
+    query += " and ".join(conditions)
+    if limit is not None or after is not None:
+        query += ' order by "email"'
+
+    if limit is not None:
+        query += " limit ?"
+        placeholder.append(limit)
+
+    return query, placeholder
+
+
+def build_update(email: str, update: Contact) -> Tuple[str, list]:
+    query = 'update "contacts" set '
+    placeholder: List[Any] = []
+    for key, val in {
+        "email": update.email,
+        "contact_name": update.name,
+        "contact_number": update.phone_number,
+    }.items():
+        if val:
+            query += f'{"," if placeholder else ""}"{key}"=?'
+            placeholder.append(val)
+
+    query += ' where "email"=?'
+    placeholder.append(email)
+    return query, placeholder
+
+
+def run(name: str, func: Callable[[int], Any], count: int) -> float:
+    start = time.perf_counter()
+    for index in range(count):
+        func(index)
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:<36} {count / elapsed:>12,.0f} ops/sec")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--count", type=int, default=20_000)
+    args = parser.parse_args()
+
+    # Query building alone, without touching the database
+    searches = {
+        "email": "user-1@github.com",
+        "name": "user 1",
+        "limit": 20,
+        "after": "user-0@github.com",
+    }
+    update = Contact(name="someone", email="", phone_number="12345")
+    texts = {
+        "search": build_search(**searches)[0],
+        "update": build_update("user-1@github.com", update)[0],
+    }
+
+    run("build search query", lambda _: build_search(**searches), args.count)
+    run("look up search query", lambda _: texts["search"], args.count)
+    run(
+        "build update query",
+        lambda _: build_update("user-1@github.com", update),
+        args.count,
+    )
+    run("look up update query", lambda _: texts["update"], args.count)
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_file = os.path.join(directory, "contacts.db")
+        populate(db_file, args.rows)
+
+        emails = [f"user-{random.randrange(args.rows)}@github.com" for _ in range(64)]
+        for size in (0, 256):
+            # Search caching disabled, every call reaches the database
+            database = SQLite(
+                db_file, pool_size=1, cache_size=0, statement_cache_size=size
+            )
+            label = f"statement cache={size}"
+
+            run(
+                f"search by email, {label}",
+                lambda index: database.search_entry(email=emails[index % 64]),
+                args.count,
+            )
+            run(
+                f"search by name, {label}",
+                lambda index: database.search_entry(
+                    name=f"user {index % args.rows}", limit=10
+                ),
+                args.count,
+            )
+            run(
+                f"update name, {label}",
+                lambda index: database.update_entry(
+                    emails[index % 64],
+                    Contact(name=f"user {index}", email="", phone_number=""),
+                ),
+                args.count,
+            )
+            database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Benchmark suite for the database layer and the API. Generates a synthetic dataset for
+every requested size, and measures the throughput and latency percentiles of adding,
+updating, deleting and searching (by email and by name) contacts - both by calling
+`SQLite` directly, and through the Flask test client. Run from the root directory of
+the project;
+
+    python -m benchmarks.bench_suite --rows 10000 100000 --output bench.json
+
+Results are written as JSON, pass the results of a previous run through `--compare`
+to print the change in throughput against it.
+"""
+
+from typing import Any, Callable, Dict, List, Tuple
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+
+from src import ContactBook, __version__
+from src.database import SQLite
+from src.objects import Contact
+
+FIRST_NAMES = (
+    "ada alan barbara claude dennis edsger frances grace guido john ken linus "
+    "margaret niklaus radia richard shafi tim vint whitfield"
+).split()
+
+LAST_NAMES = (
+    "allen backus cerf diffie hamilton hopper kernighan knuth lamport liskov "
+    "lovelace perlman ritchie rossum stallman thompson torvalds turing wirth"
+).split()
+
+OPERATIONS = ("add", "update", "delete", "search_email", "search_name")
+
+# Runs a single operation against the `index`-th contact of the operation
+Operation = Callable[[int], Any]
+
+
+def name_of(index: int) -> str:
+    first = FIRST_NAMES[index % len(FIRST_NAMES)]
+    last = LAST_NAMES[(index // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    return f"{first} {last} {index}"
+
+
+def populate(db_file: str, rows: int) -> None:
+    """
+    Creates the database (along with its indexes), and fills it with `rows` synthetic
+    contacts.
+
+    Args:
+        db_file: String containing full path to the database file
+        rows: Number of contacts to be generated
+    """
+
+    SQLite(db_file, pool_size=1).close()
+
+    with closing(sqlite3.connect(db_file)) as connection:
+        connection.executemany(
+            "insert into contacts(email, contact_name, contact_number) "
+            "values (?, ?, ?)",
+            (
+                (f"user-{index}@github.com", name_of(index), str(index))
+                for index in range(rows)
+            ),
+        )
+        connection.commit()
+
+
+def percentile(timings: List[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of sorted timings, in milliseconds.
+    """
+
+    rank = max(math.ceil(fraction * len(timings)), 1)
+    return timings[rank - 1] * 1000
+
+
+def measure(operation: Operation, count: int) -> Dict[str, float]:
+    """
+    Runs an operation `count` times back-to-back, timing every call.
+
+    Args:
+        operation: The operation to be measured
+        count: Number of times the operation is run
+
+    Returns:
+        Dictionary containing the throughput, and latency percentiles.
+    """
+
+    timings = []
+    start = time.perf_counter()
+    for index in range(count):
+        call_start = time.perf_counter()
+        operation(index)
+        timings.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+
+    timings.sort()
+    return {
+        "count": count,
+        "ops_per_sec": round(count / elapsed, 1),
+        "mean_ms": round(sum(timings) / count * 1000, 4),
+        "p50_ms": round(percentile(timings, 0.50), 4),
+        "p95_ms": round(percentile(timings, 0.95), 4),
+        "p99_ms": round(percentile(timings, 0.99), 4),
+    }
+
+
+def database_operations(
+    database: SQLite, rows: int, seed: int
+) -> List[Tuple[str, Operation]]:
+    picker = random.Random(seed)
+    existing = [picker.randrange(rows) for _ in range(rows)]
+
+    def new_contact(index: int) -> Contact:
+        return Contact(
+            name=name_of(rows + index),
+            email=f"new-{index}@github.com",
+            phone_number=f"new-{index}",
+        )
+
+    return [
+        ("add", lambda index: database.add_entry(new_contact(index))),
+        (
+            "update",
+            lambda index: database.update_entry(
+                email=f"new-{index}@github.com",
+                update=Contact(name="", email="", phone_number=f"updated-{index}"),
+            ),
+        ),
+        ("delete", lambda index: database.remove_entry(f"new-{index}@github.com")),
+        (
+            "search_email",
+            lambda index: database.search_entry(
+                email=f"user-{existing[index % rows]}@github.com"
+            ),
+        ),
+        (
+            "search_name",
+            lambda index: database.search_entry(name=name_of(existing[index % rows])),
+        ),
+    ]
+
+
+def api_operations(
+    book: ContactBook, rows: int, seed: int
+) -> List[Tuple[str, Operation]]:
+    client = book.app.test_client()
+    picker = random.Random(seed)
+    existing = [picker.randrange(rows) for _ in range(rows)]
+
+    def check(response: Any) -> None:
+        if response.status_code != 200:
+            raise RuntimeError(f"request failed with status {response.status_code}")
+
+    return [
+        (
+            "add",
+            lambda index: check(
+                client.post(
+                    "/post",
+                    json={
+                        "name": name_of(rows + index),
+                        "email": f"new-{index}@github.com",
+                        "phone": f"new-{index}",
+                    },
+                )
+            ),
+        ),
+        (
+            "update",
+            lambda index: check(
+                client.post(
+                    "/update",
+                    json={
+                        "email": f"new-{index}@github.com",
+                        "new_phone": f"updated-{index}",
+                    },
+                )
+            ),
+        ),
+        (
+            "delete",
+            lambda index: check(
+                client.delete("/delete", json={"email": f"new-{index}@github.com"})
+            ),
+        ),
+        (
+            "search_email",
+            lambda index: check(
+                client.get(
+                    "/search",
+                    json={"email": f"user-{existing[index % rows]}@github.com"},
+                )
+            ),
+        ),
+        (
+            "search_name",
+            lambda index: check(
+                client.get("/search", json={"name": name_of(existing[index % rows])})
+            ),
+        ),
+    ]
+
+
+def run_layer(layer: str, rows: int, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """
+    Benchmarks every operation of a layer against a freshly generated dataset.
+
+    Args:
+        layer: Either `db` to call the database directly, or `api` to go through the
+            routes of the application
+        rows: Number of contacts in the dataset
+        args: The parsed command line arguments
+
+    Returns:
+        List containing the results of every operation.
+    """
+
+    results = []
+    with tempfile.TemporaryDirectory() as root_path:
+        db_file = os.path.join(root_path, "contacts.db")
+        populate(db_file, rows)
+
+        # Caching is disabled, every search has to hit the database
+        db_options = {"cache_size": 0}
+        if layer == "api":
+            book = ContactBook(root_path=root_path, db_options=db_options)
+            logging.getLogger().setLevel(logging.ERROR)
+            operations = api_operations(book, rows, args.seed)
+        else:
+            database = SQLite(db_file, **db_options)
+            operations = database_operations(database, rows, args.seed)
+
+        for name, operation in operations:
+            if name not in args.operations:
+                continue
+
+            # Writes are always run in order (add, update, delete) against the
+            # contacts created by `add`, the dataset is left unchanged at the end.
+            result = measure(operation, args.count)
+            result.update(layer=layer, rows=rows, operation=name)
+            results.append(result)
+            print(
+                f"{layer:<4} {rows:>9,} rows  {name:<13}"
+                f"{result['ops_per_sec']:>12,.0f} ops/sec"
+                f"  p50 {result['p50_ms']:8.3f} ms"
+                f"  p95 {result['p95_ms']:8.3f} ms"
+                f"  p99 {result['p99_ms']:8.3f} ms"
+            )
+
+        if layer == "db":
+            database.close()
+
+    return results
+
+
+def compare(results: List[Dict[str, Any]], baseline_file: str) -> None:
+    with open(baseline_file) as file:
+        baseline = {
+            (result["layer"], result["rows"], result["operation"]): result
+            for result in json.load(file)["results"]
+        }
+
+    print(f"\nchange in throughput against `{baseline_file}`:")
+    for result in results:
+        previous = baseline.get(
+            (result["layer"], result["rows"], result["operation"]), None
+        )
+        if previous is None:
+            continue
+
+        change = result["ops_per_sec"] / previous["ops_per_sec"] - 1
+        print(
+            f"{result['layer']:<4} {result['rows']:>9,} rows  "
+            f"{result['operation']:<13}{change:>+10.1%}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--count", type=int, default=2_000)
+    parser.add_argument("--layers", nargs="+", default=["db", "api"])
+    parser.add_argument("--operations", nargs="+", default=list(OPERATIONS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None)
+    args = parser.parse_args()
+
+    if {"update", "delete"} & set(args.operations) and "add" not in args.operations:
+        parser.error("`update` and `delete` run against the contacts created by `add`")
+
+    results: List[Dict[str, Any]] = []
+    for rows in args.rows:
+        for layer in args.layers:
+            results.extend(run_layer(layer, rows, args))
+
+    report = {
+        "meta": {
+            "version": __version__,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "count": args.count,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+            file.write("\n")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,229 @@
-from typing import Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import logging as log
+import os
+from argparse import ArgumentParser, Namespace
 from configparser import ConfigParser, NoOptionError, NoSectionError
+from os.path import join
 from pathlib import Path
 
 from src import ContactBook
+from src.compression import gzip_stream
+from src.database import backends, create_database
+from src.database.tenants import TENANT_ID
+from src.objects import iter_ndjson
+from src.prefork import PreforkServer
 
 
-def read_configs() -> Tuple[str, bool]:
+def read_db_configs(parser: ConfigParser) -> Dict[str, Any]:
+    """
+    Reads the optional `database` section of the config file. Options that are absent
+    are left out, letting the database fall back to its defaults.
+
+    Args:
+        parser: The parser instance with the config file loaded
+
+    Returns:
+        Dictionary containing the name of the backend (`backend`), along with the
+        keyword arguments to be passed to the database
+
+    Raises:
+        ValueError: If the backend is not registered
+    """
+
+    options: Dict[str, Any] = {}
+    if not parser.has_section("database"):
+        return options
+
+    backend = parser.get("database", "backend", fallback="sqlite").lower()
+    if backend not in backends():
+        raise ValueError(f"unknown database backend `{backend}`")
+
+    options["backend"] = backend
+    if backend == "memory":
+        if parser.has_option("database", "snapshot_interval"):
+            options["snapshot_interval"] = parser.getint(
+                "database", "snapshot_interval"
+            )
+
+        if parser.has_option("database", "fsync"):
+            options["fsync"] = parser.getboolean("database", "fsync")
+
+        return options
+    elif backend not in ("sqlite", "sharded", "postgres"):
+        # Backends registered elsewhere receive the options as they are
+        options.update(
+            (key, value) for key, value in parser.items("database") if key != "backend"
+        )
+        return options
+
+    if parser.has_option("database", "pool_size"):
+        options["pool_size"] = parser.getint("database", "pool_size")
+
+    if parser.has_option("database", "pool_timeout"):
+        options["pool_timeout"] = parser.getfloat("database", "pool_timeout")
+
+    if backend == "postgres":
+        options["dsn"] = parser.get("database", "dsn")
+        return options
+
+    if backend == "sharded" and parser.has_option("database", "shards"):
+        options["shards"] = parser.getint("database", "shards")
+
+    if parser.has_option("database", "cache_size"):
+        options["cache_size"] = parser.getint("database", "cache_size")
+
+    if parser.has_option("database", "cache_ttl"):
+        options["cache_ttl"] = parser.getfloat("database", "cache_ttl")
+
+    if parser.has_option("database", "cache_negative"):
+        options["cache_negative"] = parser.getboolean("database", "cache_negative")
+
+    # Options of the form `pragma_<name>` are applied as pragmas to every connection
+    pragmas = {
+        key[len("pragma_") :]: value
+        for key, value in parser.items("database")
+        if key.startswith("pragma_")
+    }
+    if pragmas:
+        options["pragmas"] = pragmas
+
+    if parser.has_option("database", "write_batching"):
+        options["write_batching"] = parser.getboolean("database", "write_batching")
+
+    if parser.has_option("database", "write_batch_size"):
+        options["write_batch_size"] = parser.getint("database", "write_batch_size")
+
+    if parser.has_option("database", "change_retention"):
+        # An empty value keeps changes forever
+        retention = parser.get("database", "change_retention").strip()
+        options["change_retention"] = float(retention) if retention else None
+
+    if parser.has_option("database", "change_compact_interval"):
+        options["change_compact_interval"] = parser.getint(
+            "database", "change_compact_interval"
+        )
+
+    if parser.has_option("database", "statement_cache_size"):
+        options["statement_cache_size"] = parser.getint(
+            "database", "statement_cache_size"
+        )
+
+    return options
+
+
+def read_limit_configs(parser: ConfigParser) -> Dict[str, Any]:
+    """
+    Reads the limits applied to requests from the `limits` section of the config file.
+    Options named after a route (starting with a `/`) set the rate of that route.
+
+    Args:
+        parser: The parser instance with the config file loaded
+
+    Returns:
+        Dictionary containing the limits, empty if the section is absent
+    """
+
+    if not parser.has_section("limits"):
+        return {}
+
+    options: Dict[str, Any] = {
+        "rate": parser.getfloat("limits", "rate", fallback=0),
+        "burst": parser.getint("limits", "burst", fallback=10),
+        "max_in_flight": parser.getint("limits", "max_in_flight", fallback=0),
+        "max_queued": parser.getint("limits", "max_queued", fallback=0),
+        "queue_timeout": parser.getfloat("limits", "queue_timeout", fallback=1.0),
+    }
+
+    routes = {
+        key: float(value)
+        for key, value in parser.items("limits")
+        if key.startswith("/")
+    }
+    if routes:
+        options["routes"] = routes
+
+    return options
+
+
+def read_tenant_configs(parser: ConfigParser) -> Optional[Dict[str, Any]]:
+    """
+    Reads the optional `tenants` section of the config file.
+
+    Args:
+        parser: The parser instance with the config file loaded
+
+    Returns:
+        Dictionary containing the tenant options, None if tenants are not enabled
+    """
+
+    if not parser.getboolean("tenants", "enabled", fallback=False):
+        return None
+
+    # An empty idle timeout keeps databases open till evicted
+    idle_timeout = parser.get("tenants", "idle_timeout", fallback="").strip()
+    return {
+        "max_open": parser.getint("tenants", "max_open", fallback=100),
+        "idle_timeout": float(idle_timeout) if idle_timeout else None,
+    }
+
+
+def read_server_configs(parser: ConfigParser) -> Dict[str, Any]:
+    """
+    Reads the options controlling how the application is served from the `fast-track`
+    section of the config file, falling back to the defaults for absent options.
+
+    Args:
+        parser: The parser instance with the config file loaded
+
+    Returns:
+        Dictionary containing the server options
+
+    Raises:
+        ValueError: If the server mode is unknown
+    """
+
+    server = parser.get("fast-track", "server", fallback="flask").lower()
+    if server not in ("flask", "asgi"):
+        raise ValueError(f"unknown server mode `{server}`")
+
+    # An empty value for the number of workers falls back to the number of cores
+    workers = parser.get("fast-track", "workers", fallback="").strip()
+
+    # An empty compression threshold disables compression
+    threshold = parser.get("fast-track", "compression_threshold", fallback="1024")
+
+    return {
+        "server": server,
+        "host": parser.get("fast-track", "host", fallback="127.0.0.1"),
+        "port": parser.getint("fast-track", "port", fallback=5000),
+        "max_workers": parser.getint("fast-track", "max_workers", fallback=5),
+        "prefork": parser.getboolean("fast-track", "prefork", fallback=False),
+        "workers": int(workers) if workers else None,
+        "max_requests": parser.getint("fast-track", "max_requests", fallback=0),
+        "graceful_timeout": parser.getfloat(
+            "fast-track", "graceful_timeout", fallback=30.0
+        ),
+        "metrics": parser.getboolean("fast-track", "metrics", fallback=False),
+        "admin_token": parser.get("fast-track", "admin_token", fallback="").strip()
+        or None,
+        "etags": parser.getboolean("fast-track", "etags", fallback=True),
+        "compression_threshold": int(threshold) if threshold.strip() else None,
+        "limit_options": read_limit_configs(parser),
+        "tenant_options": read_tenant_configs(parser),
+        "log_options": {
+            "max_bytes": parser.getint(
+                "fast-track", "log_max_bytes", fallback=10485760
+            ),
+            "backup_count": parser.getint("fast-track", "log_backups", fallback=5),
+            "sample_every": parser.getint(
+                "fast-track", "log_debug_sample", fallback=100
+            ),
+        },
+    }
+
+
+def read_configs() -> Tuple[str, bool, Dict[str, Any], Dict[str, Any]]:
     """
     Reads the config file and return the values found
 
@@ -31,7 +247,17 @@ def read_configs() -> Tuple[str, bool]:
         root_path = root_path.replace(
             "{cur_dir}", str(Path(__file__).parent.absolute())
         )
-        return root_path, debug
+        db_configs = read_db_configs(parser)
+        server_configs = read_server_configs(parser)
+        if (
+            server_configs["prefork"]
+            and db_configs.get("backend", "sqlite") == "memory"
+        ):
+            # Every worker would hold its own copy of the contacts, compacting the log
+            # truncates it under the other workers
+            raise ValueError("the `memory` backend can not be used with `prefork`")
+
+        return root_path, debug, db_configs, server_configs
     except (NoOptionError, NoSectionError):
         # Config file does not contain the `database` section, or the section does not
         # contain the `path` option.
@@ -41,10 +267,170 @@ def read_configs() -> Tuple[str, bool]:
     except Exception as e:
         # Unknown error
         log.error("unknown error occurred while reading the config file")
-        log.error(f"{type(e)}\n{str(e)}")
+        log.error("%s\n%s", type(e), e)
         exit(-20)
 
 
+def parse_args(args: Optional[List[str]] = None) -> Namespace:
+    """
+    Parses the command line. Without a command, the server is run.
+
+    Args:
+        args: List of arguments, read from the command line if None
+
+    Returns:
+        Namespace containing the command (`serve`, `backup` or `snapshot`) and its
+        arguments
+    """
+
+    parser = ArgumentParser(description="Runs the contact book, or copies its data")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("serve", help="run the server (default)")
+
+    backup = commands.add_parser(
+        "backup", help="copy the database, without stopping a running server"
+    )
+    snapshot = commands.add_parser(
+        "snapshot", help="export all contacts as gzip compressed NDJSON"
+    )
+    for command in (backup, snapshot):
+        command.add_argument("target", help="path to write the copy to")
+        command.add_argument(
+            "--tenant", default=None, help="id of the tenant, if tenants are enabled"
+        )
+
+    parsed = parser.parse_args(args)
+    parsed.command = parsed.command or "serve"
+    return parsed
+
+
+def copy_database(
+    command: str, root_path: str, db_options: Dict[str, Any], args: Namespace
+) -> None:
+    """
+    Backs up the database, or exports a snapshot of it, to `args.target`. Safe to run
+    alongside a running server.
+
+    Args:
+        command: String containing the command, either `backup` or `snapshot`
+        root_path: String containing path to the root directory
+        db_options: Dictionary containing the options of the database
+        args: Namespace containing the arguments of the command
+
+    Remarks:
+        Will force-stop the script if the database does not support the command
+    """
+
+    if args.tenant:
+        if not TENANT_ID.fullmatch(args.tenant):
+            log.error("invalid tenant id `%s`", args.tenant)
+            exit(-30)
+
+        root_path = join(root_path, "tenants", args.tenant)
+
+    db_options = dict(db_options)
+    database = create_database(
+        db_options.pop("backend", "sqlite"), root_path, **db_options
+    )
+    try:
+        if command == "backup":
+            pages = database.backup(args.target)
+            if pages is None:
+                log.error("backups are not supported by the database")
+                exit(-30)
+
+            print(f"copied {pages} pages to {args.target}")
+            return
+
+        rows = database.snapshot_entries()
+        if rows is None:
+            log.error("snapshots are not supported by the database")
+            exit(-30)
+
+        partial = f"{args.target}.partial"
+        with open(partial, "wb") as file:
+            for chunk in gzip_stream(iter_ndjson(rows)):
+                file.write(chunk)
+
+        os.replace(partial, args.target)
+        print(f"exported a snapshot to {args.target}")
+    finally:
+        database.close()
+
+
 if __name__ == "__main__":
+    arguments = parse_args()
     configs = read_configs()
-    ContactBook(name=__name__, root_path=configs[0], debug_mode=configs[1]).run()
+    server_configs = configs[3]
+
+    if arguments.command != "serve":
+        copy_database(arguments.command, configs[0], configs[2], arguments)
+        exit(0)
+
+    db_options = configs[2]
+    if server_configs["prefork"] and db_options.get("backend", "sqlite") in (
+        "sqlite",
+        "sharded",
+    ):
+        # Writes evict cached results only in the worker serving them, other workers
+        # would serve stale results till they expire
+        db_options = {**db_options, "cache_size": 0}
+
+    log_options = server_configs["log_options"]
+    if server_configs["prefork"]:
+        # Workers rotating the same file at once would clobber each other's logs
+        log_options = {**log_options, "max_bytes": 0}
+
+    def create_book() -> ContactBook:
+        return ContactBook(
+            name=__name__,
+            root_path=configs[0],
+            debug_mode=configs[1],
+            db_options=db_options,
+            metrics=server_configs["metrics"],
+            log_options=log_options,
+            # Versions are tracked per process, workers do not see each other's writes
+            etags=server_configs["etags"] and not server_configs["prefork"],
+            compression_threshold=server_configs["compression_threshold"],
+            limit_options=server_configs["limit_options"],
+            tenant_options=server_configs["tenant_options"],
+            admin_token=server_configs["admin_token"],
+        )
+
+    if server_configs["prefork"]:
+        # Every worker creates its own instance after being forked, and closes it
+        # before exiting
+        asgi = server_configs["server"] == "asgi"
+        worker_books: List[ContactBook] = []
+
+        def create_app() -> Any:
+            book = create_book()
+            worker_books.append(book)
+            return (
+                book.asgi(max_workers=server_configs["max_workers"])
+                if asgi
+                else book.app
+            )
+
+        def close_books() -> None:
+            for book in worker_books:
+                book.close()
+
+        PreforkServer(
+            create_app,
+            host=server_configs["host"],
+            port=server_configs["port"],
+            workers=server_configs["workers"],
+            max_requests=server_configs["max_requests"],
+            graceful_timeout=server_configs["graceful_timeout"],
+            asgi=asgi,
+            on_exit=close_books,
+        ).serve_forever()
+    elif server_configs["server"] == "asgi":
+        create_book().run_async(
+            host=server_configs["host"],
+            port=server_configs["port"],
+            max_workers=server_configs["max_workers"],
+        )
+    else:
+        create_book().run(host=server_configs["host"], port=server_configs["port"])
@@ -0,0 +1,524 @@
+"""
+Defines an ASGI application serving the core endpoints of `ContactBook`. Blocking
+database calls are handed off to a bounded pool of threads, keeping the event loop
+free to accept and parse other requests in the meantime.
+"""
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import asyncio
+import logging as log
+import math
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from json import JSONDecodeError, dumps, loads
+
+from .database.base_db import BaseDB
+from .database.fuzzy import FUZZY_LIMIT
+from .limits import AdmissionController, RateLimiter
+from .metrics import NULL_METRICS, Metrics
+from .objects import Contact, dump_keyed_rows, dump_rows
+
+Scope = Dict[str, Any]
+Message = Dict[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+
+# Response payload along with the HTTP status code, and optionally a dictionary of
+# headers - mirrors the tuples returned by Flask views.
+Response = Tuple[Any, ...]
+
+# Maximum number of emails that can be looked up by a single batch search
+MAX_BATCH_SIZE = 1000
+
+
+def read_batch(payload: Dict[str, Any]) -> Optional[List[str]]:
+    """
+    Validates the body of a batch search.
+
+    Args:
+        payload: Dictionary containing the JSON body of the request
+
+    Returns:
+        List of emails to be looked up, None if the request is malformed.
+    """
+
+    emails = payload.get("emails", None)
+    if (
+        not isinstance(emails, list)
+        or not 0 < len(emails) <= MAX_BATCH_SIZE
+        or not all(isinstance(email, str) and email for email in emails)
+    ):
+        return None
+
+    return emails
+
+
+class AsyncContactBook:
+    """
+    ASGI application exposing the `/post`, `/update`, `/search`, `/search/batch` and
+    `/delete` endpoints, answering requests like `ContactBook` does - except that
+    responses are neither streamed (the `stream` option of searches is ignored),
+    tagged with ETags, nor compressed. The change log, bulk and admin endpoints are
+    not served. Rate limits and admission control apply as they do with `ContactBook`.
+
+    Methods:
+    --------
+        add_contact(Dict) -> Response
+            Adds a new contact to the database
+
+        edit_contact(Dict) -> Response
+            Edits an existing contact
+
+        search_contact(Dict) -> Response
+            Searches for contacts using their name or email
+
+        search_batch(Dict) -> Response
+            Looks up multiple contacts using their email
+
+        remove_contact(Dict) -> Response
+            Removes an existing contact from the database
+
+        export_metrics(Dict) -> Response
+            Exports the recorded metrics, served only if metrics are enabled
+
+        close()
+            Shuts down the thread pool, and closes the database
+    """
+
+    def __init__(
+        self,
+        database: BaseDB,
+        max_workers: int = 5,
+        metrics: Optional[Metrics] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        admission: Optional[AdmissionController] = None,
+    ):
+        """
+        Args:
+            database: The database to serve requests from
+            max_workers: Maximum number of database calls running at a time. Should
+                not be greater than the size of the connection pool of the database
+            metrics: Registry to record the latency of requests to, exposed through
+                the `/metrics` endpoint if enabled
+            rate_limiter: Limits the rate of requests sent by every client, requests
+                are not rate limited if absent
+            admission: Bounds the number of requests served at a time, requests are
+                admitted right away if absent
+        """
+
+        self.__database = database
+        self.__metrics = metrics or NULL_METRICS
+        self.__rate_limiter = rate_limiter
+        self.__admission = admission
+
+        # Requests waiting for a slot block a thread each, on threads of their own -
+        # enough for a full queue, and one more to turn away the requests beyond it
+        self.__admission_executor: Optional[ThreadPoolExecutor] = None
+        if admission is not None:
+            self.__admission_executor = ThreadPoolExecutor(
+                max_workers=admission.max_queued + 1,
+                thread_name_prefix="admission",
+            )
+        self.__executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="db-worker"
+        )
+
+        self.__routes: Dict[Tuple[str, str], Callable[[Dict[str, Any]], Awaitable]] = {
+            ("/post", "POST"): self.add_contact,
+            ("/update", "POST"): self.edit_contact,
+            ("/search", "GET"): self.search_contact,
+            ("/search/batch", "GET"): self.search_batch,
+            ("/search/batch", "POST"): self.search_batch,
+            ("/delete", "DELETE"): self.remove_contact,
+        }
+
+        if self.__metrics.enabled:
+            self.__routes[("/metrics", "GET")] = self.export_metrics
+
+    async def __run(self, func: Callable[..., Any], **kwargs: Any) -> Any:
+        """
+        Runs a blocking call on the thread pool.
+
+        Args:
+            func: The function to be called
+            **kwargs: Named arguments to be passed to the function
+
+        Returns:
+            The value returned by the function.
+        """
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, partial(func, **kwargs))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self.__lifespan(receive, send)
+            return
+
+        if scope["type"] != "http":
+            return
+
+        if not self.__metrics.enabled:
+            await self.__handle(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_timed(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+            await send(message)
+
+        try:
+            await self.__handle(scope, receive, send_timed)
+        finally:
+            path, method = scope["path"], scope["method"]
+            self.__metrics.observe(
+                "request_seconds",
+                time.perf_counter() - start,
+                route=path if (path, method) in self.__routes else "unmatched",
+                method=method,
+                status=str(status),
+            )
+
+    async def __handle(self, scope: Scope, receive: Receive, send: Send) -> None:
+        path, method = scope["path"], scope["method"]
+        handler = self.__routes.get((path, method), None)
+        if handler is None:
+            if any(route == path for route, _ in self.__routes):
+                await self.__respond(send, {"error": "method not allowed"}, 405)
+            else:
+                await self.__respond(send, {"error": "not found"}, 404)
+            return
+
+        # The metrics endpoint is exempt from the limits, like with `ContactBook`
+        if path == "/metrics":
+            await self.__serve(path, handler, receive, send)
+            return
+
+        if self.__rate_limiter is not None:
+            client = (scope.get("client", None) or ("", 0))[0]
+            wait = self.__rate_limiter.check(client, path)
+            if wait > 0:
+                await self.__reject(send, "too many requests", 429, wait)
+                return
+
+        if self.__admission is None:
+            await self.__serve(path, handler, receive, send)
+            return
+
+        if not await self.__admit():
+            await self.__reject(
+                send, "server overloaded", 503, self.__admission.retry_after
+            )
+            return
+
+        try:
+            await self.__serve(path, handler, receive, send)
+        finally:
+            self.__admission.release()
+
+    async def __admit(self) -> bool:
+        """
+        Waits for an admission slot off the event loop. A request cancelled while
+        waiting hands its slot back as soon as it is granted.
+
+        Returns:
+            Boolean indicating if the request was admitted, the slot has to be
+            released once done if so.
+        """
+
+        future = self.__admission_executor.submit(self.__admission.acquire)
+        try:
+            # Shielded, the wait carries on (and its outcome is seen) once cancelled
+            return await asyncio.shield(asyncio.wrap_future(future))
+        except asyncio.CancelledError:
+            # Called by the waiting thread, even once the event loop is gone
+            future.add_done_callback(self.__release_abandoned)
+            raise
+
+    def __release_abandoned(self, future: "Future[bool]") -> None:
+        if not future.cancelled() and future.exception() is None and future.result():
+            self.__admission.release()
+
+    async def __serve(
+        self,
+        path: str,
+        handler: Callable[[Dict[str, Any]], Awaitable],
+        receive: Receive,
+        send: Send,
+    ) -> None:
+        try:
+            body = await self.__read_body(receive)
+            payload = loads(body) if body else {}
+            if not isinstance(payload, dict):
+                raise ValueError("request body is not a JSON object")
+        except (JSONDecodeError, UnicodeDecodeError, ValueError):
+            await self.__respond(send, {"error": "malformed request"}, 400)
+            return
+
+        headers: Dict[str, str] = {}
+        try:
+            result, status, *extra = await handler(payload)
+            if extra:
+                headers = extra[0]
+        except Exception as e:
+            log.warning("unknown exception raised while serving `%s`", path)
+            log.warning("exception type: %s\n%s", type(e), e)
+            result, status = {"error": "internal error occurred"}, 500
+
+        await self.__respond(send, result, status, headers)
+
+    async def __lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def __reject(self, send: Send, error: str, status: int, wait: float) -> None:
+        await self.__respond(
+            send,
+            {"error": error},
+            status,
+            {"Retry-After": str(max(1, math.ceil(wait)))},
+        )
+
+    @staticmethod
+    async def __read_body(receive: Receive) -> bytes:
+        chunks: List[bytes] = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                return b"".join(chunks)
+
+    @staticmethod
+    async def __respond(
+        send: Send, payload: Any, status: int, headers: Optional[Dict[str, str]] = None
+    ) -> None:
+        body = payload if isinstance(payload, bytes) else dumps(payload).encode("utf-8")
+
+        # Handlers can override the content type through the headers
+        fields = {"content-type": "application/json"}
+        fields.update((key.lower(), value) for key, value in (headers or {}).items())
+        fields["content-length"] = str(len(body))
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (key.encode("latin-1"), value.encode("latin-1"))
+                    for key, value in fields.items()
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    async def remove_contact(self, payload: Dict[str, Any]) -> Response:
+        """
+        Handles DELETE Requests to delete an existing contact from the database.
+
+        Args:
+            payload: Dictionary containing the JSON body of the request
+
+        Returns:
+            Tuple containing the response payload and status code.
+        """
+
+        email = payload.get("email", None)
+        if not email:
+            # Throw an error if email field is not present, or empty
+            return {"error": "malformed request"}, 400
+
+        result = await self.__run(self.__database.remove_entry, email=email)
+        if result:
+            return {"result": "deleted contact successfully"}, 200
+        else:
+            return {"error": "internal error occurred"}, 500
+
+    async def add_contact(self, payload: Dict[str, Any]) -> Response:
+        """
+        Handles POST Requests to add a new contact to the database.
+
+        Args:
+            payload: Dictionary containing the JSON body of the request
+
+        Returns:
+            Tuple containing the response payload and status code.
+        """
+
+        contact = Contact(
+            name=payload.get("name", None),
+            email=payload.get("email", None),
+            phone_number=payload.get("phone", ""),
+        )
+
+        if not contact.email or not contact.name:
+            # Throw an error if either name or email are not present/empty
+            return {"error": "malformed request"}, 400
+
+        result = await self.__run(self.__database.add_entry, contact=contact)
+        if result:
+            return contact.encode(), 200
+        else:
+            return {"error": "failure occurred"}, 500
+
+    async def search_contact(self, payload: Dict[str, Any]) -> Response:
+        """
+        Search for a contact using their name, email id or phone number, supports
+        pagination. Setting `fuzzy` searches for similar names instead.
+
+        Args:
+            payload: Dictionary containing the JSON body of the request
+
+        Returns:
+            Tuple containing the response payload and status code.
+        """
+
+        name = payload.get("name", None)
+        email = payload.get("email", None)
+        phone = payload.get("phone", None)
+        prefix = payload.get("phone_prefix", False)
+
+        if not name and not email and not phone:
+            # Throw an error if name, email and phone number are absent
+            return {"error": "malformed request"}, 400
+
+        limit: Optional[int] = payload.get("limit", None)
+        if limit is not None and (
+            not isinstance(limit, int) or isinstance(limit, bool) or limit < 1
+        ):
+            return {"error": "malformed request"}, 400
+
+        fuzzy = payload.get("fuzzy", False)
+        if not isinstance(prefix, bool) or not isinstance(fuzzy, bool):
+            return {"error": "malformed request"}, 400
+
+        after = payload.get("after", None)
+        if any(
+            value is not None and not isinstance(value, str)
+            for value in (name, email, phone, after)
+        ):
+            return {"error": "malformed request"}, 400
+
+        if fuzzy:
+            if not name:
+                return {"error": "fuzzy searches need a name"}, 400
+
+            result = await self.__run(
+                self.__database.fuzzy_search,
+                name=name,
+                limit=limit or FUZZY_LIMIT,
+                raw=True,
+            )
+            if result is None:
+                return {"error": "fuzzy searches are not supported"}, 501
+
+            return dump_rows(result), 200
+
+        # Fetch an extra row to find out if there is a next page
+        result = await self.__run(
+            self.__database.search_entry,
+            name=name,
+            email=email,
+            limit=limit + 1 if limit is not None else None,
+            after=after,
+            raw=True,
+            phone=phone,
+            prefix=prefix,
+        )
+        if isinstance(result, list):
+            headers = {}
+            if limit is not None and len(result) > limit:
+                # Cursor to be passed as `after` to fetch the next page
+                headers["X-Next-After"] = result[limit - 1][0]
+
+            # Serialized straight from the rows, sent as-is
+            return dump_rows(result[:limit]), 200, headers
+        else:
+            return {"error": "internal error"}, 200
+
+    async def search_batch(self, payload: Dict[str, Any]) -> Response:
+        """
+        Looks up multiple contacts using their email in a single request.
+
+        Args:
+            payload: Dictionary containing the JSON body of the request
+
+        Returns:
+            Tuple containing the response payload and status code.
+        """
+
+        emails = read_batch(payload)
+        if emails is None:
+            return {"error": "malformed request"}, 400
+
+        result = await self.__run(self.__database.get_many, emails=emails, raw=True)
+        return dump_keyed_rows(result), 200
+
+    async def edit_contact(self, payload: Dict[str, Any]) -> Response:
+        """
+        Edit an existing contact.
+
+        Args:
+            payload: Dictionary containing the JSON body of the request
+
+        Returns:
+            Tuple containing the response payload and status code.
+        """
+
+        email = payload.get("email", None)
+        if not email:
+            return {"error": "malformed request"}, 400
+
+        contact = Contact(
+            name=payload.get("new_name", ""),
+            email=payload.get("new_email", ""),
+            phone_number=payload.get("new_phone", ""),
+        )
+
+        result = await self.__run(
+            self.__database.update_entry, email=email, update=contact
+        )
+        if result:
+            return {"result": "contact modified successfully"}, 200
+        else:
+            return {"error": "internal error"}, 500
+
+    async def export_metrics(self, payload: Dict[str, Any]) -> Response:
+        """
+        Exports the recorded metrics in the Prometheus text format.
+
+        Args:
+            payload: Dictionary containing the JSON body of the request, unused
+
+        Returns:
+            Tuple containing the response payload, status code and headers.
+        """
+
+        return (
+            self.__metrics.render().encode("utf-8"),
+            200,
+            {"Content-Type": "text/plain; version=0.0.4"},
+        )
+
+    def close(self) -> None:
+        """
+        Waits for pending database calls to complete, and closes the database.
+        """
+
+        self.__executor.shutdown(wait=True)
+        if self.__admission_executor is not None:
+            self.__admission_executor.shutdown(wait=True)
+
+        self.__database.close()
@@ -0,0 +1,86 @@
+"""
+Defines the compression applied to large responses. Brotli is used when installed (and
+accepted by the client), gzip otherwise.
+"""
+
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+# Responses smaller than this (in bytes) are sent as is, compressing them saves little
+DEFAULT_THRESHOLD = 1024
+
+# Compressors by content coding. Favours speed over ratio, responses are compressed on
+# every request.
+_COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {
+    "gzip": lambda body: gzip.compress(body, compresslevel=5),
+}
+if brotli is not None:  # pragma: no cover - depends on the environment
+    _COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=4)
+
+# Content codings in the order of preference
+ENCODINGS = tuple(encoding for encoding in ("br", "gzip") if encoding in _COMPRESSORS)
+
+
+def negotiate(accepted: Callable[[str], float]) -> Optional[str]:
+    """
+    Picks the content coding of a response.
+
+    Args:
+        accepted: Callable returning the quality the client assigned to a content
+            coding, zero if the coding is not acceptable
+
+    Returns:
+        The preferred content coding accepted by the client, None if the response
+        should not be compressed.
+    """
+
+    for encoding in ENCODINGS:
+        if accepted(encoding) > 0:
+            return encoding
+
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """
+    Compresses the body of a response.
+
+    Args:
+        body: The response body
+        encoding: Content coding to compress with, one of `ENCODINGS`
+
+    Returns:
+        The compressed body.
+    """
+
+    return _COMPRESSORS[encoding](body)
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 5) -> Iterator[bytes]:
+    """
+    Compresses a stream into the gzip format one chunk at a time, the stream is never
+    held in memory as a whole.
+
+    Args:
+        chunks: Iterable containing the chunks of the stream
+        level: Compression level, from 1 (fastest) to 9 (smallest)
+
+    Yields:
+        Chunks of the compressed stream, a valid gzip file once concatenated.
+    """
+
+    # A window size of 16 + 15 writes the gzip header and trailer
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+
+    yield compressor.flush()
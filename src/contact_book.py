@@ -1,10 +1,43 @@
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import csv
+import hashlib
+import hmac
 import logging as log
+import math
+import os
+import time
+from datetime import datetime, timezone
+from functools import partial
+from io import StringIO
+from json import JSONDecodeError, loads
 from os.path import join
 
-from flask import Flask, jsonify, request
-
-from .database import SQLite
-from .objects import Contact
+from flask import Flask, Response, g, jsonify, request
+
+from .asgi import AsyncContactBook, read_batch
+from .compression import (
+    DEFAULT_THRESHOLD,
+    ENCODINGS,
+    compress,
+    gzip_stream,
+    negotiate,
+)
+from .database import TenantDatabases, create_database
+from .database.base_db import BaseDB
+from .database.fuzzy import FUZZY_LIMIT
+from .database.tenants import TENANT_ID
+from .limits import AdmissionController, RateLimiter
+from .logger import configure_logging
+from .metrics import Metrics
+from .objects import (
+    Contact,
+    dump_keyed_rows,
+    dump_rows,
+    iter_changes,
+    iter_json_array,
+    iter_ndjson,
+)
 
 
 class ContactBook:
@@ -14,24 +47,99 @@ class ContactBook:
     """
 
     def __init__(
-        self, *, name: str = __name__, root_path: str, debug_mode: bool = False
+        self,
+        *,
+        name: str = __name__,
+        root_path: str,
+        debug_mode: bool = False,
+        db_options: Optional[Dict[str, Any]] = None,
+        metrics: bool = False,
+        log_options: Optional[Dict[str, Any]] = None,
+        etags: bool = True,
+        compression_threshold: Optional[int] = DEFAULT_THRESHOLD,
+        limit_options: Optional[Dict[str, Any]] = None,
+        tenant_options: Optional[Dict[str, Any]] = None,
+        admin_token: Optional[str] = None,
     ):
         """
         Args:
             name: The `__name__` variable obtained during execution
             root_path: String containing path to the root directory
             debug_mode: Boolean indicating debug mode
+            db_options: Dictionary containing optional keyword arguments to be passed
+                to the database, for example, the size of the connection pool. The
+                `backend` key picks the registered backend used, defaults to `sqlite`
+            metrics: Boolean indicating if request and database timings should be
+                recorded, and exposed through the `/metrics` endpoint
+            log_options: Dictionary containing optional keyword arguments to be passed
+                to `configure_logging`, for example, the size at which the log file
+                is rotated
+            etags: Boolean indicating if search results should carry an ETag, and
+                conditional searches answered without querying the database. Has no
+                effect if the database does not track its changes
+            compression_threshold: Size in bytes above which search results are
+                compressed (if accepted by the client), never compressed if None
+            limit_options: Dictionary containing the limits applied to requests -
+                `rate` (requests per second per client and route), `burst`, `routes`
+                (rates of specific routes), `max_in_flight` (requests working on the
+                database at a time), `max_queued` and `queue_timeout`. Requests are
+                not limited by default
+            tenant_options: Dictionary enabling tenants if present - every request
+                carries the id of its tenant in the `X-Tenant-ID` header, and is served
+                from the tenant's own database under `tenants/<id>` in the root
+                directory. Up to `max_open` databases are kept open, databases left
+                unused for `idle_timeout` seconds are closed
+            admin_token: Token exposing the admin endpoints (`/admin/backup` and
+                `/admin/snapshot`) if present, requests to them have to carry it in an
+                `Authorization: Bearer <token>` header. Not exposed if None
+
+        Raises:
+            ValueError: If tenants are enabled with a backend not storing its data in
+                the root directory
         """
 
         self.__debug_mode = debug_mode
-        self.__config_logger(
-            log_file=join(root_path, "logs.txt"), debug_mode=self.__debug_mode
+
+        # Do not write to log file in debug mode - enters an infinite loop.
+        configure_logging(
+            log_file=None if debug_mode else join(root_path, "logs.txt"),
+            debug_mode=debug_mode,
+            **(log_options or {}),
         )
 
         self.__app = Flask(import_name=name, template_folder="templates")
-        self.__database = SQLite(join(root_path, "contacts.db"))
+        self.__etags = etags
+        self.__compression_threshold = compression_threshold
+
+        # Part of every ETag - tags handed out by another instance (another worker, or
+        # before a restart) never match, their versions are unrelated.
+        self.__instance_tag = os.urandom(4).hex()
+        self.__metrics = Metrics(enabled=metrics)
+
+        db_options = {**(db_options or {}), "metrics": self.__metrics}
+        backend = db_options.pop("backend", "sqlite")
+
+        self.__shared_database: Optional[BaseDB] = None
+        self.__tenants: Optional[TenantDatabases] = None
+        if tenant_options is None:
+            self.__shared_database = create_database(backend, root_path, **db_options)
+        elif backend == "postgres":
+            raise ValueError("tenants are not supported by the `postgres` backend")
+        else:
+            tenants_path = join(root_path, "tenants")
 
-        log.debug(f'root directory: "{root_path}"')
+            def open_tenant(tenant: str) -> BaseDB:
+                tenant_path = join(tenants_path, tenant)
+                os.makedirs(tenant_path, exist_ok=True)
+                return create_database(backend, tenant_path, **db_options)
+
+            self.__tenants = TenantDatabases(
+                open_tenant,
+                max_open=tenant_options.get("max_open", 100),
+                idle_timeout=tenant_options.get("idle_timeout", None),
+            )
+
+        log.debug('root directory: "%s"', root_path)
 
         self.__app.add_url_rule("/post", view_func=self.add_contact, methods=["POST"])
         self.__app.add_url_rule(
@@ -40,44 +148,264 @@ class ContactBook:
         self.__app.add_url_rule(
             "/search", view_func=self.search_contact, methods=["GET"]
         )
+        self.__app.add_url_rule(
+            "/search/batch", view_func=self.search_batch, methods=["GET", "POST"]
+        )
         self.__app.add_url_rule(
             "/delete", view_func=self.remove_contact, methods=["DELETE"]
         )
+        self.__app.add_url_rule(
+            "/changes", view_func=self.export_changes, methods=["GET"]
+        )
+        self.__app.add_url_rule(
+            "/bulk", view_func=self.import_contacts, methods=["POST"]
+        )
+        self.__app.add_url_rule(
+            "/bulk", view_func=self.export_contacts, methods=["GET"]
+        )
+
+        self.__admin_token = admin_token
+        if admin_token:
+            # Checked before any other hook, unauthorized requests get no further
+            self.__app.before_request(self.__authorize_admin)
+
+            # Backups are kept in the root directory, never at a path sent by a client
+            self.__backup_path = join(root_path, "backups")
+            self.__app.add_url_rule(
+                "/admin/backup", view_func=self.backup_contacts, methods=["POST"]
+            )
+            self.__app.add_url_rule(
+                "/admin/snapshot", view_func=self.export_snapshot, methods=["GET"]
+            )
+
+        if metrics:
+            # Hooks are registered only when enabled, adding no overhead otherwise
+            self.__app.before_request(self.__start_timer)
+            self.__app.after_request(self.__record_request)
+            self.__metrics.add_collector(self.__collect_database_stats)
+            self.__app.add_url_rule(
+                "/metrics", view_func=self.export_metrics, methods=["GET"]
+            )
+
+        # Registered after the timer, rejected requests are recorded as well
+        limit_options = limit_options or {}
+        self.__rate_limiter: Optional[RateLimiter] = None
+
+        # Routes with a rate of zero are exempt, nothing is limited unless some rate is
+        rates = [
+            limit_options.get("rate", 0),
+            *limit_options.get("routes", {}).values(),
+        ]
+        if any(rate > 0 for rate in rates):
+            self.__rate_limiter = RateLimiter(
+                rate=limit_options.get("rate", 0),
+                burst=limit_options.get("burst", 10),
+                routes=limit_options.get("routes", None),
+            )
+
+        self.__admission: Optional[AdmissionController] = None
+        if limit_options.get("max_in_flight", 0) > 0:
+            self.__admission = AdmissionController(
+                max_in_flight=limit_options["max_in_flight"],
+                max_queued=limit_options.get("max_queued", 0),
+                timeout=limit_options.get("queue_timeout", 1.0),
+            )
+
+        if self.__rate_limiter is not None or self.__admission is not None:
+            self.__app.before_request(self.__admit)
+            self.__app.after_request(self.__defer_release)
+            self.__app.teardown_request(self.__release)
+            self.__metrics.add_collector(self.__collect_limit_stats)
+
+        # Registered after the limits, rejected requests do not open a database
+        if self.__tenants is not None:
+            self.__app.before_request(self.__acquire_tenant)
+            self.__app.after_request(self.__defer_tenant)
+            self.__app.teardown_request(self.__release_tenant)
+
+    @property
+    def __database(self) -> BaseDB:
+        # Leased to the request by `__acquire_tenant` when tenants are enabled
+        return self.__shared_database if self.__tenants is None else g.database
 
     @staticmethod
-    def __config_logger(log_file: str, debug_mode: bool) -> None:
+    def __start_timer() -> None:
+        g.request_start = time.perf_counter()
+
+    def __record_request(self, response: Response) -> Response:
         """
-        Configure the logger to log to log file as well as console, with special
-        formatting
+        Records the latency of the request, labelled with the matched route. Streamed
+        responses are timed till the first chunk is ready to be sent.
 
         Args:
-            log_file: String containing the name of text file to log to.
-            debug_mode: Boolean indicating if the log level is set to be debug or not
+            response: The response being returned
+
+        Returns:
+            The response, unchanged.
         """
 
-        if debug_mode:
-            log.getLogger().setLevel(log.DEBUG)
-        else:
-            log.getLogger().setLevel(log.INFO)
+        start = g.get("request_start", None)
+        if start is not None:
+            rule = request.url_rule.rule if request.url_rule else "unmatched"
+            self.__metrics.observe(
+                "request_seconds",
+                time.perf_counter() - start,
+                route=rule,
+                method=request.method,
+                status=str(response.status_code),
+            )
 
-        # Configure log formatter
-        logFormatter = log.Formatter(
-            "%(asctime)s [%(threadName)-12.12s] [%(levelname)-5.5s]  %(message)s"
-        )
+        return response
+
+    def __admit(self) -> Optional[Tuple[Response, int]]:
+        """
+        Applies the rate limit of the client and route, and waits for the request to
+        be admitted. The metrics endpoint is exempt from both.
+
+        Returns:
+            None if the request is to be served, an error response otherwise - 429 if
+            the client is rate limited, 503 if the server is overloaded. Both carry a
+            `Retry-After` header.
+        """
+
+        if request.endpoint == "export_metrics":
+            return None
+
+        if self.__rate_limiter is not None:
+            rule = request.url_rule.rule if request.url_rule else "unmatched"
+            wait = self.__rate_limiter.check(request.remote_addr or "", rule)
+            if wait > 0:
+                return self.__reject("too many requests", 429, wait)
+
+        if self.__admission is not None:
+            if not self.__admission.acquire():
+                return self.__reject(
+                    "server overloaded", 503, self.__admission.retry_after
+                )
 
-        rootLogger = log.getLogger()
+            g.admitted = True
 
-        if not debug_mode:
-            # Create a file handler, apply formatter and add it to the main logger.
-            # Do not write to log file in debug mode - enters an infinite loop.
-            fileHandler = log.FileHandler(log_file)
-            fileHandler.setFormatter(logFormatter)
-            rootLogger.addHandler(fileHandler)
+        return None
 
-        # Create a console handler, apply formatter and add it to the main logger.
-        consoleHandler = log.StreamHandler()
-        consoleHandler.setFormatter(logFormatter)
-        rootLogger.addHandler(consoleHandler)
+    def __defer_release(self, response: Response) -> Response:
+        """
+        Keeps a streamed response admitted till it is sent, the stream reads from the
+        database after the request is torn down.
+
+        Args:
+            response: The response being returned
+
+        Returns:
+            The response, releasing its slot once closed if streamed.
+        """
+
+        if response.is_streamed and g.pop("admitted", False):
+            response.call_on_close(self.__admission.release)
+
+        return response
+
+    def __release(self, exception: Optional[BaseException]) -> None:
+        if g.pop("admitted", False):
+            self.__admission.release()
+
+    def __authorize_admin(self) -> Optional[Tuple[Response, int]]:
+        """
+        Checks the token carried by requests to the admin endpoints.
+
+        Returns:
+            None if the request is not sent to an admin endpoint, or carries the admin
+            token - an error response (401) otherwise.
+        """
+
+        if request.endpoint not in ("backup_contacts", "export_snapshot"):
+            return None
+
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and hmac.compare_digest(
+            token.encode("utf-8"), self.__admin_token.encode("utf-8")
+        ):
+            return None
+
+        response = jsonify({"error": "unauthorized"})
+        response.headers["WWW-Authenticate"] = "Bearer"
+        return response, 401
+
+    @staticmethod
+    def __reject(error: str, status: int, wait: float) -> Tuple[Response, int]:
+        response = jsonify({"error": error})
+        response.headers["Retry-After"] = str(max(1, math.ceil(wait)))
+        return response, status
+
+    def __acquire_tenant(self) -> Optional[Tuple[Response, int]]:
+        """
+        Leases the database of the tenant the request is sent for. The metrics
+        endpoint serves no tenant.
+
+        Returns:
+            None if the request is to be served, an error response (400) if the tenant
+            id is missing or invalid.
+        """
+
+        if request.endpoint in (None, "export_metrics"):
+            return None
+
+        tenant = request.headers.get("X-Tenant-ID", "")
+        if not TENANT_ID.fullmatch(tenant):
+            return jsonify({"error": "missing or invalid tenant id"}), 400
+
+        g.database, g.database_serial = self.__tenants.acquire(tenant)
+        g.tenant = tenant
+        return None
+
+    def __defer_tenant(self, response: Response) -> Response:
+        """
+        Keeps the database of the tenant leased till a streamed response is sent, the
+        stream reads from the database after the request is torn down.
+
+        Args:
+            response: The response being returned
+
+        Returns:
+            The response, releasing the database once closed if streamed.
+        """
+
+        if response.is_streamed and "tenant" in g:
+            response.call_on_close(partial(self.__tenants.release, g.pop("tenant")))
+
+        return response
+
+    def __release_tenant(self, exception: Optional[BaseException]) -> None:
+        tenant = g.pop("tenant", None)
+        if tenant is not None:
+            self.__tenants.release(tenant)
+
+    def __collect_limit_stats(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        if self.__rate_limiter is not None:
+            for key, value in self.__rate_limiter.stats.items():
+                yield f"rate_limit_{key}", {}, value
+
+        if self.__admission is not None:
+            for key, value in self.__admission.stats.items():
+                yield f"admission_{key}", {}, value
+
+    def __collect_database_stats(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        if self.__tenants is not None:
+            for key, value in self.__tenants.stats.items():
+                yield f"tenants_{key}", {}, value
+
+            return
+
+        labels = {"database": self.__database.db_name}
+        for key, value in self.__database.stats().items():
+            yield f"db_{key}", labels, value
+
+    def export_metrics(self):
+        """
+        Handles GET Requests to export the recorded metrics in the Prometheus text
+        format.
+        """
+
+        return Response(self.__metrics.render(), mimetype="text/plain; version=0.0.4")
 
     def remove_contact(self):
         """
@@ -120,24 +448,242 @@ class ContactBook:
 
     def search_contact(self):
         """
-        Search for a contact using their name or email id
+        Search for a contact using their name, email id or phone number - phone
+        numbers are matched by their prefix if `phone_prefix` is set. Supports keyset
+        pagination through the `limit` and `after` fields, and streaming the results
+        (either as a JSON array, or newline delimited JSON) using the `stream` field.
+
+        Setting `fuzzy` searches for names similar to `name` instead, tolerating typos
+        - the `limit` most similar contacts are returned, most similar first.
         """
 
         name = request.json.get("name", None)
         email = request.json.get("email", None)
+        phone = request.json.get("phone", None)
+        prefix = request.json.get("phone_prefix", False)
 
-        if not name and not email:
-            # Throw an error if both name and email are absent
+        if not name and not email and not phone:
+            # Throw an error if name, email and phone number are absent
             return jsonify({"error": "malformed request"}), 400
 
-        result = self.__database.search_entry(email=email, name=name)
+        fuzzy = request.json.get("fuzzy", False)
+        if not isinstance(prefix, bool) or not isinstance(fuzzy, bool):
+            return jsonify({"error": "malformed request"}), 400
+
+        after = request.json.get("after", None)
+        if any(
+            value is not None and not isinstance(value, str)
+            for value in (name, email, phone, after)
+        ):
+            return jsonify({"error": "malformed request"}), 400
+
+        if fuzzy and not name:
+            return jsonify({"error": "fuzzy searches need a name"}), 400
+
+        limit = request.json.get("limit", None)
+        stream = request.json.get("stream", None)
+
+        if limit is not None and (
+            not isinstance(limit, int) or isinstance(limit, bool) or limit < 1
+        ):
+            return jsonify({"error": "malformed request"}), 400
+
+        if stream and not fuzzy:
+            return self.__stream_search(
+                name=name, email=email, phone=phone, prefix=prefix, fmt=stream
+            )
+
+        etag = self.__search_etag(
+            name=name,
+            email=email,
+            limit=limit,
+            after=after,
+            phone=phone,
+            prefix=prefix,
+            fuzzy=fuzzy,
+        )
+        if etag is not None:
+            # Any representation of the unchanged result is still valid
+            for tag in (etag, *(f"{etag}-{encoding}" for encoding in ENCODINGS)):
+                if request.if_none_match.contains_weak(tag):
+                    response = Response(status=304)
+                    response.set_etag(tag)
+                    return response
+
+        if fuzzy:
+            return self.__fuzzy_search(name=name, limit=limit, etag=etag)
+
+        # Fetch an extra row to find out if there is a next page
+        result = self.__database.search_entry(
+            email=email,
+            name=name,
+            limit=limit + 1 if limit is not None else None,
+            after=after,
+            raw=True,
+            phone=phone,
+            prefix=prefix,
+        )
         if isinstance(result, list):
             # Checking for type of `result` to ensure that a blank search result doesn't
-            # enter the `else` block
-            return jsonify([res.encode() for res in result]), 200
+            # enter the `else` block. Rows are serialized directly, no `Contact` is
+            # created for them.
+            with self.__metrics.timer(
+                "db_seconds", operation="search_entry", phase="serialize"
+            ):
+                body = dump_rows(result[:limit])
+
+            response = self.__compressed(body, etag)
+            if limit is not None and len(result) > limit:
+                # Cursor to be passed as `after` to fetch the next page
+                response.headers["X-Next-After"] = result[limit - 1][0]
+
+            return response, 200
         else:
             return jsonify({"error": "internal error"}), 200
 
+    def __search_etag(
+        self,
+        name: Any,
+        email: Any,
+        limit: Optional[int],
+        after: Any,
+        phone: Any = None,
+        prefix: bool = False,
+        fuzzy: bool = False,
+    ) -> Optional[str]:
+        """
+        Forms the entity tag of a search result, from the version of the database and
+        the parameters of the search. Has to be formed before running the search, the
+        result can only be newer than the version it is tagged with.
+
+        Args:
+            name: Name being searched for
+            email: Email being searched for
+            limit: Maximum number of results requested
+            after: Email of the last contact from the previous page
+            phone: Phone number being searched for
+            prefix: Boolean indicating if the phone number is a prefix
+            fuzzy: Boolean indicating if the search is a fuzzy search
+
+        Returns:
+            String containing the entity tag, None if ETags are disabled or the
+            database does not track its changes.
+        """
+
+        version = self.__database.version if self.__etags else None
+        if version is None:
+            return None
+
+        # Databases of tenants count their versions separately, and start over when
+        # opened again - the number they were opened under tells them apart
+        instance = self.__instance_tag
+        if self.__tenants is not None:
+            instance = f"{instance}.{g.database_serial}"
+
+        search = repr((name, email, limit, after, phone, prefix, fuzzy))
+        digest = hashlib.blake2b(search.encode("utf-8"), digest_size=8).hexdigest()
+        return f"{instance}-{version}-{digest}"
+
+    def __fuzzy_search(self, name: str, limit: Optional[int], etag: Optional[str]):
+        """
+        Runs a fuzzy search, see `search_contact`.
+
+        Args:
+            name: Name to search for similar names to
+            limit: Maximum number of results requested, `FUZZY_LIMIT` if absent
+            etag: Entity tag of the result
+
+        Returns:
+            Tuple containing the response and status code.
+        """
+
+        result = self.__database.fuzzy_search(
+            name=name, limit=limit or FUZZY_LIMIT, raw=True
+        )
+        if result is None:
+            return jsonify({"error": "fuzzy searches are not supported"}), 501
+
+        with self.__metrics.timer(
+            "db_seconds", operation="fuzzy_search", phase="serialize"
+        ):
+            body = dump_rows(result)
+
+        return self.__compressed(body, etag), 200
+
+    def __compressed(self, body: bytes, etag: Optional[str]) -> Response:
+        """
+        Builds a JSON response, compressed if large enough and accepted by the client.
+
+        Args:
+            body: UTF-8 encoded JSON body
+            etag: Entity tag of the uncompressed body, compressed bodies are tagged
+                with their content coding appended
+
+        Returns:
+            The response.
+        """
+
+        response = Response(body, mimetype="application/json")
+        if self.__compression_threshold is not None:
+            response.vary.add("Accept-Encoding")
+
+            encoding = negotiate(request.accept_encodings.quality)
+            if encoding is not None and len(body) >= self.__compression_threshold:
+                response.set_data(compress(body, encoding))
+                response.content_encoding = encoding
+                etag = None if etag is None else f"{etag}-{encoding}"
+
+        if etag is not None:
+            response.set_etag(etag)
+
+        return response
+
+    def search_batch(self):
+        """
+        Looks up multiple contacts using their email in a single request, the response
+        maps every email to its contact (or null, if not found).
+        """
+
+        emails = read_batch(request.json)
+        if emails is None:
+            return jsonify({"error": "malformed request"}), 400
+
+        result = self.__database.get_many(emails, raw=True)
+        with self.__metrics.timer(
+            "db_seconds", operation="get_many", phase="serialize"
+        ):
+            body = dump_keyed_rows(result)
+
+        return Response(body, mimetype="application/json"), 200
+
+    def __stream_search(
+        self, name: str, email: str, phone: Any, prefix: bool, fmt: Any
+    ):
+        """
+        Streams the results of a search as a chunked response, the results are read
+        from the database one page at a time.
+
+        Args:
+            name: String containing name of the contact to search for
+            email: String containing email of the contact to search for
+            phone: Phone number of the contact to search for
+            prefix: Boolean indicating if the phone number is a prefix
+            fmt: Format of the response, either `ndjson`, or `json` (any other truthy
+                value) for a JSON array
+
+        Returns:
+            A streaming response.
+        """
+
+        rows = self.__database.search_entries(
+            name=name, email=email, raw=True, phone=phone, prefix=prefix
+        )
+
+        if fmt == "ndjson":
+            return Response(iter_ndjson(rows), mimetype="application/x-ndjson")
+
+        return Response(iter_json_array(rows), mimetype="application/json")
+
     def edit_contact(self):
         """
         Edit an existing contact
@@ -159,9 +705,263 @@ class ContactBook:
         else:
             return jsonify({"error": "internal error"}), 500
 
-    def run(self) -> None:
+    @staticmethod
+    def __bulk_format() -> str:
+        """
+        Figures out the format used for bulk import/export, the `format` query
+        parameter takes priority over the content type of the request.
+
+        Returns:
+            String containing the format, either `csv` or `ndjson`
+        """
+
+        fmt = request.args.get("format", None)
+        if fmt:
+            return fmt.lower()
+
+        return "csv" if request.mimetype == "text/csv" else "ndjson"
+
+    @staticmethod
+    def __read_rows(fmt: str) -> Iterator[Contact]:
+        """
+        Lazily parses the body of the request, one row at a time.
+
+        Args:
+            fmt: String containing the format of the request body
+
+        Yields:
+            A contact for every row in the request body, rows that can not be parsed
+            result in a contact with empty fields.
+        """
+
+        lines = (line.decode("utf-8") for line in request.stream)
+
+        if fmt == "csv":
+            for row in csv.DictReader(lines):
+                yield Contact(
+                    name=row.get("name", None),
+                    email=row.get("email", None),
+                    phone_number=row.get("phone", None) or "",
+                )
+
+            return
+
+        for line in lines:
+            if not line.strip():
+                continue
+
+            try:
+                row = loads(line)
+                yield Contact(
+                    name=row.get("name", None),
+                    email=row.get("email", None),
+                    phone_number=row.get("phone", ""),
+                )
+            except (JSONDecodeError, AttributeError):
+                yield Contact(name="", email="", phone_number="")
+
+    def import_contacts(self):
+        """
+        Handles POST Requests to add contacts in bulk. The request body is streamed in
+        either as newline delimited JSON, or CSV with a header row containing `name`,
+        `email` and `phone` columns.
+        """
+
+        fmt = self.__bulk_format()
+        if fmt not in ("csv", "ndjson"):
+            return jsonify({"error": "unsupported format"}), 400
+
+        total = 0
+
+        def rows() -> Iterator[Contact]:
+            nonlocal total
+            for contact in self.__read_rows(fmt):
+                total += 1
+                yield contact
+
+        failures = self.__database.add_entries(rows())
+        if failures is False:
+            return jsonify({"error": "internal error occurred"}), 500
+
+        return (
+            jsonify(
+                {
+                    "added": total - len(failures),
+                    "failed": len(failures),
+                    # Row numbers are one-based, header row (if any) is not counted
+                    "errors": [
+                        {"row": index + 1, "error": reason}
+                        for index, reason in failures
+                    ],
+                }
+            ),
+            200,
+        )
+
+    def export_contacts(self):
+        """
+        Handles GET Requests to export all contacts, streamed as either newline
+        delimited JSON or CSV.
+        """
+
+        fmt = self.__bulk_format()
+        contacts = self.__database.export_entries()
+
+        if fmt == "ndjson":
+            rows = (contact.to_row() for contact in contacts)
+            return Response(iter_ndjson(rows), mimetype="application/x-ndjson")
+        elif fmt == "csv":
+
+            def rows() -> Iterator[str]:
+                buffer = StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(("name", "email", "phone"))
+                for contact in contacts:
+                    yield buffer.getvalue()
+
+                    buffer.seek(0)
+                    buffer.truncate()
+                    writer.writerow((contact.name, contact.email, contact.phone_number))
+
+                yield buffer.getvalue()
+
+            return Response(rows(), mimetype="text/csv")
+        else:
+            return jsonify({"error": "unsupported format"}), 400
+
+    def export_changes(self):
+        """
+        Handles GET Requests to stream the changes made after the sequence number in
+        the `since` query parameter as newline delimited JSON, in order. Responds with
+        410 if those changes are no longer retained - the consumer has to start over
+        from a full export.
+        """
+
+        since = request.args.get("since", "0")
+        if not since.isdigit():
+            return jsonify({"error": "malformed request"}), 400
+
+        try:
+            changes = self.__database.changes(since=int(since))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 410
+
+        if changes is None:
+            return jsonify({"error": "changes are not tracked by the database"}), 501
+
+        return Response(iter_changes(changes), mimetype="application/x-ndjson")
+
+    def backup_contacts(self):
+        """
+        Handles POST Requests to back up the database while it keeps serving requests.
+        The copy is written to the `backups` directory under the root directory, named
+        after the time of the backup (prefixed with the tenant id, if enabled).
+        """
+
+        name = datetime.now(timezone.utc).strftime("contacts-%Y%m%dT%H%M%S%fZ.db")
+        if self.__tenants is not None:
+            name = f"{g.tenant}-{name}"
+
+        os.makedirs(self.__backup_path, exist_ok=True)
+        pages = self.__database.backup(join(self.__backup_path, name))
+        if pages is None:
+            return jsonify({"error": "backups are not supported by the database"}), 501
+
+        return jsonify({"backup": name, "pages": pages}), 200
+
+    def export_snapshot(self):
+        """
+        Handles GET Requests to export all contacts as of a single point in time, as
+        gzip compressed newline delimited JSON. The snapshot is streamed, compressed
+        one chunk at a time.
+        """
+
+        rows = self.__database.snapshot_entries()
+        if rows is None:
+            return (
+                jsonify({"error": "snapshots are not supported by the database"}),
+                501,
+            )
+
+        response = Response(gzip_stream(iter_ndjson(rows)), mimetype="application/gzip")
+        response.headers["Content-Disposition"] = (
+            'attachment; filename="contacts.ndjson.gz"'
+        )
+        return response
+
+    def close(self) -> None:
+        """
+        Closes the database, or the open databases of all tenants.
+        """
+
+        if self.__tenants is not None:
+            self.__tenants.close()
+        else:
+            self.__shared_database.close()
+
+    def run(self, host: Optional[str] = None, port: Optional[int] = None) -> None:
         """
         Runs the flask server.
+
+        Args:
+            host: String containing the address to bind to, defaults to localhost
+            port: Port to listen on, defaults to 5000
+        """
+
+        self.__app.run(host=host, port=port, debug=self.__debug_mode)
+
+    def asgi(self, max_workers: int = 5) -> AsyncContactBook:
+        """
+        Creates an ASGI application serving the core endpoints (`/post`, `/update`,
+        `/search` and `/delete`) from the same database.
+
+        Args:
+            max_workers: Maximum number of database calls running at a time
+
+        Returns:
+            The ASGI application.
+
+        Raises:
+            ValueError: If tenants are enabled, the ASGI application serves a single
+                database
         """
 
-        self.__app.run(debug=self.__debug_mode)
+        if self.__tenants is not None:
+            raise ValueError("tenants are not supported by the ASGI server")
+
+        return AsyncContactBook(
+            self.__database,
+            max_workers=max_workers,
+            metrics=self.__metrics,
+            rate_limiter=self.__rate_limiter,
+            admission=self.__admission,
+        )
+
+    def run_async(
+        self, host: str = "127.0.0.1", port: int = 5000, max_workers: int = 5
+    ) -> None:
+        """
+        Runs the ASGI application using uvicorn. Requires uvicorn to be installed.
+
+        Args:
+            host: String containing the address to bind to
+            port: Port to listen on
+            max_workers: Maximum number of database calls running at a time
+        """
+
+        import uvicorn
+
+        uvicorn.run(
+            self.asgi(max_workers=max_workers),
+            host=host,
+            port=port,
+            log_level="debug" if self.__debug_mode else "info",
+        )
+
+    @property
+    def app(self) -> Flask:
+        return self.__app
+
+    @property
+    def metrics(self) -> Metrics:
+        return self.__metrics
@@ -4,4 +4,10 @@ Designed following the open-close principle, allows to decouple the rest of the
 application from the database.
 """
 
+from .memory_db import InMemoryDB
+from .pool import ConnectionPool
+from .postgres_db import PostgreSQL
+from .registry import backends, create_database, register_backend
+from .sharded_db import ShardedSQLite
 from .sqlite_db import SQLite
+from .tenants import TenantDatabases
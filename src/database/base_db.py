@@ -3,12 +3,14 @@ Defines the an abstract database class - meant to be used as the base class from
 all databases should inherit.
 """
 
-from typing import Any, Optional, Union
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import logging as logger
 from abc import ABC, abstractmethod
 
-from ..objects import Contact
+from ..metrics import NULL_METRICS, Metrics
+from ..objects import Change, Contact, Row
+from .fuzzy import FUZZY_LIMIT
 
 
 class BaseDB(ABC):
@@ -22,6 +24,9 @@ class BaseDB(ABC):
             Property to get the internal name for the database. Can be used in log
             messages and stuff.
 
+        metrics: Metrics
+            Property to get the registry the database reports its timings to.
+
     Methods:
     --------
         execute_query(any, any)
@@ -31,6 +36,9 @@ class BaseDB(ABC):
         add_entry(any, any)
             Add a new entry to the database
 
+        add_entries(any, any)
+            Add multiple entries to the database in one go
+
         remove_entry(any, any)
             Remove an entry from the database
 
@@ -40,19 +48,48 @@ class BaseDB(ABC):
         search_entry(any, any)
             Search for an existing entry in the database
 
+        search_entries(any, any)
+            Stream entries matching a search from the database
+
+        fuzzy_search(str, int) -> Optional[List[Any]]
+            Search for entries with a name similar to a name, ranked by similarity
+
+        get_many(Iterable[str], bool) -> Dict[str, Any]
+            Look up multiple entries by their email in one go
+
+        export_entries(any, any)
+            Iterate over all entries present in the database
+
+        changes(int) -> Optional[Iterator[Change]]
+            Stream the changes made after a sequence number, in order
+
+        backup(str) -> Optional[int]
+            Copy the database to a file while it keeps serving requests
+
+        snapshot_entries() -> Optional[Iterator[Row]]
+            Stream all entries as of a single point in time
+
+        stats() -> Dict[str, float]
+            Internal statistics of the database, exported as metrics
+
+        version: Optional[int]
+            Property to get the change version of the contacts, bumped by every write
+
         close()
             Closes the connection to the database
     """
 
-    def __init__(self, db_name: str):
+    def __init__(self, db_name: str, metrics: Optional[Metrics] = None):
         """
         Args:
             db_name: String containing a friendly name for the database, used for
                 logging and similar purposes.
+            metrics: Registry to report timings to, nothing is recorded if absent
         """
 
         self.__db_instance = db_name
-        logger.debug(f"Initializing an instance of database `{self.__db_instance}`")
+        self.__metrics = metrics or NULL_METRICS
+        logger.debug("Initializing an instance of database `%s`", self.__db_instance)
 
     @abstractmethod
     def execute_query(self, query: str, *args: Any, **kwargs: Any) -> Any:
@@ -88,6 +125,32 @@ class BaseDB(ABC):
 
         pass
 
+    def add_entries(
+        self, contacts: Iterable[Contact], *args: Any, **kwargs: Any
+    ) -> Union[List[Tuple[int, str]], bool]:
+        """
+        Add multiple entries to the database. The default implementation adds the
+        entries one at a time, databases capable of batching writes should override
+        this.
+
+        Args:
+            contacts: Iterable containing the contacts to be added, will be consumed
+                lazily
+            *args: List of parameters to be added
+            **kwargs: Named input parameters to be added to the database
+
+        Returns:
+            List of tuples containing the (zero-based) position of every contact that
+            could not be added along with the reason, false if the operation fails.
+        """
+
+        failures: List[Tuple[int, str]] = []
+        for index, contact in enumerate(contacts):
+            if not self.add_entry(contact):
+                failures.append((index, "failed to add contact"))
+
+        return failures
+
     @abstractmethod
     def remove_entry(self, email: str, *args: Any, **kwargs: Any) -> Union[bool, int]:
         """
@@ -127,7 +190,16 @@ class BaseDB(ABC):
 
     @abstractmethod
     def search_entry(
-        self, name: str, email: str, *args: Any, **kwargs: Any
+        self,
+        name: str,
+        email: str,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        raw: bool = False,
+        phone: Optional[str] = "",
+        prefix: bool = False,
+        *args: Any,
+        **kwargs: Any,
     ) -> Optional[Any]:
         """
         Search for existing entries in database.
@@ -135,6 +207,15 @@ class BaseDB(ABC):
         Args:
             name: String containing name of the contact to search for
             email: String containing email of the contact to search for
+            limit: Maximum number of entries to be returned, used for pagination
+            after: Email of the last entry in the previous page, only entries with a
+                greater email are returned. Paginated results are ordered by email
+            raw: Boolean indicating if the entries should be returned as rows (tuples
+                of email, name and phone number) instead of instances of `Contact`
+            phone: String containing the phone number of the contact to search for,
+                phone numbers are compared after being normalized (`normalize_phone`)
+            prefix: Boolean indicating if contacts with a phone number starting with
+                `phone` should be returned, instead of an exact match
             *args: List of parameters to be added
             **kwargs: Named input parameters to be added to the database
 
@@ -144,6 +225,202 @@ class BaseDB(ABC):
 
         pass
 
+    def search_entries(
+        self,
+        name: str,
+        email: str,
+        raw: bool = False,
+        phone: Optional[str] = "",
+        prefix: bool = False,
+        *args: Any,
+        **kwargs: Any,
+    ) -> Iterator[Any]:
+        """
+        Streaming variant of `search_entry`, yields matching entries one at a time
+        instead of building the complete result in the memory. The default
+        implementation falls back to `search_entry`.
+
+        Args:
+            name: String containing name of the contact to search for
+            email: String containing email of the contact to search for
+            raw: Boolean indicating if the entries should be yielded as rows instead
+                of instances of `Contact`
+            phone: String containing the phone number of the contact to search for
+            prefix: Boolean indicating if the phone number is a prefix
+            *args: List of parameters to be added
+            **kwargs: Named input parameters to be added to the database
+
+        Yields:
+            Entries matching the search, ordered by their email.
+        """
+
+        result = (
+            self.search_entry(
+                name=name, email=email, raw=True, phone=phone, prefix=prefix
+            )
+            or []
+        )
+        for row in sorted(result):
+            yield row if raw else Contact.from_row(row)
+
+    def fuzzy_search(
+        self,
+        name: str,
+        limit: int = FUZZY_LIMIT,
+        raw: bool = False,
+        *args: Any,
+        **kwargs: Any,
+    ) -> Optional[List[Any]]:
+        """
+        Typo-tolerant search for entries by their name, the entries are ranked by the
+        similarity of their name to the name searched for - see `fuzzy.rank`. The
+        default implementation does not support fuzzy searches.
+
+        Args:
+            name: String containing the name of the contact to search for
+            limit: Maximum number of entries to be returned
+            raw: Boolean indicating if the entries should be returned as rows instead
+                of instances of `Contact`
+            *args: List of parameters to be added
+            **kwargs: Named input parameters to be added to the database
+
+        Returns:
+            List of the most similar entries, most similar first. None if the
+            database does not support fuzzy searches.
+        """
+
+        return None
+
+    def get_many(
+        self, emails: Iterable[str], raw: bool = False, *args: Any, **kwargs: Any
+    ) -> Dict[str, Optional[Any]]:
+        """
+        Looks up multiple entries using their email. The default implementation runs
+        a search for every email, databases capable of fetching multiple entries in
+        a single query should override this.
+
+        Args:
+            emails: Iterable containing the emails to look up
+            raw: Boolean indicating if the entries should be returned as rows instead
+                of instances of `Contact`
+            *args: List of parameters to be added
+            **kwargs: Named input parameters to be added to the database
+
+        Returns:
+            Dictionary mapping every (distinct) email to its entry, None for emails
+            that were not found.
+        """
+
+        result: Dict[str, Optional[Any]] = {}
+        for email in emails:
+            if email in result:
+                continue
+
+            rows = self.search_entry(name="", email=email, raw=raw) or []
+            result[email] = rows[0] if rows else None
+
+        return result
+
+    @abstractmethod
+    def export_entries(self, *args: Any, **kwargs: Any) -> Iterator[Contact]:
+        """
+        Iterate over all entries present in the database, without loading all of them
+        into the memory at once.
+
+        Args:
+            *args: List of parameters to be added
+            **kwargs: Named input parameters to be added to the database
+
+        Yields:
+            Contacts present in the database, ordered by their email.
+        """
+
+        pass
+
+    def changes(
+        self, since: int = 0, *args: Any, **kwargs: Any
+    ) -> Optional[Iterator[Change]]:
+        """
+        Streams the changes made to the database after the change numbered `since`,
+        ordered by their sequence number. Consumers keep the sequence number of the
+        last change seen, and pass it back to fetch the changes made since. The
+        default implementation does not keep a change log.
+
+        Args:
+            since: Sequence number of the last change seen, zero to fetch all changes
+            *args: List of parameters to be added
+            **kwargs: Named input parameters to be added to the database
+
+        Returns:
+            Iterator over the changes, None if the database does not keep a change log.
+
+        Raises:
+            ValueError: If changes made after `since` are no longer retained, the
+                consumer has to start over from a full export
+        """
+
+        return None
+
+    def backup(self, target: str, *args: Any, **kwargs: Any) -> Optional[int]:
+        """
+        Copies the database to a file without stopping reads or writes in the
+        meantime. The default implementation does not support backups.
+
+        Args:
+            target: String containing full path to the copy, replaced if present
+            *args: List of parameters to be added
+            **kwargs: Named input parameters to be added to the database
+
+        Returns:
+            The number of pages copied, None if the database does not support backups.
+        """
+
+        return None
+
+    def snapshot_entries(self, *args: Any, **kwargs: Any) -> Optional[Iterator[Row]]:
+        """
+        Streams all entries as of a single point in time, ordered by email - writes
+        made while the entries are being read are left out, unlike `export_entries`.
+        The default implementation can not take snapshots.
+
+        Args:
+            *args: List of parameters to be added
+            **kwargs: Named input parameters to be added to the database
+
+        Returns:
+            Iterator over the rows of all entries, None if the database can not take
+            snapshots.
+        """
+
+        return None
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Internal statistics of the database (cache hits, open connections, etc),
+        reported as gauges by the `/metrics` endpoint. The default implementation has
+        nothing to report.
+
+        Returns:
+            Dictionary mapping the name of every statistic to its current value.
+        """
+
+        return {}
+
+    @property
+    def version(self) -> Optional[int]:
+        """
+        Change version of the contacts, bumped by every write made through this
+        instance - two reads seeing the same version saw the same contacts. Used to
+        answer conditional requests without querying the database.
+
+        Returns:
+            The current version, None if the database can not track its changes (for
+            example, if other servers write to it). The default implementation does
+            not track changes.
+        """
+
+        return None
+
     @abstractmethod
     def close(self) -> None:
         """
@@ -155,3 +432,7 @@ class BaseDB(ABC):
     @property
     def db_name(self):
         return self.__db_instance
+
+    @property
+    def metrics(self) -> Metrics:
+        return self.__metrics
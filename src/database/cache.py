@@ -0,0 +1,222 @@
+"""
+Defines the cache used to hold search results in the memory. Unlike a plain TTL cache,
+entries are evicted as soon as a write to the database could have changed them,
+allowing results to be cached for long periods without serving stale data.
+"""
+
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+from threading import Lock
+
+from cachetools import TTLCache
+
+from ..objects import Row
+
+# Key used to store search results - the name and email being searched for, followed
+# by any other parameters of the search (pagination, etc)
+SearchKey = Tuple[str, str, Hashable, Hashable]
+
+
+class _CountingTTLCache(TTLCache):
+    """
+    TTL cache that keeps a count of entries evicted to make room for new ones.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.evictions = 0
+
+    def popitem(self) -> Tuple[Any, Any]:
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+    def clear(self) -> None:
+        # `clear` drops items through `popitem`, these should not count as evictions
+        evictions = self.evictions
+        super().clear()
+        self.evictions = evictions
+
+
+class SearchCache:
+    """
+    Thread-safe cache for search results, owned by a single database instance.
+
+    Entries hold the rows returned by searches, along with the emails in them. A write
+    invalidates the entries that searched for an affected email, hold an affected
+    contact, or searched for a name that an added/modified contact now matches - every
+    other entry is left untouched.
+
+    Attributes:
+    -----------
+        stats: Dict[str, int]
+            Counters for hits, misses, evictions (to make room for new entries) and
+            invalidations (entries dropped due to writes), along with the current size
+
+    Methods:
+    --------
+        get(SearchKey) -> Tuple[Optional[List[Row]], int]
+            Looks up a search result, returns the result along with a version to be
+            passed back to `put`
+
+        put(SearchKey, List[Row], int)
+            Stores a search result
+
+        invalidate(Iterable[str], Iterable[str])
+            Drops entries affected by a write to the given emails/names, and bumps
+            the version
+
+        version: int
+            Number of writes (invalidations or clears) seen so far
+
+        clear()
+            Drops all entries
+    """
+
+    def __init__(
+        self, maxsize: int = 100, ttl: float = 300, cache_negative: bool = True
+    ):
+        """
+        Args:
+            maxsize: Maximum number of search results held in the cache, use zero to
+                disable caching
+            ttl: Number of seconds a search result is held for
+            cache_negative: Boolean indicating if searches with no results should be
+                cached as well
+        """
+
+        self.__enabled = maxsize > 0
+        self.__cache = _CountingTTLCache(maxsize=max(maxsize, 1), ttl=ttl)
+        self.__cache_negative = cache_negative
+        self.__lock = Lock()
+
+        # Bumped on every write, results computed before a write are not stored.
+        self.__version = 0
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__invalidations = 0
+
+    def get(self, key: SearchKey) -> Tuple[Optional[List[Row]], int]:
+        """
+        Looks up a search result in the cache.
+
+        Args:
+            key: Key identifying the search
+
+        Returns:
+            Tuple containing the cached result (None for a miss), and the version of
+            the cache that should be passed to `put` after computing the result.
+        """
+
+        with self.__lock:
+            entry = self.__cache.get(key, None)
+            if entry is None:
+                self.__misses += 1
+                return None, self.__version
+
+            self.__hits += 1
+            return entry[0], self.__version
+
+    def put(self, key: SearchKey, result: List[Row], version: int) -> None:
+        """
+        Stores a search result. Ignored if the database was written to after the
+        result was computed, since the result might be stale.
+
+        Args:
+            key: Key identifying the search
+            result: List of rows found by the search
+            version: Version of the cache returned by `get` before the search
+        """
+
+        if not self.__enabled or (not result and not self.__cache_negative):
+            return
+
+        emails: FrozenSet[str] = frozenset(row[0] for row in result)
+        with self.__lock:
+            if version == self.__version:
+                self.__cache[key] = (result, emails)
+
+    @staticmethod
+    def __matches(pattern: str, names: List[str]) -> bool:
+        """
+        Checks if a name search could match any of the given names.
+
+        Args:
+            pattern: Lower-cased name being searched for
+            names: List of lower-cased names
+
+        Returns:
+            Boolean indicating if the search could match any of the names. Patterns
+            containing wildcards are assumed to match everything.
+        """
+
+        if "%" in pattern or "_" in pattern:
+            return True
+
+        return any(pattern in name for name in names)
+
+    def invalidate(self, emails: Iterable[str], names: Iterable[str] = ()) -> None:
+        """
+        Drops every search result that could have been changed by a write.
+
+        Args:
+            emails: Emails of the contacts that have been added, modified or removed -
+                including both the old and the new email for modified contacts
+            names: Names of contacts that have been added or modified
+        """
+
+        emails = {email for email in emails if email}
+        names = [name.lower() for name in names if name]
+
+        with self.__lock:
+            self.__version += 1
+
+            for key in list(self.__cache.keys()):
+                entry = self.__cache.get(key, None)
+                if entry is None:
+                    continue
+
+                name, email = key[0], key[1]
+                if (
+                    (email and email in emails)
+                    or not emails.isdisjoint(entry[1])
+                    or (name and names and self.__matches(name.lower(), names))
+                ):
+                    self.__cache.pop(key, None)
+                    self.__invalidations += 1
+
+    def clear(self) -> None:
+        """
+        Drops all entries from the cache, used when a write affects too many contacts
+        to be worth invalidating individually.
+        """
+
+        with self.__lock:
+            self.__version += 1
+            self.__invalidations += len(self.__cache)
+            self.__cache.clear()
+
+    @property
+    def version(self) -> int:
+        return self.__version
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self.__lock:
+            return {
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "evictions": self.__cache.evictions,
+                "invalidations": self.__invalidations,
+                "size": len(self.__cache),
+            }
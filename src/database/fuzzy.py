@@ -0,0 +1,151 @@
+"""
+Defines the ranking of typo-tolerant (fuzzy) name searches. Every database retrieves
+candidates from its own trigram index, the candidates are ranked here by the trigrams
+they share with the name searched for - results are ranked alike across databases.
+"""
+
+from typing import (
+    Collection,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+import heapq
+
+from ..objects import Row
+
+# Number of results returned by a fuzzy search, unless limited otherwise
+FUZZY_LIMIT = 10
+
+# Minimum similarity (between zero and one) of a name to a fuzzy search to be returned
+FUZZY_THRESHOLD = 0.3
+
+# Trigrams present in more names than this are too common to tell names apart, their
+# postings are not read in full - candidates are retrieved through the rarer trigrams
+MAX_POSTINGS = 500
+
+# Number of seconds a term (trigram, or piece of a name) found to be common is
+# remembered for, its postings are not read in the meantime
+COMMON_TERMS_TTL = 600.0
+
+# Number of candidates ranked for every result requested
+CANDIDATES_PER_RESULT = 10
+
+
+def name_grams(name: str) -> Set[str]:
+    """
+    Splits a name into its (lowercase) trigrams. The name is padded with a space on
+    either side, the first and last letters weigh as much as the rest - and names
+    shorter than a trigram still have one.
+
+    Args:
+        name: The name to be split
+
+    Returns:
+        Set of trigrams of the name.
+    """
+
+    padded = f" {' '.join(name.lower().split())} "
+    return {padded[index : index + 3] for index in range(len(padded) - 2)}
+
+
+def name_pieces(name: str, count: int = 3) -> List[str]:
+    """
+    Splits a name into up to `count` contiguous pieces, of at least a trigram each. A
+    name with fewer typos than pieces has (at least) one piece spelled right - names
+    containing a piece are candidates, even when all of its trigrams are common.
+
+    Args:
+        name: The (lowercase) name to be split
+        count: Maximum number of pieces
+
+    Returns:
+        List of pieces of the name, empty if shorter than a trigram.
+    """
+
+    count = min(count, len(name) // 3)
+    if not count:
+        return []
+
+    bounds = [len(name) * index // count for index in range(count + 1)]
+    return [name[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def similarity(grams: Set[str], name: str) -> float:
+    """
+    Similarity of a name to a search, as the share of trigrams present in both among
+    the trigrams present in either. Names are compared as a whole, and word by word -
+    searching for a first name ranks full names starting with it high.
+
+    Args:
+        grams: Trigrams of the name searched for, see `name_grams`
+        name: The name to be compared
+
+    Returns:
+        Float between zero (nothing in common) and one (identical).
+    """
+
+    words = name.split()
+    best = 0.0
+    for part in [name, *words] if len(words) > 1 else [name]:
+        other = name_grams(part)
+        union = len(grams | other)
+        if union:
+            best = max(best, len(grams & other) / union)
+
+    return best
+
+
+def pick_candidates(
+    postings: Sequence[Tuple[Collection[Hashable], bool]], count: int
+) -> List[Hashable]:
+    """
+    Picks the contacts sharing the most trigrams with a search, trigrams held by fewer
+    contacts weigh more.
+
+    Args:
+        postings: List of tuples containing the contacts holding every trigram of the
+            search, and whether the list was cut short at `MAX_POSTINGS`. Lists cut
+            short are left out, unless every list was
+        count: Maximum number of candidates to be picked
+
+    Returns:
+        List of contacts (as identified in the postings), best candidates first.
+    """
+
+    selective = [posting for posting, truncated in postings if not truncated]
+    scores: Dict[Hashable, float] = {}
+    for posting in selective or [posting for posting, _ in postings]:
+        weight = 1 / len(posting) if posting else 0.0
+        for contact in posting:
+            scores[contact] = scores.get(contact, 0.0) + weight
+
+    return heapq.nlargest(count, scores, key=scores.__getitem__)
+
+
+def rank(name: str, rows: Iterable[Row], limit: int, threshold: float) -> List[Row]:
+    """
+    Ranks the candidates of a fuzzy search.
+
+    Args:
+        name: The name searched for
+        rows: Rows of the candidates, in any order
+        limit: Maximum number of rows to be returned
+        threshold: Minimum similarity of a row to be returned
+
+    Returns:
+        The most similar rows, ordered by their similarity (then by email).
+    """
+
+    grams = name_grams(name)
+    scored = [(similarity(grams, row[1]), row) for row in rows]
+    return [
+        row
+        for score, row in sorted(scored, key=lambda item: (-item[0], item[1][0]))
+        if score >= threshold
+    ][:limit]
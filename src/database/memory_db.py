@@ -0,0 +1,546 @@
+"""
+Defines a database holding all contacts in the memory, indexed by email, phone number
+and name. Changes are persisted to an append-only log, periodically compacted into a
+snapshot - restarting only has to load the snapshot and replay the (short) log.
+"""
+
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+import json
+import logging as log
+import os
+import re
+from bisect import bisect_left, insort
+from threading import RLock
+
+from ..metrics import ROW_BUCKETS, Metrics
+from ..objects import Contact, Row, normalize_phone
+from .base_db import BaseDB
+from .fuzzy import (
+    CANDIDATES_PER_RESULT,
+    FUZZY_LIMIT,
+    FUZZY_THRESHOLD,
+    MAX_POSTINGS,
+    pick_candidates,
+    rank,
+)
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[index : index + 3] for index in range(len(text) - 2)}
+
+
+class InMemoryDB(BaseDB):
+    """
+    Database keeping every contact in the memory. Lookups by email and phone number
+    are served by hash indexes, substring searches over names by a trigram index -
+    mirroring the behaviour of the `SQLite` database, including its constraints.
+
+    Every write is appended to a log file as it happens, once the log grows past
+    `snapshot_interval` entries all contacts are written to a fresh snapshot, and the
+    log is truncated.
+
+    Attributes:
+    -----------
+        size: int
+            Number of contacts held in the database
+    """
+
+    def __init__(
+        self,
+        data_dir: Optional[str] = None,
+        snapshot_interval: int = 10000,
+        fsync: bool = False,
+        metrics: Optional[Metrics] = None,
+    ):
+        """
+        Args:
+            data_dir: String containing full path to the directory holding the
+                snapshot and the log. Nothing is persisted if absent
+            snapshot_interval: Number of entries the log is allowed to grow to before
+                being compacted into a snapshot
+            fsync: Boolean indicating if the log should be flushed to the disk after
+                every write, instead of leaving it to the operating system
+            metrics: Registry to report timings to, nothing is recorded if absent
+        """
+
+        super().__init__(db_name="InMemory", metrics=metrics)
+        self.metrics.register_histogram("db_rows", ROW_BUCKETS)
+
+        self.__lock = RLock()
+
+        # Primary index, email -> row
+        self.__rows: Dict[str, Row] = {}
+
+        # Unique index over phone numbers, phone number -> email
+        self.__phones: Dict[str, str] = {}
+
+        # Normalized phone numbers, normalized phone number -> emails of the contacts
+        self.__phone_keys: Dict[str, Set[str]] = {}
+
+        # Keys of `__phone_keys` in sorted order, numbers sharing a prefix are adjacent.
+        # Sorted once after loading, rather than inserting every number in order.
+        self.__sorted_phone_keys: List[str] = []
+        self.__loading = False
+
+        # Trigrams of (lowercase) names, trigram -> emails of the contacts
+        self.__trigrams: Dict[str, Set[str]] = {}
+
+        # Bumped by every write
+        self.__version = 0
+
+        self.__snapshot_interval = snapshot_interval
+        self.__fsync = fsync
+        self.__log_entries = 0
+        self.__log_file: Any = None
+
+        self.__snapshot_path: Optional[str] = None
+        self.__log_path: Optional[str] = None
+        if data_dir is not None:
+            os.makedirs(data_dir, exist_ok=True)
+            self.__snapshot_path = os.path.join(data_dir, "contacts.snapshot")
+            self.__log_path = os.path.join(data_dir, "contacts.log")
+            self.__load()
+
+    def __index(self, row: Row) -> None:
+        email, name, phone = row
+        self.__rows[email] = row
+        self.__phones[phone] = email
+        phone_key = normalize_phone(phone)
+        emails = self.__phone_keys.get(phone_key, None)
+        if emails is None:
+            emails = self.__phone_keys[phone_key] = set()
+            if not self.__loading:
+                insort(self.__sorted_phone_keys, phone_key)
+
+        emails.add(email)
+        for trigram in _trigrams(name.lower()):
+            self.__trigrams.setdefault(trigram, set()).add(email)
+
+    def __unindex(self, email: str) -> Optional[Row]:
+        row = self.__rows.pop(email, None)
+        if row is None:
+            return None
+
+        if self.__phones.get(row[2], None) == email:
+            del self.__phones[row[2]]
+
+        phone_key = normalize_phone(row[2])
+        emails = self.__phone_keys.get(phone_key, None)
+        if emails is not None:
+            emails.discard(email)
+            if not emails:
+                del self.__phone_keys[phone_key]
+                if not self.__loading:
+                    keys = self.__sorted_phone_keys
+                    del keys[bisect_left(keys, phone_key)]
+
+        for trigram in _trigrams(row[1].lower()):
+            emails = self.__trigrams.get(trigram, None)
+            if emails is not None:
+                emails.discard(email)
+                if not emails:
+                    del self.__trigrams[trigram]
+
+        return row
+
+    def __load(self) -> None:
+        """
+        Loads the snapshot, and replays the log on top of it. A partially written
+        entry at the end of the log (left behind by a crash) is ignored.
+        """
+
+        self.__loading = True
+        if os.path.exists(self.__snapshot_path):
+            with open(self.__snapshot_path, encoding="utf-8") as file:
+                for line in file:
+                    self.__index(tuple(json.loads(line)))
+
+        if os.path.exists(self.__log_path):
+            with open(self.__log_path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        log.warning("ignoring a partially written entry in the log")
+                        break
+
+                    # Entries hold the final state of a contact, replaying them is
+                    # idempotent - the log can safely overlap with the snapshot.
+                    if entry[0] == "put":
+                        self.__unindex(entry[1])
+                        self.__index(tuple(entry[1:]))
+                    else:
+                        self.__unindex(entry[1])
+
+                    self.__log_entries += 1
+
+        self.__loading = False
+        self.__sorted_phone_keys = sorted(self.__phone_keys)
+        log.info("loaded %d contacts into the memory", len(self.__rows))
+
+        # Start from a compacted state, the log is opened in the process
+        self.__compact()
+
+    def __append(self, entries: List[List[str]]) -> None:
+        """
+        Appends entries to the log, compacting the log into a snapshot when it grows
+        too large, and bumps the version. Called for every write, has to be called
+        with the lock held.
+
+        Args:
+            entries: List of entries, either `["put", email, name, phone]` or
+                `["del", email]`
+        """
+
+        self.__version += 1
+        if self.__log_file is None:
+            return
+
+        self.__log_file.write(
+            "".join(
+                json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries
+            )
+        )
+        self.__log_file.flush()
+        if self.__fsync:
+            os.fsync(self.__log_file.fileno())
+
+        self.__log_entries += len(entries)
+        if self.__log_entries >= self.__snapshot_interval:
+            self.__compact()
+
+    def __compact(self) -> None:
+        """
+        Writes all contacts to a new snapshot, and truncates the log. The snapshot is
+        replaced atomically, a crash at any point leaves either the old snapshot along
+        with the complete log, or the new snapshot. Has to be called with the lock held.
+        """
+
+        if self.__snapshot_path is None:
+            return
+
+        temp_path = f"{self.__snapshot_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            for row in self.__rows.values():
+                file.write(json.dumps(row, separators=(",", ":")) + "\n")
+
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temp_path, self.__snapshot_path)
+
+        if self.__log_file is not None:
+            self.__log_file.close()
+
+        self.__log_file = open(self.__log_path, "w", encoding="utf-8")
+        self.__log_entries = 0
+        log.debug("compacted %d contacts into a snapshot", len(self.__rows))
+
+    def __insert(self, contact: Contact) -> Optional[str]:
+        """
+        Adds a contact to the indexes, without logging it. Has to be called with the
+        lock held.
+
+        Args:
+            contact: The contact to be added
+
+        Returns:
+            None if the contact was added, the reason it could not be added otherwise.
+        """
+
+        if not contact.email or not contact.name or contact.phone_number is None:
+            return "missing name or email"
+
+        if contact.email in self.__rows:
+            return "UNIQUE constraint failed: contacts.email"
+
+        if contact.phone_number in self.__phones:
+            return "UNIQUE constraint failed: contacts.contact_number"
+
+        self.__index(contact.to_row())
+        return None
+
+    def execute_query(self, query: str, *args: Any, **kwargs: Any) -> None:
+        log.warning("`%s` does not support raw queries", self.db_name)
+        return None
+
+    def add_entry(self, contact: Contact, *args: Any, **kwargs: Any) -> bool:
+        with self.__lock:
+            reason = self.__insert(contact)
+            if reason is not None:
+                log.warning("failed to add contact: %s", reason)
+                return False
+
+            self.__append([["put", *contact.to_row()]])
+            return True
+
+    def add_entries(
+        self, contacts: Iterable[Contact], *args: Any, **kwargs: Any
+    ) -> List[Tuple[int, str]]:
+        failures: List[Tuple[int, str]] = []
+        entries: List[List[str]] = []
+
+        with self.__lock:
+            for index, contact in enumerate(contacts):
+                reason = self.__insert(contact)
+                if reason is not None:
+                    failures.append((index, reason))
+                else:
+                    entries.append(["put", *contact.to_row()])
+
+            self.__append(entries)
+
+        return failures
+
+    def remove_entry(self, email: str, *args: Any, **kwargs: Any) -> int:
+        with self.__lock:
+            if self.__unindex(email) is None:
+                return 0
+
+            self.__append([["del", email]])
+            return 1
+
+    def update_entry(
+        self, email: str, update: Contact, *args: Any, **kwargs: Any
+    ) -> Union[int, bool]:
+        with self.__lock:
+            row = self.__rows.get(email, None)
+            if row is None:
+                return 0
+
+            new_row = (
+                update.email or row[0],
+                update.name or row[1],
+                update.phone_number or row[2],
+            )
+
+            # Same constraints as the `SQLite` database, a conflicting update fails
+            owner = self.__phones.get(new_row[2], email)
+            if (new_row[0] != email and new_row[0] in self.__rows) or owner != email:
+                log.warning("failed to update contact, conflicts with another contact")
+                return False
+
+            self.__unindex(email)
+            self.__index(new_row)
+
+            entries = [["put", *new_row]]
+            if new_row[0] != email:
+                entries.insert(0, ["del", email])
+
+            self.__append(entries)
+            return 1
+
+    @staticmethod
+    def __name_matcher(name: str) -> Callable[[str], bool]:
+        """
+        Builds a case-insensitive matcher equivalent to `like %name%`, treating `%`
+        and `_` in the name as wildcards.
+        """
+
+        name = name.lower()
+        if "%" not in name and "_" not in name:
+            return lambda value: name in value.lower()
+
+        pattern = "".join(
+            ".*" if char == "%" else "." if char == "_" else re.escape(char)
+            for char in name
+        )
+        regex = re.compile(pattern, re.DOTALL)
+        return lambda value: regex.search(value.lower()) is not None
+
+    def __candidates(self, name: str) -> Iterable[str]:
+        """
+        Narrows down the contacts that can match a name using the trigram index,
+        candidates still need to be matched against the name.
+        """
+
+        trigrams = [_trigrams(part) for part in re.split(r"[%_]", name.lower()) if part]
+        trigrams = [grams for grams in trigrams if grams]
+        if not trigrams:
+            # Too short to make use of the index
+            return list(self.__rows)
+
+        postings = sorted(
+            (self.__trigrams.get(gram, set()) for grams in trigrams for gram in grams),
+            key=len,
+        )
+        return postings[0].intersection(*postings[1:])
+
+    @staticmethod
+    def __phone_matcher(phone: str, prefix: bool) -> Callable[[str], bool]:
+        """
+        Builds a matcher comparing phone numbers after normalizing them, either
+        exactly or by their prefix.
+        """
+
+        key = normalize_phone(phone)
+        if not key:
+            return lambda value: False
+
+        if prefix:
+            return lambda value: normalize_phone(value).startswith(key)
+
+        return lambda value: normalize_phone(value) == key
+
+    def __phone_candidates(self, phone: str, prefix: bool) -> Iterable[str]:
+        """
+        Finds the contacts with a matching phone number using the index of normalized
+        phone numbers. Prefixes are matched by bisecting the sorted numbers, numbers
+        starting with the prefix follow it.
+        """
+
+        key = normalize_phone(phone)
+        if not key:
+            return []
+
+        if not prefix:
+            return list(self.__phone_keys.get(key, ()))
+
+        candidates = []
+        keys = self.__sorted_phone_keys
+        for index in range(bisect_left(keys, key), len(keys)):
+            if not keys[index].startswith(key):
+                break
+
+            candidates.extend(self.__phone_keys[keys[index]])
+
+        return candidates
+
+    def search_entry(
+        self,
+        name: Optional[str] = "",
+        email: Optional[str] = "",
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        raw: bool = False,
+        phone: Optional[str] = "",
+        prefix: bool = False,
+        *args: Any,
+        **kwargs: Any,
+    ) -> Optional[Any]:
+        if not name and not email and not phone:
+            return None
+
+        with self.__lock:
+            if email:
+                row = self.__rows.get(email, None)
+                rows = [row] if row is not None else []
+            elif phone:
+                rows = [
+                    self.__rows[candidate]
+                    for candidate in self.__phone_candidates(phone, prefix)
+                ]
+            else:
+                rows = [self.__rows[candidate] for candidate in self.__candidates(name)]
+
+            if name:
+                matches = self.__name_matcher(name)
+                rows = [row for row in rows if matches(row[1])]
+
+            if phone:
+                matches = self.__phone_matcher(phone, prefix)
+                rows = [row for row in rows if matches(row[2])]
+
+        # Results are always ordered by email
+        rows.sort()
+        if after:
+            rows = [row for row in rows if row[0] > after]
+
+        if limit is not None:
+            rows = rows[:limit]
+
+        self.metrics.observe("db_rows", len(rows), operation="search_entry")
+        return rows if raw else [Contact.from_row(row) for row in rows]
+
+    def fuzzy_search(
+        self,
+        name: str,
+        limit: int = FUZZY_LIMIT,
+        raw: bool = False,
+        threshold: float = FUZZY_THRESHOLD,
+        *args: Any,
+        **kwargs: Any,
+    ) -> Optional[List[Any]]:
+        if not name:
+            return None
+
+        count = limit * CANDIDATES_PER_RESULT
+        grams = _trigrams(name.lower())
+
+        with self.__lock:
+            if grams:
+                candidates = pick_candidates(
+                    [
+                        (emails, len(emails) > MAX_POSTINGS)
+                        for emails in (
+                            self.__trigrams.get(gram, set()) for gram in grams
+                        )
+                    ],
+                    count,
+                )
+            else:
+                # Too short to make use of the index, ranks names containing it
+                matches = self.__name_matcher(name)
+                candidates = [
+                    email for email, row in self.__rows.items() if matches(row[1])
+                ]
+
+            rows = [self.__rows[email] for email in candidates]
+
+        rows = rank(name, rows, limit, threshold)
+        self.metrics.observe("db_rows", len(rows), operation="fuzzy_search")
+        return rows if raw else [Contact.from_row(row) for row in rows]
+
+    def get_many(
+        self, emails: Iterable[str], raw: bool = False, *args: Any, **kwargs: Any
+    ) -> Dict[str, Optional[Any]]:
+        with self.__lock:
+            result = {email: self.__rows.get(email, None) for email in emails}
+
+        if raw:
+            return result
+
+        return {
+            email: Contact.from_row(row) if row is not None else None
+            for email, row in result.items()
+        }
+
+    def export_entries(self, *args: Any, **kwargs: Any) -> Iterator[Contact]:
+        with self.__lock:
+            emails = sorted(self.__rows)
+
+        for email in emails:
+            row = self.__rows.get(email, None)
+            if row is not None:
+                yield Contact.from_row(row)
+
+    def stats(self) -> Dict[str, float]:
+        return {"contacts": len(self.__rows), "log_entries": self.__log_entries}
+
+    def close(self) -> None:
+        with self.__lock:
+            if self.__log_file is not None:
+                # Leave a compacted snapshot behind, the next start is faster
+                self.__compact()
+                self.__log_file.close()
+                self.__log_file = None
+
+    @property
+    def version(self) -> Optional[int]:
+        return self.__version
+
+    @property
+    def size(self) -> int:
+        return len(self.__rows)
@@ -0,0 +1,229 @@
+"""
+Defines a bounded, thread-safe pool of SQLite connections. Allows the database classes
+to reuse open connections instead of paying the cost of opening a connection (and
+parsing the schema) on every request.
+"""
+
+from typing import Callable, Iterator, Optional
+
+import logging as log
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+from sqlite3 import Connection, Error, ProgrammingError, connect
+from threading import Lock
+
+
+class ConnectionPool:
+    """
+    A bounded pool of SQLite connections. Connections are checked out by a single
+    thread at a time and returned to the pool once the thread is done with them, as
+    such, a connection is never shared between two threads concurrently.
+
+    Attributes:
+    -----------
+        size: int
+            Maximum number of connections that can be open at any given time
+
+        open_connections: int
+            Number of connections currently opened by the pool, including the ones
+            that have been checked out
+
+    Methods:
+    --------
+        connection() -> ContextManager[Connection]
+            Context manager to check out a connection, returns the connection to the
+            pool on exit
+
+        acquire() -> Connection
+            Check out a connection from the pool, blocks if the pool is exhausted
+
+        release(Connection)
+            Return a connection back to the pool
+
+        close()
+            Closes all connections held by the pool
+    """
+
+    def __init__(
+        self,
+        db_file: str,
+        size: int = 5,
+        timeout: float = 10.0,
+        factory: Optional[Callable[[str], Connection]] = None,
+    ):
+        """
+        Args:
+            db_file: String containing full path to the database file
+            size: Maximum number of connections the pool is allowed to open
+            timeout: Number of seconds to wait for a connection to be released when
+                the pool is exhausted
+            factory: Optional callable that accepts the path to the database file and
+                returns a new connection. Defaults to a plain `sqlite3.connect`
+
+        Raises:
+            ValueError: If the size of the pool is not a positive integer
+        """
+
+        if size < 1:
+            raise ValueError(f"invalid pool size: {size}")
+
+        self.__db_file = db_file
+        self.__size = size
+        self.__timeout = timeout
+        self.__factory = factory or self.__connect
+
+        # Idle connections - LIFO keeps the most recently used connections (warm page
+        # cache, compiled statements) at the top of the stack.
+        self.__idle: "LifoQueue[Connection]" = LifoQueue(maxsize=size)
+
+        self.__lock = Lock()
+        self.__opened = 0
+        self.__closed = False
+
+    @staticmethod
+    def __connect(db_file: str) -> Connection:
+        # Connections are handed over between threads, the pool guarantees that only
+        # one thread uses a connection at a time.
+        return connect(db_file, check_same_thread=False)
+
+    @staticmethod
+    def __is_healthy(connection: Connection) -> bool:
+        """
+        Checks if a connection is still usable.
+
+        Args:
+            connection: The connection to be checked
+
+        Returns:
+            Boolean indicating if the connection can be used.
+        """
+
+        try:
+            connection.execute("select 1").fetchone()
+            return True
+        except Error:
+            return False
+
+    def __discard(self, connection: Connection) -> None:
+        """
+        Closes a connection and frees up its slot in the pool.
+
+        Args:
+            connection: The connection to be discarded
+        """
+
+        with self.__lock:
+            self.__opened -= 1
+
+        try:
+            connection.close()
+        except Error:
+            pass
+
+    def acquire(self) -> Connection:
+        """
+        Checks out a connection from the pool. An idle connection is reused if
+        available, a new connection is opened if the pool has not reached its size
+        limit, otherwise the call blocks till a connection is released.
+
+        Returns:
+            An open connection to the database.
+
+        Raises:
+            ProgrammingError: If the pool has been closed
+            TimeoutError: If no connection was released within the timeout
+        """
+
+        while True:
+            if self.__closed:
+                raise ProgrammingError("cannot operate on a closed connection pool")
+
+            try:
+                connection = self.__idle.get_nowait()
+            except Empty:
+                with self.__lock:
+                    can_open = self.__opened < self.__size
+                    if can_open:
+                        self.__opened += 1
+
+                if can_open:
+                    try:
+                        return self.__factory(self.__db_file)
+                    except Exception:
+                        with self.__lock:
+                            self.__opened -= 1
+                        raise
+
+                try:
+                    connection = self.__idle.get(timeout=self.__timeout)
+                except Empty:
+                    raise TimeoutError(
+                        f"no connection released within {self.__timeout} seconds"
+                    )
+
+            if self.__is_healthy(connection):
+                return connection
+
+            log.warning("discarding unhealthy connection from the pool")
+            self.__discard(connection)
+
+    def release(self, connection: Connection) -> None:
+        """
+        Returns a connection back to the pool. Any pending transaction is rolled back
+        so that the next user of the connection starts with a clean state.
+
+        Args:
+            connection: The connection to be returned
+        """
+
+        if self.__closed:
+            self.__discard(connection)
+            return
+
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except Error:
+            self.__discard(connection)
+            return
+
+        self.__idle.put_nowait(connection)
+
+    @contextmanager
+    def connection(self) -> Iterator[Connection]:
+        """
+        Context manager to check out a connection, the connection is returned to the
+        pool once the block exits.
+
+        Yields:
+            An open connection to the database.
+        """
+
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close(self) -> None:
+        """
+        Closes the pool, along with all idle connections. Connections that are checked
+        out at the moment will be closed once they are released.
+        """
+
+        self.__closed = True
+        while True:
+            try:
+                connection = self.__idle.get_nowait()
+            except Empty:
+                break
+
+            self.__discard(connection)
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    @property
+    def open_connections(self) -> int:
+        return self.__opened
@@ -0,0 +1,86 @@
+"""
+Defines the registry of database backends. The backend used by the application is
+picked by name (through the config file), new backends become available by
+registering a factory for them - nothing else in the application has to change.
+"""
+
+from typing import Any, Callable, Dict, List
+
+from os.path import join
+
+from .base_db import BaseDB
+from .memory_db import InMemoryDB
+from .postgres_db import PostgreSQL
+from .sharded_db import ShardedSQLite
+from .sqlite_db import SQLite
+
+# Creates a database, accepts the path to the root directory followed by the options
+# of the backend as keyword arguments.
+BackendFactory = Callable[..., BaseDB]
+
+_BACKENDS: Dict[str, BackendFactory] = {}
+
+
+def register_backend(name: str, factory: BackendFactory) -> None:
+    """
+    Makes a backend available under a name, replacing any backend registered under
+    the same name.
+
+    Args:
+        name: String containing the name of the backend, as used in the config file
+        factory: Callable accepting the path to the root directory along with the
+            options of the backend as keyword arguments, and returning the database
+    """
+
+    _BACKENDS[name.lower()] = factory
+
+
+def backends() -> List[str]:
+    """
+    Returns:
+        List containing the names of all registered backends.
+    """
+
+    return sorted(_BACKENDS)
+
+
+def create_database(backend: str, root_path: str, **options: Any) -> BaseDB:
+    """
+    Creates a database using a registered backend.
+
+    Args:
+        backend: String containing the name of the backend
+        root_path: String containing path to the root directory, backends storing
+            data locally keep their files here
+        **options: Keyword arguments passed on to the backend
+
+    Returns:
+        The new database.
+
+    Raises:
+        ValueError: If no backend is registered under the name
+    """
+
+    factory = _BACKENDS.get(backend.lower(), None)
+    if factory is None:
+        raise ValueError(
+            f"unknown database backend `{backend}`, "
+            f"expected one of: {', '.join(backends())}"
+        )
+
+    return factory(root_path, **options)
+
+
+register_backend(
+    "sqlite",
+    lambda root_path, **options: SQLite(join(root_path, "contacts.db"), **options),
+)
+register_backend(
+    "memory",
+    lambda root_path, **options: InMemoryDB(join(root_path, "contacts"), **options),
+)
+register_backend("postgres", lambda root_path, **options: PostgreSQL(**options))
+register_backend(
+    "sharded",
+    lambda root_path, **options: ShardedSQLite(join(root_path, "shards"), **options),
+)
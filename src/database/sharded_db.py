@@ -0,0 +1,416 @@
+"""
+Defines a database partitioning contacts across multiple SQLite files by the hash of
+their email, allowing writes to different shards to proceed in parallel. Phone numbers
+are kept unique across all shards through a global index.
+"""
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+import heapq
+import logging as log
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+from sqlite3 import Connection, IntegrityError, connect
+from zlib import crc32
+
+from ..metrics import Metrics
+from ..objects import Contact, Row
+from .base_db import BaseDB
+from .fuzzy import FUZZY_LIMIT, FUZZY_THRESHOLD, rank
+from .pool import ConnectionPool
+from .sqlite_db import SQLite
+
+# Number of seconds after which a reservation not backed by a contact can be reclaimed
+STALE_AFTER = 60.0
+
+
+class ShardedSQLite(BaseDB):
+    """
+    Database spreading contacts over `shards` SQLite files. Operations on a single
+    contact (adding, removing, updating it, or searching by email) are routed to the
+    shard owning its email, searches by name are run on all shards in parallel - the
+    results are merged, ordered by email.
+
+    Every phone number in use is recorded in a separate index mapping it to the email
+    of its contact, a phone number is reserved in the index before a contact is
+    written to its shard. Reservations left behind by a failure between the two steps
+    are reclaimed once found to be stale, and older than `STALE_AFTER` seconds - a
+    reservation is never taken away from a write still in progress.
+
+    Remarks:
+        The number of shards can not be changed once contacts have been added, the
+        shard owning an email depends on it.
+
+    Attributes:
+    -----------
+        shards: int
+            Number of shards
+    """
+
+    def __init__(
+        self,
+        data_dir: str,
+        shards: int = 4,
+        max_workers: Optional[int] = None,
+        metrics: Optional[Metrics] = None,
+        **options: Any,
+    ):
+        """
+        Args:
+            data_dir: String containing full path to the directory holding the shards
+                and the phone index. Will be created if does not exist
+            shards: Number of shards to partition contacts across
+            max_workers: Maximum number of shards searched at a time, defaults to the
+                number of shards
+            metrics: Registry to report timings to, nothing is recorded if absent
+            **options: Keyword arguments passed on to every shard (see `SQLite`)
+
+        Raises:
+            ValueError: If the number of shards is not a positive integer
+        """
+
+        super().__init__(db_name="ShardedSQLite", metrics=metrics)
+
+        if shards < 1:
+            raise ValueError(f"invalid number of shards: {shards}")
+
+        os.makedirs(data_dir, exist_ok=True)
+        self.__shards = [
+            SQLite(
+                os.path.join(data_dir, f"shard-{index}.db"), metrics=metrics, **options
+            )
+            for index in range(shards)
+        ]
+
+        self.__executor = ThreadPoolExecutor(
+            max_workers=max_workers or shards, thread_name_prefix="shard-search"
+        )
+
+        # Global index of phone numbers, phone number -> email. Partitioned by the hash
+        # of the number, every number still belongs to exactly one partition - the
+        # index does not become a single writer shared by all shards.
+        self.__phones = [
+            ConnectionPool(
+                os.path.join(data_dir, f"phones-{index}.db"),
+                size=options.get("pool_size", 5),
+                timeout=options.get("pool_timeout", 10.0),
+                factory=self.__connect,
+            )
+            for index in range(shards)
+        ]
+        for pool in self.__phones:
+            with pool.connection() as connection:
+                connection.execute("""
+                        create table if not exists "phones" (
+                            "contact_number" text primary key,
+                            "email" text not null,
+                            "reserved_at" real not null
+                        )
+                    """)
+                connection.commit()
+
+    @staticmethod
+    def __connect(db_file: str) -> Connection:
+        connection = connect(db_file, check_same_thread=False)
+        connection.execute("pragma journal_mode=wal")
+        connection.execute("pragma synchronous=normal")
+        connection.execute("pragma busy_timeout=5000")
+        return connection
+
+    def __shard_index(self, email: str) -> int:
+        # A stable hash, the shard owning an email has to be the same for every process
+        return crc32(email.encode("utf-8")) % len(self.__shards)
+
+    def __shard(self, email: str) -> SQLite:
+        return self.__shards[self.__shard_index(email)]
+
+    def __phone_index(self, phone: str) -> ConnectionPool:
+        return self.__phones[crc32(phone.encode("utf-8")) % len(self.__phones)]
+
+    def __find(self, email: str) -> Optional[Row]:
+        rows = self.__shard(email).search_entry(email=email, raw=True)
+        return rows[0] if rows else None
+
+    def __reserve(self, phone: str, email: str) -> bool:
+        """
+        Reserves a phone number for a contact in the global index.
+
+        Args:
+            phone: String containing the phone number
+            email: String containing the email of the contact the number belongs to
+
+        Returns:
+            Boolean indicating if the number was reserved, false if the number belongs
+            to another contact.
+        """
+
+        with self.__phone_index(phone).connection() as connection:
+            try:
+                connection.execute(
+                    'insert into "phones" values (?, ?, ?)', (phone, email, time.time())
+                )
+                connection.commit()
+                return True
+            except IntegrityError:
+                connection.rollback()
+
+            (owner,) = connection.execute(
+                'select "email" from "phones" where "contact_number"=?', (phone,)
+            ).fetchone()
+
+        if owner == email:
+            return True
+
+        row = self.__find(owner)
+        if row is not None and row[2] == phone:
+            return False
+
+        # Stale reservation - the owner does not exist, or uses another number now
+        with self.__phone_index(phone).connection() as connection:
+            cursor = connection.execute(
+                'update "phones" set "email"=?, "reserved_at"=? '
+                'where "contact_number"=? and "email"=? and "reserved_at"<?',
+                (email, time.time(), phone, owner, time.time() - STALE_AFTER),
+            )
+            connection.commit()
+            return cursor.rowcount == 1
+
+    def __reassign(self, phone: str, email: str, new_email: str) -> None:
+        with self.__phone_index(phone).connection() as connection:
+            connection.execute(
+                'update "phones" set "email"=?, "reserved_at"=? '
+                'where "contact_number"=? and "email"=?',
+                (new_email, time.time(), phone, email),
+            )
+            connection.commit()
+
+    def __release(self, phone: str, email: str) -> None:
+        with self.__phone_index(phone).connection() as connection:
+            connection.execute(
+                'delete from "phones" where "contact_number"=? and "email"=?',
+                (phone, email),
+            )
+            connection.commit()
+
+    def execute_query(self, query: str, *args: Any, **kwargs: Any) -> None:
+        # Applied to every shard, the phone index is left alone
+        for shard in self.__shards:
+            shard.execute_query(query, *args, **kwargs)
+
+    def add_entry(self, contact: Contact, *args: Any, **kwargs: Any) -> bool:
+        if not contact.email or contact.phone_number is None:
+            return False
+
+        if not self.__reserve(contact.phone_number, contact.email):
+            log.warning("failed to add contact, phone number is in use")
+            return False
+
+        if self.__shard(contact.email).add_entry(contact):
+            return True
+
+        # Do not release a number that belonged to this email before the call
+        row = self.__find(contact.email)
+        if row is None or row[2] != contact.phone_number:
+            self.__release(contact.phone_number, contact.email)
+
+        return False
+
+    def remove_entry(self, email: str, *args: Any, **kwargs: Any) -> Union[bool, int]:
+        row = self.__find(email)
+        result = self.__shard(email).remove_entry(email)
+        if result and row is not None:
+            self.__release(row[2], email)
+
+        return result
+
+    def update_entry(
+        self, email: str, update: Contact, *args: Any, **kwargs: Any
+    ) -> Union[int, bool]:
+        row = self.__find(email)
+        if row is None:
+            return 0
+
+        new_row = (
+            update.email or row[0],
+            update.name or row[1],
+            update.phone_number or row[2],
+        )
+
+        phone_changed, email_changed = new_row[2] != row[2], new_row[0] != row[0]
+        if phone_changed and not self.__reserve(new_row[2], new_row[0]):
+            log.warning("failed to update contact, phone number is in use")
+            return False
+        elif not phone_changed and email_changed:
+            self.__reassign(row[2], row[0], new_row[0])
+
+        source, target = self.__shard(email), self.__shard(new_row[0])
+        if source is target:
+            result = source.update_entry(email=email, update=update)
+        elif target.add_entry(Contact.from_row(new_row)):
+            # Moving between shards - the new row is written before the old one is
+            # removed, a failure in between leaves a duplicate instead of losing data.
+            result = source.remove_entry(email)
+        else:
+            result = False
+
+        if phone_changed:
+            # Release whichever number is no longer in use
+            if result:
+                self.__release(row[2], row[0])
+            else:
+                self.__release(new_row[2], new_row[0])
+        elif email_changed and not result:
+            self.__reassign(row[2], new_row[0], row[0])
+
+        return result
+
+    def search_entry(
+        self,
+        name: Optional[str] = "",
+        email: Optional[str] = "",
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        raw: bool = False,
+        phone: Optional[str] = "",
+        prefix: bool = False,
+        *args: Any,
+        **kwargs: Any,
+    ) -> Optional[Any]:
+        if not name and not email and not phone:
+            return None
+
+        search = dict(
+            name=name,
+            email=email,
+            limit=limit,
+            after=after,
+            raw=True,
+            phone=phone,
+            prefix=prefix,
+        )
+        if email:
+            rows = self.__shard(email).search_entry(**search) or []
+        else:
+            # Every shard returns its first `limit` rows in order, the first `limit`
+            # rows of the merged result are guaranteed to be among them.
+            results = self.__executor.map(
+                lambda shard: sorted(shard.search_entry(**search) or []),
+                self.__shards,
+            )
+            rows = list(islice(heapq.merge(*results), limit))
+
+        return rows if raw else [Contact.from_row(row) for row in rows]
+
+    def fuzzy_search(
+        self,
+        name: str,
+        limit: int = FUZZY_LIMIT,
+        raw: bool = False,
+        threshold: float = FUZZY_THRESHOLD,
+        *args: Any,
+        **kwargs: Any,
+    ) -> Optional[List[Any]]:
+        if not name:
+            return None
+
+        # The most similar rows overall are among the most similar rows of every
+        # shard, ranked again once merged
+        results = list(
+            self.__executor.map(
+                lambda shard: shard.fuzzy_search(
+                    name=name, limit=limit, raw=True, threshold=threshold
+                ),
+                self.__shards,
+            )
+        )
+        if any(result is None for result in results):
+            return None
+
+        rows = rank(name, chain.from_iterable(results), limit, threshold)
+        return rows if raw else [Contact.from_row(row) for row in rows]
+
+    def get_many(
+        self, emails: Iterable[str], raw: bool = False, *args: Any, **kwargs: Any
+    ) -> Dict[str, Optional[Any]]:
+        # Emails are grouped by their shard, shards are looked up in parallel
+        result: Dict[str, Optional[Any]] = {}
+        groups: Dict[int, List[str]] = {}
+        for email in emails:
+            if email not in result:
+                result[email] = None  # keeps the order of the emails
+                groups.setdefault(self.__shard_index(email), []).append(email)
+
+        for found in self.__executor.map(
+            lambda item: self.__shards[item[0]].get_many(item[1], raw=raw),
+            groups.items(),
+        ):
+            result.update(found)
+
+        return result
+
+    def search_entries(
+        self,
+        name: Optional[str] = "",
+        email: Optional[str] = "",
+        raw: bool = False,
+        phone: Optional[str] = "",
+        prefix: bool = False,
+        *args: Any,
+        **kwargs: Any,
+    ) -> Iterator[Any]:
+        if not name and not email and not phone:
+            return
+
+        if email:
+            shards = [self.__shard(email)]
+        else:
+            shards = self.__shards
+
+        # Shards stream their results ordered by email, merged lazily
+        rows = heapq.merge(
+            *(
+                shard.search_entries(
+                    name=name, email=email, raw=True, phone=phone, prefix=prefix
+                )
+                for shard in shards
+            )
+        )
+        yield from rows if raw else map(Contact.from_row, rows)
+
+    def export_entries(self, *args: Any, **kwargs: Any) -> Iterator[Contact]:
+        yield from heapq.merge(
+            *(shard.export_entries() for shard in self.__shards),
+            key=lambda contact: contact.email,
+        )
+
+    def stats(self) -> Dict[str, float]:
+        stats: Dict[str, float] = {}
+        for shard in self.__shards:
+            for key, value in shard.stats().items():
+                stats[key] = stats.get(key, 0) + value
+
+        lookups = stats.get("cache_hits", 0) + stats.get("cache_misses", 0)
+        stats["cache_hit_ratio"] = (
+            stats.get("cache_hits", 0) / lookups if lookups else 0
+        )
+        stats["shards"] = len(self.__shards)
+        return stats
+
+    def close(self) -> None:
+        self.__executor.shutdown(wait=True)
+        for shard in self.__shards:
+            shard.close()
+
+        for pool in self.__phones:
+            pool.close()
+
+    @property
+    def version(self) -> Optional[int]:
+        # Versions of the shards only ever grow, as does their sum
+        return sum(shard.version or 0 for shard in self.__shards)
+
+    @property
+    def shards(self) -> int:
+        return len(self.__shards)
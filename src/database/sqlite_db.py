@@ -1,34 +1,349 @@
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import logging as log
-from sqlite3 import IntegrityError, connect
+import os
+import re
+import time
+from contextlib import closing, contextmanager, nullcontext
+from itertools import count, islice, product
+from pathlib import Path
+from sqlite3 import Connection, IntegrityError, connect
 
-from cachetools import TTLCache, cached
-
-from ..objects import Contact
+from ..logger import DebugSampler
+from ..metrics import ROW_BUCKETS, Metrics
+from ..objects import Change, Contact, Row, normalize_phone
 from .base_db import BaseDB
+from .cache import SearchCache
+from .fuzzy import (
+    CANDIDATES_PER_RESULT,
+    COMMON_TERMS_TTL,
+    FUZZY_LIMIT,
+    FUZZY_THRESHOLD,
+    MAX_POSTINGS,
+    name_pieces,
+    pick_candidates,
+    rank,
+)
+from .pool import ConnectionPool
+from .writer import GroupCommitWriter
+
+# Pragmas applied to every connection, can be overridden through the config file
+DEFAULT_PRAGMAS: Dict[str, Any] = {
+    # Readers do not block the writer (and vice versa) in WAL mode
+    "journal_mode": "wal",
+    # Safe from corruption in WAL mode, skips the fsync on every commit
+    "synchronous": "normal",
+    # Wait for locks to be released instead of failing immediately, in milliseconds
+    "busy_timeout": 5000,
+    # Size of the page cache per connection, negative values are in KiB
+    "cache_size": -16000,
+    # Size of the memory-mapped portion of the database in bytes, disabled if zero
+    "mmap_size": 0,
+}
+
+# Number of compiled statements kept by every connection. Large enough to hold every
+# query text formed by `SQLite` (about 190 of them), leaving room for raw queries.
+STATEMENT_CACHE_SIZE = 256
+
+# Limit on the number of variables in a statement for SQLite versions before 3.32
+MAX_VARIABLES = 999
+
+# Key of a search query - whether the email is matched, how the name is matched (`fts`,
+# `like` or None), how the phone number is matched (`exact`, `prefix` or None), whether
+# the results start after an email, whether the results are ordered, and whether the
+# number of results is limited
+SearchKey = Tuple[bool, Optional[str], Optional[str], bool, bool, bool]
+
+# Number of seconds changes are kept in the change log for, by default
+CHANGE_RETENTION = 7 * 24 * 3600.0
+
+# Number of pages copied by every step of a backup, and the number of seconds paused
+# between steps - writers commit in the pauses instead of waiting for the whole copy
+BACKUP_PAGES = 256
+BACKUP_PAUSE = 0.005
+
+# Number of times a backup is restarted by writes before the rest is copied in a single
+# step, a steady stream of writes would otherwise keep restarting it forever
+BACKUP_RESTARTS = 10
+
+
+class _BackupRestarted(Exception):
+    """
+    Aborts a backup restarted too many times, to be copied again in a single step.
+    """
+
+
+# Current time as a unix timestamp, evaluated by SQLite inside the triggers
+_NOW = "((julianday('now') - 2440587.5) * 86400.0)"
+
+# Searches and writes run on every request, only a sample of them is logged
+_SEARCH_SAMPLER = DebugSampler()
+_WRITE_SAMPLER = DebugSampler()
 
 
 class SQLite(BaseDB):
-    def __init__(self, db_file: str):
+    def __init__(
+        self,
+        db_file: str,
+        pool_size: int = 5,
+        pool_timeout: float = 10.0,
+        cache_size: int = 100,
+        cache_ttl: float = 300,
+        cache_negative: bool = True,
+        pragmas: Optional[Dict[str, Any]] = None,
+        write_batching: bool = False,
+        write_batch_size: int = 100,
+        statement_cache_size: int = STATEMENT_CACHE_SIZE,
+        change_retention: Optional[float] = CHANGE_RETENTION,
+        change_compact_interval: int = 1000,
+        metrics: Optional[Metrics] = None,
+    ):
         """
         Args:
             db_file: String containing full path to the database file. Will be created
                 if does not exist.
+            pool_size: Maximum number of read-only connections kept open to the
+                database, writes go through a connection of their own
+            pool_timeout: Number of seconds to wait for a free connection when all
+                connections in the pool are in use
+            cache_size: Maximum number of search results to be cached
+            cache_ttl: Number of seconds a search result is cached for
+            cache_negative: Boolean indicating if searches without any results should
+                be cached as well
+            pragmas: Dictionary of pragmas applied to every connection, on top of (and
+                overriding) `DEFAULT_PRAGMAS`
+            write_batching: Boolean indicating if concurrent writes should be funneled
+                through a single writer, and committed together
+            write_batch_size: Maximum number of writes committed together
+            statement_cache_size: Number of compiled statements cached by every
+                connection, statements are compiled again once evicted
+            change_retention: Number of seconds changes are kept in the change log
+                for, changes are kept forever if None
+            change_compact_interval: Number of writes after which the change log is
+                compacted, never compacted automatically if zero
+            metrics: Registry to report the time spent connecting, executing and
+                fetching to, nothing is recorded if absent
+
+        Raises:
+            ValueError: If the name or value of a pragma is invalid
         """
 
-        super().__init__(db_name="SQLite3")
+        super().__init__(db_name="SQLite3", metrics=metrics)
+        self.metrics.register_histogram("db_rows", ROW_BUCKETS)
 
         # Full path to the database file
         self.__db_instance = db_file
 
+        self.__pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+        for key, value in self.__pragmas.items():
+            # Pragmas can not use placeholders, restrict them to plain words/numbers
+            if not re.fullmatch(r"[a-z_]+", key) or not re.fullmatch(
+                r"-?\w+", str(value)
+            ):
+                raise ValueError(f"invalid pragma `{key}={value}`")
+
+        self.__statement_cache_size = statement_cache_size
+
+        # Connections are opened lazily, and reused across requests. Writes go through
+        # a single connection, concurrent writes queue up for it instead of retrying
+        # on the lock of the database file. Reads are served by a pool of read-only
+        # connections - in WAL mode, they never wait for the writer.
+        self.__pool = ConnectionPool(
+            db_file, size=1, timeout=pool_timeout, factory=self.__connect
+        )
+        self.__read_pool = ConnectionPool(
+            db_file, size=pool_size, timeout=pool_timeout, factory=self.__connect_reader
+        )
+
+        # Search results, invalidated by writes to the affected contacts
+        self.__cache = SearchCache(
+            maxsize=cache_size, ttl=cache_ttl, cache_negative=cache_negative
+        )
+
         self.__table_name = "contacts"
         self.__column_email = "email"
         self.__column_name = "contact_name"
         self.__column_number = "contact_number"
 
+        # Phone numbers reduced to their digits (see `normalize_phone`), indexed for
+        # exact and prefix lookups
+        self.__column_phone_key = f"{self.__column_number}_normalized"
+
+        # Full-text index over contact names, used for substring searches
+        self.__fts_table = f"{self.__table_name}_fts"
+        self.__fts_enabled = False
+
+        # Terms of fuzzy searches held by more than `MAX_POSTINGS` contacts, term ->
+        # time found
+        self.__common_terms: Dict[str, float] = {}
+
         # Creating the table in the database. Ignored if the table exists already
         self.__create_table()
+        self.__create_phone_index()
+        self.__fts_enabled = self.__create_name_index()
+
+        # Log of every change made to the main table, maintained through triggers
+        self.__changes_table = f"{self.__table_name}_changes"
+        self.__create_change_log()
+        self.__change_retention = change_retention
+        self.__change_compact_interval = change_compact_interval
+        self.__writes = count(1)
+
+        # Every query text is formed once, the texts are identical across calls - each
+        # connection compiles a statement once, and reuses it from its statement cache
+        self.__build_queries()
+
+        # Single writer, started after the schema is in place
+        self.__writer: Optional[GroupCommitWriter] = None
+        if write_batching:
+            self.__writer = GroupCommitWriter(
+                self.__connect(db_file), max_batch=write_batch_size
+            )
+
+    def __connect(self, db_file: str) -> Connection:
+        """
+        Opens a new connection to the database, with the pragmas applied.
+
+        Args:
+            db_file: String containing full path to the database file
+
+        Returns:
+            The new connection.
+        """
+
+        # Connections are handed over between threads by the pool and the writer,
+        # both guarantee that a connection is used by one thread at a time.
+        connection = connect(
+            db_file,
+            check_same_thread=False,
+            cached_statements=self.__statement_cache_size,
+        )
+        for key, value in self.__pragmas.items():
+            connection.execute(f"pragma {key}={value}")
+
+        return connection
+
+    def __connect_reader(self, db_file: str) -> Connection:
+        """
+        Opens a new read-only connection to the database, with the pragmas applied.
+        The file is opened read-only, and `query_only` rejects any write attempted
+        through the connection.
+
+        Args:
+            db_file: String containing full path to the database file
+
+        Returns:
+            The new connection.
+        """
+
+        connection = connect(
+            f"{Path(db_file).absolute().as_uri()}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            cached_statements=self.__statement_cache_size,
+        )
+        for key, value in self.__pragmas.items():
+            # The journal mode is set by the writer, and persists in the file
+            if key != "journal_mode":
+                connection.execute(f"pragma {key}={value}")
+
+        connection.execute("pragma query_only=1")
+        return connection
+
+    @contextmanager
+    def __reading(self, operation: str, snapshot: bool = False) -> Iterator[Connection]:
+        """
+        Checks out a read-only connection from the pool, the time spent waiting for
+        (or opening) the connection is recorded as the `connect` phase of the
+        operation.
+
+        Args:
+            operation: String containing the name of the method the connection is
+                used by
+            snapshot: Boolean indicating if every statement run on the connection
+                should read from the same snapshot of the database - a single
+                statement always does
+
+        Yields:
+            An open read-only connection to the database.
+        """
+
+        with self.metrics.timer("db_seconds", operation=operation, phase="connect"):
+            connection = self.__read_pool.acquire()
+
+        try:
+            if snapshot:
+                # Reads from the snapshot taken by its first statement till the
+                # transaction is rolled back, once the connection is released
+                connection.execute("begin")
+
+            yield connection
+        finally:
+            self.__read_pool.release(connection)
+
+    @contextmanager
+    def __connection(self, operation: str) -> Iterator[Connection]:
+        """
+        Checks out the connection used for writes, the time spent waiting for (or
+        opening) the connection is recorded as the `connect` phase of the operation.
+
+        Args:
+            operation: String containing the name of the method the connection is
+                used by
+
+        Yields:
+            An open connection to the database.
+        """
+
+        with self.metrics.timer("db_seconds", operation=operation, phase="connect"):
+            connection = self.__pool.acquire()
+
+        try:
+            yield connection
+        finally:
+            self.__pool.release(connection)
+
+    def __write(self, operation: str, query: str, placeholder: Tuple[Any, ...]) -> int:
+        """
+        Executes (and commits) a single write statement, through the writer if write
+        batching is enabled.
+
+        Args:
+            operation: String containing the name of the calling method, used to label
+                the recorded timings
+            query: String containing the statement to be executed
+            placeholder: Tuple containing the values bound to the statement
+
+        Returns:
+            The number of rows affected.
+        """
+
+        def execute(connection: Connection) -> int:
+            return int(connection.execute(query, placeholder).rowcount)
+
+        # Time spent waiting in the queue of the writer is included in `execute`
+        timer = self.metrics.timer("db_seconds", operation=operation, phase="execute")
+        if self.__writer is not None:
+            with timer:
+                rowcount = int(self.__writer.execute(execute))
+        else:
+            with self.__connection(operation) as connection:
+                with timer:
+                    rowcount = execute(connection)
+                    connection.commit()
+
+        if _WRITE_SAMPLER.sample():
+            log.debug("%s affected %d rows", operation, rowcount)
+
+        self.__count_write()
+
+        return rowcount
+
+    def __count_write(self) -> None:
+        # Compacts the change log once every `change_compact_interval` writes
+        interval = self.__change_compact_interval
+        if interval and next(self.__writes) % interval == 0:
+            self.compact_changes()
 
     def __create_table(self) -> bool:
         """
@@ -44,156 +359,1083 @@ class SQLite(BaseDB):
             create table if not exists "{self.__table_name}" (
                 "{self.__column_email}" text primary key,
                 "{self.__column_name}" text not null,
-                "{self.__column_number}" text unique not null
+                "{self.__column_number}" text unique not null,
+                "{self.__column_phone_key}" text
             );
         """
 
-        with connect(self.__db_instance) as connection:
+        with self.__pool.connection() as connection:
             try:
                 connection.execute(query)
                 connection.commit()
                 return True
             except Exception as e:
-                log.warning(f"failed to create table in database!")
-                log.warning(f"{type(e)} \n{str(e)}")
+                log.warning("failed to create table in database!")
+                log.warning("%s \n%s", type(e), e)
                 return False
 
-    def execute_query(self, query: str, *args: Any, **kwargs: Any) -> None:
-        with connect(self.__db_instance) as connection:
-            connection.execute(query)
-            connection.commit()
-
-    def add_entry(
-        self, contact: Contact, *args: List[Any], **kwargs: Dict[Any, Any]
-    ) -> bool:
-        query = f"""
-            insert into "{self.__table_name}"(
-                "{self.__column_email}",
-                "{self.__column_name}",
-                "{self.__column_number}"
-            ) values (?, ?, ?)
+    def __create_phone_index(self) -> None:
+        """
+        Creates the index over normalized phone numbers. Databases created before the
+        normalized column existed are migrated by adding the column, and filling it in
+        for the existing rows - as are rows added by tools unaware of the column.
         """
 
-        with connect(self.__db_instance) as connection:
+        table, number, key = (
+            self.__table_name,
+            self.__column_number,
+            self.__column_phone_key,
+        )
+
+        with self.__pool.connection() as connection:
             try:
+                # Migrated in a single transaction, like the name index
+                connection.execute("begin immediate")
+                columns = {
+                    row[1]
+                    for row in connection.execute(f'pragma table_info("{table}")')
+                }
+                if key not in columns:
+                    log.info("adding normalized phone numbers to the contacts table")
+                    connection.execute(f'alter table "{table}" add column "{key}" text')
+
                 connection.execute(
-                    query, (contact.email, contact.name, contact.phone_number)
+                    f'create index if not exists "{table}_{key}" on "{table}"("{key}")'
                 )
 
+                # Missing values are found through the index, cheap once filled in
+                rows = connection.execute(
+                    f'select rowid, "{number}" from "{table}" where "{key}" is null'
+                ).fetchall()
+                if rows:
+                    log.info("normalizing %d phone numbers", len(rows))
+                    connection.executemany(
+                        f'update "{table}" set "{key}"=? where rowid=?',
+                        ((normalize_phone(phone), rowid) for rowid, phone in rows),
+                    )
+
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+
+    def __create_name_index(self) -> bool:
+        """
+        Creates a trigram based full-text index over the names of contacts, kept in
+        sync with the main table through triggers. Databases created before the index
+        existed are migrated by populating the index with the existing rows.
+
+        Remarks:
+            The index refers to rows of the main table using their rowid, which can
+            change if the database is vacuumed - the index will need to be rebuilt if
+            that happens.
+
+        Returns:
+            Boolean indicating if the index is usable. Requires SQLite to be compiled
+            with FTS5, and be recent enough to have the trigram tokenizer (3.34+).
+        """
+
+        table, fts, name = self.__table_name, self.__fts_table, self.__column_name
+        queries = [
+            f"""
+                create virtual table "{fts}" using fts5(
+                    "{name}", content="{table}", tokenize="trigram"
+                )
+            """,
+            f"""
+                create trigger if not exists "{fts}_insert" after insert on "{table}"
+                begin
+                    insert into "{fts}"(rowid, "{name}") values (new.rowid, new."{name}");
+                end
+            """,
+            f"""
+                create trigger if not exists "{fts}_delete" after delete on "{table}"
+                begin
+                    insert into "{fts}"("{fts}", rowid, "{name}")
+                    values ('delete', old.rowid, old."{name}");
+                end
+            """,
+            f"""
+                create trigger if not exists "{fts}_update"
+                after update of "{name}" on "{table}"
+                begin
+                    insert into "{fts}"("{fts}", rowid, "{name}")
+                    values ('delete', old.rowid, old."{name}");
+                    insert into "{fts}"(rowid, "{name}") values (new.rowid, new."{name}");
+                end
+            """,
+            # Backfill the index with rows added before the index existed
+            f"""insert into "{fts}"("{fts}") values ('rebuild')""",
+        ]
+
+        with self.__pool.connection() as connection:
+            try:
+                # Lock the database upfront, the index is created and populated in a
+                # single transaction even if multiple processes start up together.
+                connection.execute("begin immediate")
+                exists = connection.execute(
+                    "select 1 from sqlite_master where type='table' and name=?", (fts,)
+                ).fetchone()
+
+                if exists:
+                    return True
+
+                log.info("creating full-text index over contact names")
+                for query in queries:
+                    connection.execute(query)
+
                 connection.commit()
                 return True
-            except IntegrityError:
-                log.warning(f"catch IntegrityError, failed to add data")
-                return False
             except Exception as e:
-                log.warning(f"unknown exception raised while adding a contact")
-                log.warning(f"exception type: {type(e)}\n{str(e)}")
+                log.warning("failed to create full-text index, using table scans")
+                log.warning("%s \n%s", type(e), e)
                 return False
 
-    def remove_entry(
-        self, email: str, *args: List[Any], **kwargs: Dict[Any, Any]
-    ) -> Union[bool, int]:
-        query = f"""
-            delete from "{self.__table_name}" where
-            "{self.__column_email}"=?
+    def __create_change_log(self) -> None:
         """
+        Creates the change log, a table recording every insert, update and delete on
+        the main table in order - kept in sync through triggers, every change is
+        logged in the same transaction as the write itself. Contacts present before
+        the log existed are logged as inserts.
+
+        Every change is numbered by a sequence, `autoincrement` guarantees numbers are
+        never reused - even after old changes are removed from the log.
+        """
+
+        table, changes = self.__table_name, self.__changes_table
+        email, name, number = (
+            self.__column_email,
+            self.__column_name,
+            self.__column_number,
+        )
+
+        put = f"""
+            insert into "{changes}"("op", "{email}", "{name}", "{number}", "changed_at")
+            values ('put', new."{email}", new."{name}", new."{number}", {_NOW});
+        """
+        delete = f"""
+            insert into "{changes}"("op", "{email}", "changed_at")
+            values ('delete', old."{email}", {_NOW});
+        """
+
+        queries = [
+            f"""
+                create table "{changes}" (
+                    "seq" integer primary key autoincrement,
+                    "op" text not null,
+                    "{email}" text not null,
+                    "{name}" text,
+                    "{number}" text,
+                    "changed_at" real not null
+                )
+            """,
+            # Compaction looks for the latest change to every email
+            f'create index "{changes}_email" on "{changes}"("{email}", "seq")',
+            # Holds the sequence number of the latest change removed by retention
+            f'create table "{changes}_horizon" ("seq" integer not null)',
+            f'insert into "{changes}_horizon" values (0)',
+            f"""
+                create trigger "{changes}_insert" after insert on "{table}"
+                begin {put} end
+            """,
+            f"""
+                create trigger "{changes}_delete" after delete on "{table}"
+                begin {delete} end
+            """,
+            # A changed email is logged as a delete of the old email, and an insert
+            f"""
+                create trigger "{changes}_update"
+                after update of "{email}", "{name}", "{number}" on "{table}"
+                begin
+                    insert into "{changes}"("op", "{email}", "changed_at")
+                    select 'delete', old."{email}", {_NOW}
+                    where old."{email}" != new."{email}";
+                    {put}
+                end
+            """,
+            f"""
+                insert into "{changes}"(
+                    "op", "{email}", "{name}", "{number}", "changed_at"
+                )
+                select 'put', "{email}", "{name}", "{number}", {_NOW}
+                from "{table}" order by "{email}"
+            """,
+        ]
+
+        with self.__pool.connection() as connection:
+            try:
+                # Created and backfilled in a single transaction, like the name index
+                connection.execute("begin immediate")
+                exists = connection.execute(
+                    "select 1 from sqlite_master where type='table' and name=?",
+                    (changes,),
+                ).fetchone()
+
+                if not exists:
+                    log.info("creating the change log")
+                    for query in queries:
+                        connection.execute(query)
+
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+
+    def __build_queries(self) -> None:
+        """
+        Forms the text of every query run by the database - including a variant for
+        every combination of columns updated, and of search conditions.
+        """
+
+        table, fts = self.__table_name, self.__fts_table
+        email, name, number = (
+            self.__column_email,
+            self.__column_name,
+            self.__column_number,
+        )
+        select = f'select "{email}", "{name}", "{number}" from "{table}"'
+
+        phone_key = self.__column_phone_key
+        self.__insert_query = f"""
+            insert into "{table}"("{email}", "{name}", "{number}", "{phone_key}")
+            values (?, ?, ?, ?)
+        """
+        self.__delete_query = f'delete from "{table}" where "{email}"=?'
+        self.__export_query = f'{select} where "{email}" > ? order by "{email}" limit ?'
+        self.__snapshot_query = f'{select} order by "{email}"'
+
+        changes = self.__changes_table
+        self.__changes_query = f"""
+            select "seq", "op", "{email}", "{name}", "{number}" from "{changes}"
+            where "seq" > ? order by "seq" limit ?
+        """
+        self.__horizon_query = f'select "seq" from "{changes}_horizon"'
+
+        # Compaction - changes older than the retention period are removed along with
+        # every change before them, the horizon is moved past them first
+        self.__advance_horizon_query = f"""
+            update "{changes}_horizon" set "seq" = max("seq", coalesce(
+                (select max("seq") from "{changes}" where "changed_at" < ?), 0
+            ))
+        """
+        self.__expire_changes_query = f"""
+            delete from "{changes}"
+            where "seq" <= (select "seq" from "{changes}_horizon")
+        """
+        self.__supersede_changes_query = f"""
+            delete from "{changes}" where "seq" < (
+                select max(latest."seq") from "{changes}" as latest
+                where latest."{email}" = "{changes}"."{email}"
+            )
+        """
+
+        # Keyed by the columns updated (email, name, phone number), in that order. The
+        # normalized phone number is updated along with the phone number
+        self.__update_queries: Dict[Tuple[bool, bool, bool], str] = {}
+        for columns in product((True, False), repeat=3):
+            assignments = [
+                f'"{column}"=?'
+                for column, updated in zip((email, name, number), columns)
+                if updated
+            ]
+            if columns[2]:
+                assignments.append(f'"{phone_key}"=?')
+
+            if assignments:
+                self.__update_queries[columns] = (
+                    f'update "{table}" set {",".join(assignments)} where "{email}"=?'
+                )
+
+        self.__search_queries: Dict[SearchKey, str] = {}
+        for by_email, by_name, by_phone, after, ordered, limited in product(
+            (True, False),
+            ("fts", "like", None),
+            ("exact", "prefix", None),
+            (True, False),
+            (True, False),
+            (True, False),
+        ):
+            if not by_email and by_name is None and by_phone is None:
+                continue
+
+            conditions = []
+            if by_email:
+                conditions.append(f'"{email}"=?')
+
+            if by_name == "fts":
+                conditions.append(
+                    f'rowid in (select rowid from "{fts}" where "{name}" like ?)'
+                )
+            elif by_name == "like":
+                conditions.append(f'"{name}" like ?')
+
+            # Prefixes are matched as a range, both are answered by the phone index
+            if by_phone == "exact":
+                conditions.append(f'"{phone_key}"=?')
+            elif by_phone == "prefix":
+                conditions.append(f'"{phone_key}">=? and "{phone_key}"<?')
+
+            if after:
+                conditions.append(f'"{email}">?')
+
+            query = f'{select} where {" and ".join(conditions)}'
+            if ordered:
+                query += f' order by "{email}"'
+
+            if limited:
+                query += " limit ?"
+
+            key = (by_email, by_name, by_phone, after, ordered, limited)
+            self.__search_queries[key] = query
+
+        # Keyed by the column, and the number of contacts looked up (see
+        # `__fetch_many`). Contacts are looked up by email, or by rowid for fuzzy
+        # searches
+        self.__select_query = select
+        self.__fetch_queries: Dict[Tuple[str, int], str] = {}
+        size = 1
+        while size < MAX_VARIABLES:
+            self.__fetch_query(size, f'"{email}"')
+            self.__fetch_query(size, "rowid")
+            size *= 2
+
+        # Postings of a trigram in the full-text index, see `fuzzy_search`
+        self.__postings_query = (
+            f'select rowid from "{fts}" where "{fts}" match ? limit ?'
+        )
+
+    def __fetch_query(self, size: int, column: str) -> str:
+        """
+        Returns:
+            Text of the query looking up `size` contacts by a (quoted) column, formed
+            once for every column and size.
+        """
+
+        query = self.__fetch_queries.get((column, size), None)
+        if query is None:
+            query = self.__fetch_queries.setdefault(
+                (column, size),
+                f'{self.__select_query} where {column} in ({",".join("?" * size)})',
+            )
+
+        return query
+
+    def execute_query(self, query: str, *args: Any, **kwargs: Any) -> None:
+        with self.__pool.connection() as connection:
+            connection.execute(query)
+            connection.commit()
 
-        with connect(self.__db_instance) as connection:
+        # No way to tell what a raw query changed
+        self.__cache.clear()
+
+    def add_entry(
+        self, contact: Contact, *args: List[Any], **kwargs: Dict[Any, Any]
+    ) -> bool:
+        try:
+            self.__write(
+                "add_entry",
+                self.__insert_query,
+                (*contact.to_row(), normalize_phone(contact.phone_number)),
+            )
+            self.__cache.invalidate(emails=[contact.email], names=[contact.name])
+            return True
+        except IntegrityError:
+            log.warning("catch IntegrityError, failed to add data")
+            return False
+        except Exception as e:
+            log.warning("unknown exception raised while adding a contact")
+            log.warning("exception type: %s\n%s", type(e), e)
+            return False
+
+    def add_entries(
+        self,
+        contacts: Iterable[Contact],
+        chunk_size: int = 1000,
+        *args: List[Any],
+        **kwargs: Dict[Any, Any],
+    ) -> Union[List[Tuple[int, str]], bool]:
+        query = self.__insert_query
+        failures: List[Tuple[int, str]] = []
+        contacts = iter(contacts)
+        offset = 0
+
+        with self.__pool.connection() as connection:
             try:
-                cursor = connection.cursor()
-                cursor.execute(query, (email,))
+                # All chunks are written in a single transaction, each chunk is wrapped
+                # in a savepoint to be able to undo a partially inserted chunk.
+                connection.execute("begin")
+
+                while True:
+                    chunk = list(islice(contacts, chunk_size))
+                    if not chunk:
+                        break
+
+                    rows = []
+                    for index, contact in enumerate(chunk, start=offset):
+                        if not contact.email or not contact.name:
+                            failures.append((index, "missing name or email"))
+                            continue
+
+                        phone_key = normalize_phone(contact.phone_number)
+                        rows.append((index, (*contact.to_row(), phone_key)))
+
+                    connection.execute("savepoint bulk_insert")
+                    try:
+                        connection.executemany(query, (row for _, row in rows))
+                    except IntegrityError:
+                        # Conflicting row(s) in this chunk, replay it one row at a time
+                        # to find out which rows are to blame.
+                        connection.execute("rollback to bulk_insert")
+                        for index, row in rows:
+                            try:
+                                connection.execute(query, row)
+                            except IntegrityError as e:
+                                failures.append((index, str(e)))
+
+                    connection.execute("release bulk_insert")
+                    offset += len(chunk)
+
                 connection.commit()
-                return int(cursor.rowcount)  # return the number of rows affected
+                self.__cache.clear()
+                failures.sort()
             except Exception as e:
-                log.warning(f"failed to remove row from database")
-                log.warning(f"exception type: {type(e)}\n{str(e)}")
+                log.warning("unknown exception raised while adding contacts in bulk")
+                log.warning("exception type: %s\n%s", type(e), e)
                 return False
 
+        self.__count_write()
+        return failures
+
+    def remove_entry(
+        self, email: str, *args: List[Any], **kwargs: Dict[Any, Any]
+    ) -> Union[bool, int]:
+        try:
+            rowcount = self.__write("remove_entry", self.__delete_query, (email,))
+            self.__cache.invalidate(emails=[email])
+            return rowcount  # return the number of rows affected
+        except Exception as e:
+            log.warning("failed to remove row from database")
+            log.warning("exception type: %s\n%s", type(e), e)
+            return False
+
     def update_entry(
         self, email: str, update: Contact, *args: List[Any], **kwargs: Dict[Any, Any]
     ) -> Union[int, bool]:
-        query = f"""
-            update "{self.__table_name}" set
-            """
+        values = (update.email, update.name, update.phone_number)
+        query = self.__update_queries.get(tuple(bool(value) for value in values), None)
+        if query is None:
+            log.warning("nothing to update, no values present")
+            return False
+
+        placeholder = [value for value in values if value]
+        if update.phone_number:
+            placeholder.append(normalize_phone(update.phone_number))
 
-        placeholder: List[str] = []
+        placeholder.append(email)
 
-        for key, val in {
-            self.__column_email: update.email,
-            self.__column_name: update.name,
-            self.__column_number: update.phone_number,
-        }.items():
-            if val:
-                query += f'{"," if len(placeholder) > 0 else ""}"{key}"=?'
-                placeholder.append(val)
+        try:
+            rowcount = self.__write("update_entry", query, tuple(placeholder))
+            self.__cache.invalidate(emails=[email, update.email], names=[update.name])
+            return rowcount  # return the number of rows affected
+        except Exception as e:
+            log.warning("failed to update row in database")
+            log.warning("exception type: %s\n%s", type(e), e)
+            return False
 
-        query += f"""
-            where "{self.__column_email}"=?
+    def __search(
+        self,
+        name: Optional[str],
+        email: Optional[str],
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        phone: Optional[str] = None,
+        prefix: bool = False,
+        operation: str = "search_entry",
+        connection: Optional[Connection] = None,
+    ) -> List[Row]:
         """
-        placeholder.append(email)
+        Searches the database for contacts, without any caching involved.
 
-        with connect(self.__db_instance) as connection:
-            try:
-                cursor = connection.cursor()
+        Args:
+            name: String containing (part of) the name of the contact to search for
+            email: String containing email of the contact to search for
+            limit: Maximum number of contacts to be returned, all matching contacts
+                are returned if absent
+            after: Email of the last contact from the previous page, only contacts with
+                an email greater than this are returned
+            phone: String containing the phone number of the contact to search for,
+                matched after being normalized
+            prefix: Boolean indicating if contacts with a phone number starting with
+                `phone` should be returned, instead of an exact match
+            operation: String containing the name of the calling method, used to label
+                the recorded timings
+            connection: Read-only connection to run the query on, one is checked out
+                of the pool if absent
+
+        Returns:
+            List of rows (email, name and phone number) matching the search. Paginated
+            results are ordered by their email.
+        """
+
+        placeholder: List[Any] = []
+        by_name: Optional[str] = None
+        by_phone: Optional[str] = None
+
+        if email:
+            # Search by email - will return a single result at most
+            placeholder.append(email)
+
+        if name:
+            # Search by name using the trigram index, patterns shorter than a trigram
+            # can not make use of the index - and fall back to a table scan.
+            by_name = "fts" if self.__fts_enabled and len(name) >= 3 else "like"
+            placeholder.append(f"%{name}%")
+
+        if phone:
+            phone_key = normalize_phone(phone)
+            if not phone_key:
+                # Matches only contacts without digits in their phone number, not
+                # worth a query
+                return []
+
+            if prefix:
+                # Every number starting with the prefix sorts between the prefix, and
+                # the prefix followed by the character after `9`
+                by_phone = "prefix"
+                placeholder.extend((phone_key, f"{phone_key}:"))
+            else:
+                by_phone = "exact"
+                placeholder.append(phone_key)
+
+        if after:
+            # Keyset pagination, resume right after the last email seen
+            placeholder.append(after)
+
+        if limit is not None:
+            placeholder.append(limit)
+
+        # Paginated results are ordered by the primary key, keeps pages stable across
+        # requests
+        paginate = limit is not None or after is not None
+        query = self.__search_queries[
+            (bool(email), by_name, by_phone, bool(after), paginate, limit is not None)
+        ]
+
+        metrics = self.metrics
+        reading = nullcontext(connection) if connection else self.__reading(operation)
+        with reading as connection:
+            cursor = connection.cursor()
+            with metrics.timer("db_seconds", operation=operation, phase="execute"):
                 cursor.execute(query, tuple(placeholder))
-                connection.commit()
-                return int(cursor.rowcount)  # return the number of rows affected
-            except Exception as e:
-                log.warning(f"failed to update row in database")
-                log.warning(f"exception type: {type(e)}\n{str(e)}")
-                return False
 
-    # Cache upto 100 search results for 300 seconds
-    @cached(cache=TTLCache(maxsize=100, ttl=10))
+            with metrics.timer("db_seconds", operation=operation, phase="fetch"):
+                return cursor.fetchall()
+
     def search_entry(
         self,
         name: Optional[str] = "",
         email: Optional[str] = "",
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        raw: bool = False,
+        phone: Optional[str] = "",
+        prefix: bool = False,
         *args: List[Any],
         **kwargs: Dict[Any, Any],
     ) -> Optional[Any]:
-        if not name and not email:
-            # If both name and email are absent, return an empty response.
+        if not name and not email and not phone:
+            # If name, email and phone number are absent, return an empty response.
             return None
 
-        # Forming an incomplete query, the contents of the where clause will be
-        # added later.
-        query = f"""
-            select
-            "{self.__column_email}",
-            "{self.__column_name}",
-            "{self.__column_number}"
-        from "{self.__table_name}" where
-        """
-
-        if name and not email:
-            # Search by name
-            query += f'"{self.__column_name}" like ?'
-            placeholder: Tuple[str, ...] = (f"%{name}%",)
-        elif email and not name:
-            # Search by email - will return a single result at most
-            query += f'"{self.__column_email}"=?'
-            placeholder = (email,)  # assignment: ignore
+        cached = False
+        if phone:
+            # Writes invalidate cached results by email and name, searches by phone
+            # number are answered by the index instead
+            rows = self.__search(
+                name=name,
+                email=email,
+                limit=limit,
+                after=after,
+                phone=phone,
+                prefix=prefix,
+            )
         else:
-            # If both name and email are supplied, combine them with the `and` operator
-            query += f'"{self.__column_email}"=? and "{self.__column_name}" like ?'
-            placeholder = (str(email), f"%{name}%")
+            key = (name or "", email or "", limit, after)
+            rows, version = self.__cache.get(key)
+            cached = rows is not None
+            if rows is None:
+                rows = self.__search(name=name, email=email, limit=limit, after=after)
+                self.__cache.put(key, rows, version)
 
-        with connect(self.__db_instance) as connection:
-            cursor = connection.cursor()
-            cursor.execute(query, placeholder)
+        if _SEARCH_SAMPLER.sample():
+            log.debug(
+                "search (name=%r, email=%r, phone=%r) found %d rows, cached: %s",
+                name,
+                email,
+                phone,
+                len(rows),
+                cached,
+            )
 
-            rows = cursor.fetchall()
-            result = []
-            for element in rows:
-                if len(element) < 3:
-                    continue
+        self.metrics.observe("db_rows", len(rows), operation="search_entry")
+        return rows if raw else [Contact.from_row(row) for row in rows]
 
-                result.append(
-                    Contact(email=element[0], name=element[1], phone_number=element[2])
-                )
+    def __fetch_many(
+        self,
+        keys: List[Any],
+        column: Optional[str] = None,
+        operation: str = "get_many",
+        connection: Optional[Connection] = None,
+    ) -> List[Row]:
+        """
+        Fetches the contacts with the given emails (or other keys) using a single
+        query.
+
+        Args:
+            keys: List of emails, should not exceed the limit on the number of
+                variables in a statement
+            column: Quoted name of the column holding the keys, the email if absent
+            operation: String containing the name of the calling method, used to label
+                the recorded timings
+            connection: Read-only connection to run the query on, one is checked out
+                of the pool if absent
+
+        Returns:
+            List of rows found, in no particular order.
+        """
+
+        # Padded to the next power of two by repeating the last key, lookups of any
+        # size share a handful of query texts (and compiled statements).
+        size = max(len(keys), min(1 << (len(keys) - 1).bit_length(), MAX_VARIABLES))
+        keys = keys + keys[-1:] * (size - len(keys))
+        query = self.__fetch_query(size, column or f'"{self.__column_email}"')
+
+        metrics = self.metrics
+        reading = nullcontext(connection) if connection else self.__reading(operation)
+        with reading as connection:
+            with metrics.timer("db_seconds", operation=operation, phase="execute"):
+                cursor = connection.execute(query, keys)
+
+            with metrics.timer("db_seconds", operation=operation, phase="fetch"):
+                return cursor.fetchall()
 
+    def get_many(
+        self,
+        emails: Iterable[str],
+        raw: bool = False,
+        chunk_size: int = 500,
+        *args: List[Any],
+        **kwargs: Dict[Any, Any],
+    ) -> Dict[str, Optional[Any]]:
+        result: Dict[str, Optional[Any]] = {}
+        missing: List[Tuple[str, int]] = []
+
+        # Served from the cache where possible, shares entries with `search_entry`
+        for email in emails:
+            if email in result:
+                continue
+
+            rows, version = self.__cache.get(("", email, None, None))
+            if rows is None:
+                missing.append((email, version))
+                result[email] = None  # keeps the order of the emails
+            else:
+                result[email] = rows[0] if rows else None
+
+        # Chunked to stay well within the limit on the number of variables in a
+        # statement (999 for SQLite versions before 3.32), all chunks are read from
+        # the same snapshot
+        chunks = [
+            missing[start : start + chunk_size]
+            for start in range(0, len(missing), chunk_size)
+        ]
+        if chunks:
+            with self.__reading("get_many", snapshot=len(chunks) > 1) as connection:
+                for chunk in chunks:
+                    keys = [email for email, _ in chunk]
+                    rows = self.__fetch_many(keys, None, "get_many", connection)
+                    found = {row[0]: row for row in rows}
+
+                    for email, version in chunk:
+                        row = found.get(email, None)
+                        result[email] = row
+                        self.__cache.put(
+                            ("", email, None, None), [row] if row else [], version
+                        )
+
+        self.metrics.observe(
+            "db_rows",
+            sum(row is not None for row in result.values()),
+            operation="get_many",
+        )
+
+        if raw:
             return result
 
+        return {
+            email: Contact.from_row(row) if row is not None else None
+            for email, row in result.items()
+        }
+
+    def fuzzy_search(
+        self,
+        name: str,
+        limit: int = FUZZY_LIMIT,
+        raw: bool = False,
+        threshold: float = FUZZY_THRESHOLD,
+        *args: List[Any],
+        **kwargs: Dict[Any, Any],
+    ) -> Optional[List[Any]]:
+        if not name:
+            return None
+
+        if not self.__fts_enabled:
+            log.warning("fuzzy searches need the full-text index, not available")
+            return None
+
+        wanted = min(limit * CANDIDATES_PER_RESULT, MAX_VARIABLES)
+        lowered = name.lower()
+        grams = {lowered[index : index + 3] for index in range(len(lowered) - 2)}
+
+        if grams:
+            # Candidates are fetched from the snapshot they were looked up in, rowids
+            # can be reused by writes in the meantime
+            metrics = self.metrics
+            with self.__reading("fuzzy_search", snapshot=True) as connection:
+                with metrics.timer(
+                    "db_seconds", operation="fuzzy_search", phase="execute"
+                ):
+                    # Candidates are retrieved from the trigram index - one (bounded)
+                    # lookup per trigram of the name, instead of comparing the name to
+                    # every row
+                    postings = self.__postings(connection, grams)
+
+                    # Short of candidates, look for the contacts containing a piece
+                    # of the name as well - a misspelled name shares few trigrams
+                    selective = [
+                        rowids for rowids, truncated in postings if not truncated
+                    ]
+                    if sum(map(len, selective)) < wanted:
+                        pieces = self.__postings(connection, name_pieces(lowered))
+                        postings = [(rowids, False) for rowids in selective] + pieces
+
+                    if all(truncated for _, truncated in postings):
+                        # Nothing but common trigrams, settle for some of the contacts
+                        # holding them
+                        postings = self.__postings(connection, grams, skip_common=False)
+
+                rows: List[Row] = []
+                candidates = pick_candidates(postings, wanted)
+                if candidates:
+                    rows = self.__fetch_many(
+                        candidates, "rowid", "fuzzy_search", connection
+                    )
+        else:
+            # Too short to make use of the index, ranks names containing it instead
+            rows = self.__search(
+                name=name, email=None, limit=wanted, operation="fuzzy_search"
+            )
+
+        rows = rank(name, rows, limit, threshold)
+        if _SEARCH_SAMPLER.sample():
+            log.debug("fuzzy search (name=%r) found %d rows", name, len(rows))
+
+        self.metrics.observe("db_rows", len(rows), operation="fuzzy_search")
+        return rows if raw else [Contact.from_row(row) for row in rows]
+
+    def __postings(
+        self, connection: Connection, terms: Iterable[str], skip_common: bool = True
+    ) -> List[Tuple[List[int], bool]]:
+        """
+        Looks up the contacts with a name containing a term in the full-text index,
+        for every term - up to `MAX_POSTINGS` contacts per term. Terms held by more
+        contacts are remembered as common for `COMMON_TERMS_TTL` seconds.
+
+        Args:
+            connection: Connection to run the lookups on
+            terms: Terms to look up, of at least a trigram each
+            skip_common: Boolean indicating if terms known to be common should be
+                skipped, their postings are reported as empty (and cut short)
+
+        Returns:
+            List of tuples containing the rowids of the contacts holding every term,
+            and whether the list was cut short.
+        """
+
+        now = time.monotonic()
+        common = self.__common_terms
+        postings: List[Tuple[List[int], bool]] = []
+        for term in terms:
+            if (
+                skip_common
+                and now - common.get(term, -COMMON_TERMS_TTL) < COMMON_TERMS_TTL
+            ):
+                postings.append(([], True))
+                continue
+
+            # Matched as a phrase, a substring of the names
+            phrase = '"{}"'.format(term.replace('"', '""'))
+            rowids = connection.execute(
+                self.__postings_query, (phrase, MAX_POSTINGS + 1)
+            ).fetchall()
+
+            truncated = len(rowids) > MAX_POSTINGS
+            if truncated:
+                common[term] = now
+
+            postings.append(([rowid for rowid, in rowids[:MAX_POSTINGS]], truncated))
+
+        return postings
+
+    def search_entries(
+        self,
+        name: Optional[str] = "",
+        email: Optional[str] = "",
+        batch_size: int = 500,
+        raw: bool = False,
+        phone: Optional[str] = "",
+        prefix: bool = False,
+        *args: List[Any],
+        **kwargs: Dict[Any, Any],
+    ) -> Iterator[Any]:
+        if not name and not email and not phone:
+            return
+
+        # Walk through the results one page at a time, only a single page is held in
+        # memory. Every page is read from the snapshot taken by the first one, within
+        # a single read transaction - on a connection of its own like
+        # `snapshot_entries`, a slow consumer does not hold one of the pool.
+        with closing(self.__connect_reader(self.__db_instance)) as connection:
+            connection.execute("begin")
+
+            after = None
+            while True:
+                page = self.__search(
+                    name=name,
+                    email=email,
+                    limit=batch_size,
+                    after=after,
+                    phone=phone,
+                    prefix=prefix,
+                    operation="search_entries",
+                    connection=connection,
+                )
+                yield from page if raw else map(Contact.from_row, page)
+
+                if len(page) < batch_size:
+                    return
+
+                after = page[-1][0]
+
+    def export_entries(
+        self, batch_size: int = 1000, *args: List[Any], **kwargs: Dict[Any, Any]
+    ) -> Iterator[Contact]:
+        query = self.__export_query
+
+        # Rows are fetched in batches using the primary key as a cursor, a connection
+        # is held only while a batch is being fetched - a slow consumer does not block
+        # writers in the meantime. Batches are deliberately read from separate
+        # transactions, writes made during the export are seen by the batches read
+        # after them; `snapshot_entries` reads from a single snapshot instead.
+        last_email = ""
+        while True:
+            with self.__reading("export_entries") as connection:
+                rows = connection.execute(query, (last_email, batch_size)).fetchall()
+
+            for row in rows:
+                yield Contact.from_row(row)
+
+            if len(rows) < batch_size:
+                return
+
+            last_email = rows[-1][0]
+
+    def snapshot_entries(
+        self, batch_size: int = 1000, *args: Any, **kwargs: Any
+    ) -> Optional[Iterator[Row]]:
+        return self.__iter_snapshot(batch_size)
+
+    def __iter_snapshot(self, batch_size: int) -> Iterator[Row]:
+        # A single statement reads from a single snapshot of the database till it is
+        # done, rows are fetched from it one batch at a time. Read on a connection of
+        # its own instead of holding one of the pool for as long as the consumer takes
+        # - in WAL mode, writers carry on in the meantime.
+        with closing(self.__connect_reader(self.__db_instance)) as connection:
+            with self.metrics.timer(
+                "db_seconds", operation="snapshot_entries", phase="execute"
+            ):
+                cursor = connection.execute(self.__snapshot_query)
+
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                yield from rows
+
+                if len(rows) < batch_size:
+                    return
+
+    def backup(
+        self,
+        target: str,
+        pages: int = BACKUP_PAGES,
+        pause: float = BACKUP_PAUSE,
+        max_restarts: int = BACKUP_RESTARTS,
+        *args: Any,
+        **kwargs: Any,
+    ) -> Optional[int]:
+        """
+        Copies the database to a file using the online backup API of SQLite, `pages`
+        pages at a time from a read-only connection. The database is read only while a
+        step is copied, reads and writes are served between steps, and a write made
+        in the meantime restarts the copy - the copy is consistent once complete.
+
+        Under a steady stream of writes, the copy could be restarted forever. Once it
+        has been restarted `max_restarts` times, it is started over and copied in a
+        single step instead - within a single read transaction, which holds up neither
+        reads nor writes in WAL mode (writes wait for the copy otherwise).
+
+        Args:
+            target: String containing full path to the copy. The copy is written to a
+                temporary file first, and renamed once complete - the target is never
+                left half written
+            pages: Number of pages copied by every step
+            pause: Number of seconds paused between steps
+            max_restarts: Number of times the copy can be restarted by writes before
+                being copied in a single step
+
+        Returns:
+            The number of pages copied.
+        """
+
+        copied = 0
+        restarts = 0
+
+        def progress(status: int, remaining: int, total: int) -> None:
+            nonlocal copied, restarts
+
+            # A step that went through (`SQLITE_OK`) without copying more pages than
+            # before restarted the copy
+            if status == 0 and total - remaining <= copied:
+                restarts += 1
+                if restarts > max_restarts:
+                    raise _BackupRestarted()
+
+            copied = total - remaining
+
+            # Called between steps with the source unlocked, `sleep` below only
+            # applies to steps that found the database locked
+            if remaining:
+                time.sleep(pause)
+
+        partial = f"{target}.partial"
+        try:
+            with closing(self.__connect_reader(self.__db_instance)) as source, closing(
+                connect(partial)
+            ) as destination, self.metrics.timer(
+                "db_seconds", operation="backup", phase="execute"
+            ):
+                try:
+                    source.backup(
+                        destination, pages=pages, progress=progress, sleep=pause
+                    )
+                except _BackupRestarted:
+                    log.warning(
+                        "backup restarted by writes %d times, copying in one step",
+                        restarts,
+                    )
+                    source.backup(destination, pages=-1)
+                    (copied,) = source.execute("pragma page_count").fetchone()
+
+            os.replace(partial, target)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+            raise
+
+        log.info('backed up %d pages to "%s"', copied, target)
+        return copied
+
+    def changes(
+        self, since: int = 0, batch_size: int = 1000, *args: Any, **kwargs: Any
+    ) -> Optional[Iterator[Change]]:
+        # Checked upfront, the caller learns of a lost cursor before any change is read
+        with self.__reading("changes") as connection:
+            (horizon,) = connection.execute(self.__horizon_query).fetchone()
+
+        if since < horizon:
+            raise ValueError(
+                f"changes after {since} are no longer retained, the oldest change "
+                f"available follows {horizon}"
+            )
+
+        return self.__iter_changes(since, batch_size)
+
+    def __iter_changes(self, since: int, batch_size: int) -> Iterator[Change]:
+        # Read one batch at a time like `export_entries`, the sequence is the cursor
+        while True:
+            with self.__reading("changes") as connection:
+                rows = connection.execute(
+                    self.__changes_query, (since, batch_size)
+                ).fetchall()
+
+            yield from rows
+
+            if len(rows) < batch_size:
+                return
+
+            since = rows[-1][0]
+
+    def compact_changes(self) -> int:
+        """
+        Compacts the change log. Changes superseded by a later change to the same
+        email are dropped, applying the remaining changes leads to the same contacts.
+        Changes older than the retention period are dropped as well - consumers that
+        have not synced since are told to start over.
+
+        Returns:
+            The number of changes dropped.
+        """
+
+        dropped = 0
+        with self.__connection("compact_changes") as connection:
+            with self.metrics.timer(
+                "db_seconds", operation="compact_changes", phase="execute"
+            ):
+                if self.__change_retention is not None:
+                    cutoff = time.time() - self.__change_retention
+                    connection.execute(self.__advance_horizon_query, (cutoff,))
+                    dropped += connection.execute(self.__expire_changes_query).rowcount
+
+                dropped += connection.execute(self.__supersede_changes_query).rowcount
+                connection.commit()
+
+        log.debug("dropped %d changes from the change log", dropped)
+        return dropped
+
     def close(self) -> None:
-        pass
+        if self.__writer is not None:
+            self.__writer.close()
+
+        self.__read_pool.close()
+        self.__pool.close()
+        self.__cache.clear()
+
+    def stats(self) -> Dict[str, float]:
+        stats: Dict[str, float] = {
+            f"cache_{key}": value for key, value in self.__cache.stats.items()
+        }
+
+        lookups = stats["cache_hits"] + stats["cache_misses"]
+        stats["cache_hit_ratio"] = stats["cache_hits"] / lookups if lookups else 0.0
+        stats["pool_open_connections"] = self.__read_pool.open_connections
+        stats["pool_size"] = self.__read_pool.size
+        return stats
+
+    @property
+    def version(self) -> Optional[int]:
+        # Every write goes through the cache after committing, even if caching is off
+        return self.__cache.version
+
+    @property
+    def cache_stats(self) -> Dict[str, int]:
+        return self.__cache.stats
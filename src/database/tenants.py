@@ -0,0 +1,228 @@
+"""
+Defines the databases of tenants - every tenant has its own database, opened on first
+use. A bounded number of databases are kept open, the least recently used databases
+are closed beyond it (along with their connections and caches), as are databases left
+idle for too long.
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+import logging as log
+import re
+import time
+from collections import OrderedDict
+from itertools import count
+from threading import Event, Lock
+
+from .base_db import BaseDB
+
+# Tenant ids name files and directories, restricted to a safe set of characters
+TENANT_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+class _Tenant:
+    """
+    A database held open for a tenant, along with the number of requests using it.
+    """
+
+    __slots__ = ("database", "serial", "leases", "last_used", "ready")
+
+    def __init__(self):
+        self.database: Optional[BaseDB] = None
+        self.serial = 0
+        self.leases = 0
+        self.last_used = time.monotonic()
+
+        # Set once the database is open (or failed to open)
+        self.ready = Event()
+
+
+class TenantDatabases:
+    """
+    Keeps the databases of the most recently used tenants open. Databases are leased
+    to requests - a database in use is never closed, the number of open databases can
+    exceed `max_open` while all of them are in use.
+
+    Attributes:
+    -----------
+        stats: Dict[str, int]
+            Counters for databases found open (hits), opened (misses) and closed
+            (evictions), along with the number of databases open
+
+    Methods:
+    --------
+        acquire(str) -> Tuple[BaseDB, int]
+            Leases the database of a tenant, opening it if needed
+
+        release(str)
+            Returns the lease taken by `acquire`
+
+        close()
+            Closes all open databases
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], BaseDB],
+        max_open: int = 100,
+        idle_timeout: Optional[float] = None,
+    ):
+        """
+        Args:
+            factory: Callable opening the database of a tenant, given its id
+            max_open: Maximum number of databases kept open
+            idle_timeout: Number of seconds after which a database left unused is
+                closed, even below `max_open`. Kept open if None
+
+        Raises:
+            ValueError: If the maximum number of databases is not a positive integer
+        """
+
+        if max_open < 1:
+            raise ValueError(f"invalid number of open databases: {max_open}")
+
+        self.__factory = factory
+        self.__max_open = max_open
+        self.__idle_timeout = idle_timeout
+        self.__lock = Lock()
+
+        # Tenant id -> open database, least recently used first
+        self.__tenants: "OrderedDict[str, _Tenant]" = OrderedDict()
+
+        # Numbers databases across openings, a tenant opened again gets a new number
+        self.__serials = count(1)
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    def acquire(self, tenant: str) -> Tuple[BaseDB, int]:
+        """
+        Leases the database of a tenant, opening it if it is not open already. Only a
+        single request opens a database, concurrent requests for the same tenant
+        wait for it.
+
+        Args:
+            tenant: String containing the id of the tenant
+
+        Returns:
+            Tuple containing the database, and the number it was opened under - unique
+            across every database opened. `release` has to be called once done.
+
+        Raises:
+            ValueError: If the tenant id is invalid
+        """
+
+        if not TENANT_ID.fullmatch(tenant):
+            raise ValueError(f"invalid tenant id `{tenant}`")
+
+        while True:
+            with self.__lock:
+                entry = self.__tenants.get(tenant, None)
+                if entry is None:
+                    entry = self.__tenants[tenant] = _Tenant()
+                    self.__misses += 1
+                    break
+
+                if entry.database is not None:
+                    entry.leases += 1
+                    self.__tenants.move_to_end(tenant)
+                    self.__hits += 1
+                    return entry.database, entry.serial
+
+            # Being opened by another request
+            entry.ready.wait()
+
+        # Opened outside the lock, other tenants are served in the meantime
+        try:
+            database = self.__factory(tenant)
+        except Exception:
+            with self.__lock:
+                del self.__tenants[tenant]
+            entry.ready.set()
+            raise
+
+        log.debug("opened the database of tenant `%s`", tenant)
+        with self.__lock:
+            entry.database = database
+            entry.serial = next(self.__serials)
+            entry.leases = 1
+            evicted = self.__evict()
+
+        entry.ready.set()
+        self.__close(evicted)
+        return database, entry.serial
+
+    def release(self, tenant: str) -> None:
+        with self.__lock:
+            entry = self.__tenants[tenant]
+            entry.leases -= 1
+            entry.last_used = time.monotonic()
+            evicted = self.__evict()
+
+        self.__close(evicted)
+
+    def __evict(self) -> List[Tuple[str, BaseDB]]:
+        """
+        Picks the databases to be closed, has to be called with the lock held.
+
+        Returns:
+            List of tuples containing the tenant id and the database to be closed,
+            removed from the open databases already.
+        """
+
+        now = time.monotonic()
+        excess = len(self.__tenants) - self.__max_open
+        evicted = []
+        for tenant, entry in list(self.__tenants.items()):
+            if entry.database is None or entry.leases:
+                continue
+
+            idle = (
+                self.__idle_timeout is not None
+                and now - entry.last_used >= self.__idle_timeout
+            )
+            if excess <= 0 and not idle:
+                # Tenants are ordered by their last use, the rest are newer
+                if self.__idle_timeout is None:
+                    break
+
+                continue
+
+            del self.__tenants[tenant]
+            evicted.append((tenant, entry.database))
+            excess -= 1
+
+        self.__evictions += len(evicted)
+        return evicted
+
+    @staticmethod
+    def __close(evicted: List[Tuple[str, BaseDB]]) -> None:
+        for tenant, database in evicted:
+            log.debug("closing the database of tenant `%s`", tenant)
+            try:
+                database.close()
+            except Exception as e:
+                log.warning("failed to close the database of tenant `%s`", tenant)
+                log.warning("exception type: %s\n%s", type(e), e)
+
+    def close(self) -> None:
+        with self.__lock:
+            evicted = [
+                (tenant, entry.database)
+                for tenant, entry in self.__tenants.items()
+                if entry.database is not None
+            ]
+            self.__tenants.clear()
+
+        self.__close(evicted)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self.__lock:
+            return {
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "evictions": self.__evictions,
+                "open": sum(e.database is not None for e in self.__tenants.values()),
+            }
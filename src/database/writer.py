@@ -0,0 +1,164 @@
+"""
+Defines a single-writer queue for SQLite. Writes submitted concurrently by multiple
+threads are coalesced into a single transaction (group commit), paying for one fsync
+per group instead of one per write.
+"""
+
+from typing import Any, Callable, List, Optional, Tuple
+
+import logging as log
+from concurrent.futures import Future
+from queue import Empty, Queue
+from sqlite3 import Connection, Error
+from threading import Thread
+
+# A write operation, executed with the writer connection inside a transaction. Should
+# not commit on its own.
+Operation = Callable[[Connection], Any]
+
+
+class GroupCommitWriter:
+    """
+    Runs write operations on a dedicated thread and connection. Pending operations
+    are executed back-to-back in a single transaction, each inside its own savepoint -
+    a failing operation is rolled back without affecting the rest of the group.
+
+    Methods:
+    --------
+        submit(Operation) -> Future
+            Queues an operation, the future resolves once its group is committed
+
+        execute(Operation) -> Any
+            Queues an operation and waits for its result
+
+        close()
+            Completes pending operations, and stops the writer
+    """
+
+    def __init__(self, connection: Connection, max_batch: int = 100):
+        """
+        Args:
+            connection: Connection used for all writes, owned by the writer from here
+                on. Must allow being used from a different thread
+            max_batch: Maximum number of operations committed together
+        """
+
+        self.__connection = connection
+        self.__max_batch = max_batch
+        self.__queue: "Queue[Optional[Tuple[Operation, Future]]]" = Queue()
+
+        self.__thread = Thread(target=self.__run, name="sqlite-writer", daemon=True)
+        self.__thread.start()
+
+    def submit(self, operation: Operation) -> "Future[Any]":
+        """
+        Queues an operation to be executed by the writer.
+
+        Args:
+            operation: Callable accepting the connection, and returning the result
+
+        Returns:
+            A future holding the result of the operation, set only once the
+            transaction containing the operation has been committed.
+
+        Raises:
+            RuntimeError: If the writer has been closed
+        """
+
+        if not self.__thread.is_alive():
+            raise RuntimeError("cannot submit writes to a closed writer")
+
+        future: "Future[Any]" = Future()
+        self.__queue.put((operation, future))
+        return future
+
+    def execute(self, operation: Operation) -> Any:
+        """
+        Queues an operation, and blocks till its result is available.
+
+        Args:
+            operation: Callable accepting the connection, and returning the result
+
+        Returns:
+            The value returned by the operation.
+        """
+
+        return self.submit(operation).result()
+
+    def __run(self) -> None:
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                break
+
+            # Pick up whatever else is waiting, without waiting for more to arrive
+            batch = [item]
+            stop = False
+            while len(batch) < self.__max_batch:
+                try:
+                    item = self.__queue.get_nowait()
+                except Empty:
+                    break
+
+                if item is None:
+                    stop = True
+                    break
+
+                batch.append(item)
+
+            self.__commit(batch)
+            if stop:
+                break
+
+        self.__connection.close()
+
+    def __commit(self, batch: List[Tuple[Operation, "Future[Any]"]]) -> None:
+        connection = self.__connection
+        results: List[Tuple["Future[Any]", Any, Optional[BaseException]]] = []
+
+        try:
+            connection.execute("begin immediate")
+            for operation, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                connection.execute("savepoint operation")
+                try:
+                    results.append((future, operation(connection), None))
+                except Exception as e:
+                    connection.execute("rollback to operation")
+                    results.append((future, None, e))
+                finally:
+                    connection.execute("release operation")
+
+            connection.commit()
+        except Error as e:
+            # The transaction as a whole failed, none of the operations went through
+            log.warning("failed to commit a group of %d writes", len(batch))
+            log.warning("exception type: %s\n%s", type(e), e)
+            try:
+                connection.rollback()
+            except Error:
+                pass
+
+            # Including operations never started, `begin` itself may have failed
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result, exception in results:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+    def close(self) -> None:
+        """
+        Stops accepting new operations, waits for the queued operations to be
+        committed, and closes the connection.
+        """
+
+        if self.__thread.is_alive():
+            self.__queue.put(None)
+            self.__thread.join()
@@ -0,0 +1,221 @@
+"""
+Defines the limits protecting the database from overload - a token bucket rate limiter
+applied per client and route, and an admission controller bounding the number of
+requests working on the database at a time. Requests beyond the limits are rejected
+right away, instead of queueing on database locks till clients time out.
+"""
+
+from typing import Dict, Hashable, Optional, Tuple
+
+import time
+from collections import OrderedDict
+from threading import Condition, Lock
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter, with a bucket for every client and route. Buckets hold
+    up to `burst` tokens and are refilled at `rate` tokens per second, every request
+    takes a token - requests finding an empty bucket are rejected.
+
+    Attributes:
+    -----------
+        stats: Dict[str, int]
+            Counters for requests allowed and limited, along with the number of buckets
+
+    Methods:
+    --------
+        check(str, str) -> float
+            Takes a token from the bucket of a client and route, returns the number of
+            seconds to wait before retrying if the bucket is empty
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        routes: Optional[Dict[str, float]] = None,
+        max_buckets: int = 10000,
+    ):
+        """
+        Args:
+            rate: Number of requests allowed per second for every client and route
+            burst: Number of requests a client can send at once, after being idle
+            routes: Dictionary mapping routes to their own rate, overriding `rate`. A
+                rate of zero leaves the route unlimited
+            max_buckets: Maximum number of buckets kept, buckets of the least recently
+                seen clients are dropped (refilling them) beyond this
+
+        Raises:
+            ValueError: If the burst is smaller than a single request
+        """
+
+        if burst < 1:
+            raise ValueError(f"invalid burst size: {burst}")
+
+        self.__rate = rate
+        self.__burst = float(burst)
+        self.__routes = routes or {}
+        self.__max_buckets = max_buckets
+        self.__lock = Lock()
+
+        # (client, route) -> (tokens, time of the last refill)
+        self.__buckets: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()
+
+        self.__allowed = 0
+        self.__limited = 0
+
+    def check(self, client: str, route: str) -> float:
+        """
+        Takes a token from the bucket of a client and route.
+
+        Args:
+            client: String identifying the client, for example, its address
+            route: String containing the route being requested
+
+        Returns:
+            Zero if the request is allowed, the number of seconds till the bucket
+            holds a token otherwise.
+        """
+
+        rate = self.__routes.get(route, self.__rate)
+        if rate <= 0:
+            return 0.0
+
+        key = (client, route)
+        now = time.monotonic()
+        with self.__lock:
+            tokens, updated = self.__buckets.pop(key, (self.__burst, now))
+            tokens = min(self.__burst, tokens + (now - updated) * rate)
+
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+                self.__allowed += 1
+            else:
+                wait = (1 - tokens) / rate
+                self.__limited += 1
+
+            self.__buckets[key] = (tokens, now)
+            if len(self.__buckets) > self.__max_buckets:
+                self.__buckets.popitem(last=False)
+
+            return wait
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self.__lock:
+            return {
+                "allowed": self.__allowed,
+                "limited": self.__limited,
+                "buckets": len(self.__buckets),
+            }
+
+
+class AdmissionController:
+    """
+    Bounds the number of requests working on the database at a time. Requests beyond
+    `max_in_flight` wait for a slot in a queue of `max_queued` requests - requests
+    finding the queue full, or waiting longer than `timeout` seconds, are rejected.
+
+    Attributes:
+    -----------
+        max_queued: int
+            Maximum number of requests waiting for a slot
+
+        stats: Dict[str, int]
+            Counters for requests admitted, rejected (queue full) and timed out, along
+            with the number of requests currently in flight and queued
+
+    Methods:
+    --------
+        acquire() -> bool
+            Waits for a slot, returns false if the request should be rejected
+
+        release()
+            Frees the slot taken by `acquire`
+    """
+
+    def __init__(self, max_in_flight: int, max_queued: int = 0, timeout: float = 1.0):
+        """
+        Args:
+            max_in_flight: Maximum number of requests working on the database at a
+                time. Should not be greater than the size of the connection pool
+            max_queued: Maximum number of requests waiting for a slot, requests are
+                rejected right away if zero
+            timeout: Number of seconds a request waits for a slot before being rejected
+
+        Raises:
+            ValueError: If the number of requests in flight is not a positive integer
+        """
+
+        if max_in_flight < 1:
+            raise ValueError(f"invalid number of requests in flight: {max_in_flight}")
+
+        self.__max_in_flight = max_in_flight
+        self.__max_queued = max_queued
+        self.__timeout = timeout
+        self.__condition = Condition(Lock())
+
+        self.__in_flight = 0
+        self.__queued = 0
+        self.__admitted = 0
+        self.__rejected = 0
+        self.__timed_out = 0
+
+    def acquire(self) -> bool:
+        """
+        Takes a slot, waiting in the queue if all slots are taken.
+
+        Returns:
+            Boolean indicating if the request was admitted, `release` has to be called
+            once done if so.
+        """
+
+        with self.__condition:
+            if self.__in_flight >= self.__max_in_flight:
+                if self.__queued >= self.__max_queued:
+                    self.__rejected += 1
+                    return False
+
+                self.__queued += 1
+                try:
+                    admitted = self.__condition.wait_for(
+                        lambda: self.__in_flight < self.__max_in_flight,
+                        timeout=self.__timeout,
+                    )
+                finally:
+                    self.__queued -= 1
+
+                if not admitted:
+                    self.__timed_out += 1
+                    return False
+
+            self.__in_flight += 1
+            self.__admitted += 1
+            return True
+
+    def release(self) -> None:
+        with self.__condition:
+            self.__in_flight -= 1
+            self.__condition.notify()
+
+    @property
+    def max_queued(self) -> int:
+        return self.__max_queued
+
+    @property
+    def retry_after(self) -> float:
+        # Rejected requests are asked to wait as long as a queued request would have
+        return self.__timeout
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self.__condition:
+            return {
+                "admitted": self.__admitted,
+                "rejected": self.__rejected,
+                "timed_out": self.__timed_out,
+                "in_flight": self.__in_flight,
+                "queued": self.__queued,
+            }
@@ -0,0 +1,139 @@
+"""
+Defines the logging pipeline of the application. Records are put on an in-memory queue
+by the threads logging them, and written to the console and the (rotating) log file by
+a single background thread - a slow disk never blocks a request.
+"""
+
+from typing import List, Optional
+
+import atexit
+import logging as log
+import queue
+from itertools import count
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FORMAT = "%(asctime)s [%(threadName)-12.12s] [%(levelname)-5.5s]  %(message)s"
+
+# Debug records logged through a `DebugSampler` are kept once every `_sample_every`
+# calls, set through `configure_logging`
+_sample_every = 100
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+
+
+class DebugSampler:
+    """
+    Decides which debug records of a hot path are logged, keeping the first record and
+    one of every `every` records after it. Used as a guard around the logging call,
+    skipped records cost a single counter increment;
+
+        if sampler.sample():
+            log.debug("served %d rows", len(rows))
+
+    Attributes:
+    -----------
+        every: Optional[int]
+            Number of calls per logged record, falls back to the value set through
+            `configure_logging` if absent
+    """
+
+    def __init__(self, every: Optional[int] = None):
+        self.every = every
+        self.__calls = count()
+
+    def sample(self) -> bool:
+        """
+        Returns:
+            Boolean indicating if the record should be logged, always false if debug
+            logging is disabled.
+        """
+
+        if not log.getLogger().isEnabledFor(log.DEBUG):
+            return False
+
+        return next(self.__calls) % (self.every or _sample_every) == 0
+
+
+def configure_logging(
+    log_file: Optional[str],
+    debug_mode: bool = False,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    sample_every: int = 100,
+) -> QueueListener:
+    """
+    Configures the root logger to log to the console, and to the log file, through a
+    queue drained by a background thread. Replaces the pipeline set up by a previous
+    call, flushing any records still queued.
+
+    Remarks:
+        Every process sets up its own pipeline, the log file should not be rotated
+        by multiple processes - leave rotation to an external tool (by setting
+        `max_bytes` to zero) when running multiple workers.
+
+    Args:
+        log_file: String containing full path to the log file, logs are only written
+            to the console if absent
+        debug_mode: Boolean indicating if debug records are to be logged
+        max_bytes: Size in bytes after which the log file is rotated, never rotated if
+            zero
+        backup_count: Number of rotated log files kept around
+        sample_every: Debug records logged through a `DebugSampler` are kept once
+            every `sample_every` calls
+
+    Returns:
+        The listener writing queued records, stopped automatically on exit.
+    """
+
+    global _listener, _queue_handler, _sample_every
+
+    root = log.getLogger()
+    root.setLevel(log.DEBUG if debug_mode else log.INFO)
+    _sample_every = max(sample_every, 1)
+
+    stop_logging()
+
+    formatter = log.Formatter(LOG_FORMAT)
+    handlers: List[log.Handler] = [log.StreamHandler()]
+    if log_file is not None:
+        # Opened lazily, creating the pipeline does not touch the disk
+        handlers.append(
+            RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count, delay=True
+            )
+        )
+
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records: "queue.SimpleQueue[log.LogRecord]" = queue.SimpleQueue()
+    _queue_handler = QueueHandler(records)
+    _listener = QueueListener(records, *handlers, respect_handler_level=True)
+
+    root.addHandler(_queue_handler)
+    _listener.start()
+    return _listener
+
+
+def stop_logging() -> None:
+    """
+    Stops the background thread after writing any records still queued, and detaches
+    the pipeline from the root logger. Does nothing if logging is not configured.
+    """
+
+    global _listener, _queue_handler
+
+    if _queue_handler is not None:
+        log.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,255 @@
+"""
+Defines a minimal metrics registry - histograms and gauges, rendered in the
+Prometheus text format. A disabled registry hands out no-op timers, keeping the cost
+of instrumentation negligible when metrics are not being collected.
+"""
+
+from typing import Callable, ContextManager, Dict, Iterable, List, Tuple
+
+import time
+from bisect import bisect_left
+from threading import Lock
+
+# Labels attached to a sample, stored as sorted key-value pairs
+Labels = Tuple[Tuple[str, str], ...]
+
+# A sample reported by a collector - name, labels and value
+Sample = Tuple[str, Dict[str, str], float]
+
+# Upper bounds of the buckets used for latencies, in seconds
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# Upper bounds of the buckets used for counting rows
+ROW_BUCKETS: Tuple[float, ...] = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+
+class _Histogram:
+    """
+    Cumulative histogram for a single set of labels.
+    """
+
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last bucket is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class _Timer:
+    """
+    Context manager observing the time spent inside the block.
+    """
+
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics: "Metrics", name: str, labels: Dict[str, str]):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+class _NullTimer:
+    """
+    Timer handed out by a disabled registry, does nothing.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    Thread-safe registry of metrics. Every method is a no-op while the registry is
+    disabled.
+
+    Attributes:
+    -----------
+        enabled: bool
+            Boolean indicating if metrics are being collected
+
+    Methods:
+    --------
+        timer(str, **str) -> ContextManager
+            Times the enclosed block, observing the duration in a latency histogram
+
+        observe(str, float, **str)
+            Observes a value in a histogram
+
+        add_collector(Callable[[], Iterable[Sample]])
+            Registers a callable reporting samples (gauges) while rendering
+
+        render() -> str
+            Renders all metrics in the Prometheus text format
+    """
+
+    def __init__(self, enabled: bool = False, prefix: str = "fast_track"):
+        """
+        Args:
+            enabled: Boolean indicating if metrics should be collected
+            prefix: String prepended to the name of every metric
+        """
+
+        self.enabled = enabled
+        self.__prefix = prefix
+        self.__lock = Lock()
+
+        self.__histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self.__buckets: Dict[str, Tuple[float, ...]] = {}
+        self.__collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def register_histogram(self, name: str, buckets: Tuple[float, ...]) -> None:
+        """
+        Sets the buckets used by a histogram, histograms default to latency buckets.
+
+        Args:
+            name: Name of the histogram
+            buckets: Tuple containing sorted upper bounds of the buckets
+        """
+
+        self.__buckets[name] = buckets
+
+    def timer(self, name: str, **labels: str) -> ContextManager:
+        """
+        Times the enclosed block.
+
+        Args:
+            name: Name of the histogram, conventionally ending in `_seconds`
+            **labels: Labels attached to the observation
+
+        Returns:
+            Context manager timing the block, a shared no-op when disabled.
+        """
+
+        if not self.enabled:
+            return _NULL_TIMER
+
+        return _Timer(self, name, labels)
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """
+        Observes a value in a histogram.
+
+        Args:
+            name: Name of the histogram
+            value: The value to be observed
+            **labels: Labels attached to the observation
+        """
+
+        if not self.enabled:
+            return
+
+        key = tuple(sorted(labels.items()))
+        with self.__lock:
+            series = self.__histograms.setdefault(name, {})
+            histogram = series.get(key, None)
+            if histogram is None:
+                histogram = series[key] = _Histogram(
+                    self.__buckets.get(name, LATENCY_BUCKETS)
+                )
+
+            histogram.observe(value)
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        """
+        Registers a callable that reports samples when the metrics are rendered, used
+        for values tracked elsewhere (cache statistics, pool sizes, etc).
+
+        Args:
+            collector: Callable returning an iterable of samples
+        """
+
+        self.__collectors.append(collector)
+
+    @staticmethod
+    def __format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+        pairs = [
+            '{}="{}"'.format(
+                key,
+                str(value)
+                .replace("\\", "\\\\")
+                .replace('"', '\\"')
+                .replace("\n", "\\n"),
+            )
+            for key, value in labels
+        ]
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> str:
+        """
+        Renders all metrics in the Prometheus text exposition format.
+
+        Returns:
+            String containing the rendered metrics.
+        """
+
+        lines: List[str] = []
+        with self.__lock:
+            for name, series in sorted(self.__histograms.items()):
+                name = f"{self.__prefix}_{name}"
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    bounds = [str(bound) for bound in histogram.buckets] + ["+Inf"]
+                    for bound, count in zip(bounds, histogram.counts):
+                        cumulative += count
+                        labels = self.__format_labels(key + (("le", bound),))
+                        lines.append(f"{name}_bucket{labels} {cumulative}")
+
+                    labels = self.__format_labels(key)
+                    lines.append(f"{name}_sum{labels} {histogram.total}")
+                    lines.append(f"{name}_count{labels} {histogram.count}")
+
+        gauges: Dict[str, List[str]] = {}
+        for collector in self.__collectors:
+            for name, labels, value in collector():
+                name = f"{self.__prefix}_{name}"
+                formatted = self.__format_labels(sorted(labels.items()))
+                gauges.setdefault(name, []).append(f"{name}{formatted} {value}")
+
+        for name, samples in sorted(gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(samples)
+
+        return "\n".join(lines) + "\n"
+
+
+# Shared, permanently disabled registry - used when no registry is supplied
+NULL_METRICS = Metrics(enabled=False)
@@ -2,4 +2,13 @@
 Package containing basic objects being used in the rest of the application.
 """
 
-from .contact import Contact
+from .contact import Contact, Row, normalize_phone
+from .serializer import (
+    Change,
+    dump_keyed_rows,
+    dump_row,
+    dump_rows,
+    iter_changes,
+    iter_json_array,
+    iter_ndjson,
+)
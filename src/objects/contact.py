@@ -2,10 +2,38 @@
 Defines base contact class.
 """
 
-from typing import Dict
+from typing import Any, Dict, Tuple
 
+import re
 from json import dumps as prettify_json
 
+# A contact as stored in the database - email, name and phone number, in that order
+Row = Tuple[str, str, str]
+
+_NON_DIGITS = re.compile(r"[^0-9]")
+
+
+def normalize_phone(phone: Any) -> str:
+    """
+    Normalizes a phone number into the form it is indexed (and looked up) by - only
+    its digits are kept, along with a leading `+` marking an international (E.164)
+    number. For example, both `+1 (555) 010-0199` and `+1.555.010.0199` are
+    normalized to `+15550100199`.
+
+    Args:
+        phone: The phone number, as entered
+
+    Returns:
+        String containing the normalized phone number, empty if it has no digits.
+    """
+
+    phone = str(phone).strip()
+    digits = _NON_DIGITS.sub("", phone)
+    if digits and phone.startswith("+"):
+        return f"+{digits}"
+
+    return digits
+
 
 class Contact:
     """
@@ -25,11 +53,18 @@ class Contact:
 
     Methods:
     --------
+        from_row(Row) -> Contact
+            Creates a contact from a row fetched from the database
+
         stringify(int) -> str
             Returns a JSON string representation of the data held by the class instance
             with required indentation.
     """
 
+    # Slots instead of a `__dict__`, a contact is created for every row returned by a
+    # search, keeping them small matters for large results.
+    __slots__ = ("email", "name", "phone_number")
+
     def __init__(self, name: str, email: str, phone_number: str):
         """
         Args:
@@ -42,10 +77,33 @@ class Contact:
         self.email = email
         self.phone_number = phone_number
 
+    @classmethod
+    def from_row(cls, row: Row) -> "Contact":
+        """
+        Creates a contact from a row fetched from the database.
+
+        Args:
+            row: Tuple containing the email, name and phone number of the contact
+
+        Returns:
+            The new contact.
+        """
+
+        return cls(email=row[0], name=row[1], phone_number=row[2])
+
+    def to_row(self) -> Row:
+        """
+        Converts the contact into a row, as stored in the database.
+
+        Returns:
+            Tuple containing the email, name and phone number of the contact.
+        """
+
+        return self.email, self.name, self.phone_number
+
     def stringify(self, indent: int = 4) -> str:
         """
-        A simple attribute to convert the class into a JSON string. Private variables,
-        and methods are ignored.
+        A simple attribute to convert the class into a JSON string.
 
         Args:
             indent: Integer containing the number of indents required. Use zero for a
@@ -56,11 +114,7 @@ class Contact:
         """
 
         return prettify_json(
-            obj={
-                key: value
-                for key, value in self.__dict__.items()
-                if not key.startswith("_") and not callable(key)
-            },
+            obj=self.encode(),
             indent=indent if indent != 0 else None,
             sort_keys=True,
         )
@@ -77,9 +131,9 @@ class Contact:
         """
 
         return {
-            key: value
-            for key, value in self.__dict__.items()
-            if not key.startswith("_") and not callable(key)
+            "email": self.email,
+            "name": self.name,
+            "phone_number": self.phone_number,
         }
 
     def __str__(self) -> str:
@@ -0,0 +1,171 @@
+"""
+Defines fast serializers turning rows fetched from the database straight into JSON,
+without creating a `Contact` for every row. Uses orjson when installed, falling back
+to the standard library otherwise.
+"""
+
+from typing import Any, Iterable, Iterator, Mapping, Optional, Tuple
+
+from json import dumps
+from json.encoder import encode_basestring_ascii as _quote
+
+from .contact import Row
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+# Entry of the change log - sequence number, operation (`put` or `delete`), email,
+# followed by the name and phone number (None for deletes)
+Change = Tuple[int, str, str, Optional[str], Optional[str]]
+
+# Template for a single row, fields in the same order as `Contact.encode`
+_TEMPLATE = '{"email":%s,"name":%s,"phone_number":%s}'
+
+_CHANGE_TEMPLATE = '{"seq":%d,"op":%s,"email":%s,"name":%s,"phone_number":%s}'
+
+
+def _value(value: Any) -> str:
+    # Values can be non-string (e.g. integers stored as phone numbers)
+    return _quote(value) if isinstance(value, str) else dumps(value)
+
+
+def _dump_row(row: Row) -> str:
+    return _TEMPLATE % (_value(row[0]), _value(row[1]), _value(row[2]))
+
+
+def dump_rows(rows: Iterable[Row]) -> bytes:
+    """
+    Serializes rows into a JSON array of contacts.
+
+    Args:
+        rows: Iterable containing rows of email, name and phone number
+
+    Returns:
+        UTF-8 encoded JSON array, identical in structure to a list of encoded
+        contacts.
+    """
+
+    if orjson is not None:
+        # Short-lived dictionaries are cheaper than formatting strings in Python
+        return orjson.dumps(
+            [{"email": e, "name": n, "phone_number": p} for e, n, p in rows]
+        )
+
+    return ("[" + ",".join([_dump_row(row) for row in rows]) + "]").encode("utf-8")
+
+
+def dump_row(row: Row) -> bytes:
+    """
+    Serializes a single row into a JSON object.
+
+    Args:
+        row: Tuple containing the email, name and phone number of a contact
+
+    Returns:
+        UTF-8 encoded JSON object.
+    """
+
+    if orjson is not None:
+        return orjson.dumps({"email": row[0], "name": row[1], "phone_number": row[2]})
+
+    return _dump_row(row).encode("utf-8")
+
+
+def dump_keyed_rows(rows: Mapping[str, Optional[Row]]) -> bytes:
+    """
+    Serializes rows into a JSON object keyed by email.
+
+    Args:
+        rows: Mapping of emails to their rows, None for emails that were not found
+
+    Returns:
+        UTF-8 encoded JSON object, emails that were not found map to `null`.
+    """
+
+    if orjson is not None:
+        return orjson.dumps(
+            {
+                key: (
+                    None
+                    if row is None
+                    else {"email": row[0], "name": row[1], "phone_number": row[2]}
+                )
+                for key, row in rows.items()
+            }
+        )
+
+    return (
+        "{"
+        + ",".join(
+            [
+                _value(key) + ":" + ("null" if row is None else _dump_row(row))
+                for key, row in rows.items()
+            ]
+        )
+        + "}"
+    ).encode("utf-8")
+
+
+def iter_json_array(rows: Iterable[Row]) -> Iterator[bytes]:
+    """
+    Serializes rows into a JSON array one row at a time, for streaming responses.
+
+    Args:
+        rows: Iterable containing rows of email, name and phone number
+
+    Yields:
+        Chunks of the UTF-8 encoded JSON array.
+    """
+
+    yield b"["
+    for index, row in enumerate(rows):
+        yield (b"," if index else b"") + dump_row(row)
+    yield b"]"
+
+
+def iter_ndjson(rows: Iterable[Row]) -> Iterator[bytes]:
+    """
+    Serializes rows into newline delimited JSON, one line per row.
+
+    Args:
+        rows: Iterable containing rows of email, name and phone number
+
+    Yields:
+        UTF-8 encoded JSON objects, each followed by a newline.
+    """
+
+    for row in rows:
+        yield dump_row(row) + b"\n"
+
+
+def iter_changes(changes: Iterable[Change]) -> Iterator[bytes]:
+    """
+    Serializes entries of the change log into newline delimited JSON, one line per
+    change.
+
+    Args:
+        changes: Iterable containing entries of the change log
+
+    Yields:
+        UTF-8 encoded JSON objects, each followed by a newline.
+    """
+
+    for seq, op, email, name, phone in changes:
+        if orjson is not None:
+            yield orjson.dumps(
+                {
+                    "seq": seq,
+                    "op": op,
+                    "email": email,
+                    "name": name,
+                    "phone_number": phone,
+                }
+            ) + b"\n"
+        else:
+            yield (
+                _CHANGE_TEMPLATE
+                % (seq, _value(op), _value(email), _value(name), _value(phone))
+                + "\n"
+            ).encode("utf-8")
@@ -0,0 +1,314 @@
+"""
+Defines a pre-forking launcher, used to serve the application from multiple worker
+processes sharing a single listening socket. Each worker builds its own instance of
+the application (and with it, its own database connections) after being forked.
+"""
+
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import logging as log
+import os
+import signal
+import socket
+import time
+from threading import Lock, Thread
+
+from .logger import stop_logging
+
+# Builds the application inside a worker, called once per worker after the fork
+AppFactory = Callable[[], Any]
+
+# Workers failing within this many seconds of being started are taken to have failed
+# to boot, replaced after a delay doubling with every consecutive failure (up to the
+# maximum) - the server shuts down after `MAX_FAILED_BOOTS` consecutive failures
+BOOT_TIMEOUT = 5.0
+MAX_RESPAWN_DELAY = 30.0
+MAX_FAILED_BOOTS = 10
+
+
+class PreforkServer:
+    """
+    Pre-forking server. The master process binds the socket and supervises the
+    workers - replacing workers that exit, and forwarding signals to them.
+
+    Signals handled by the master process:
+        SIGTERM, SIGINT: Graceful shutdown, workers finish in-flight requests
+        SIGHUP: Graceful reload, a fresh set of workers is started before the old
+            workers are asked to shut down
+
+    Methods:
+    --------
+        serve_forever()
+            Starts the workers, and supervises them till the server is shut down
+    """
+
+    def __init__(
+        self,
+        app_factory: AppFactory,
+        *,
+        host: str = "127.0.0.1",
+        port: int = 5000,
+        workers: Optional[int] = None,
+        max_requests: int = 0,
+        graceful_timeout: float = 30.0,
+        asgi: bool = False,
+        on_exit: Optional[Callable[[], None]] = None,
+    ):
+        """
+        Args:
+            app_factory: Callable returning the application to be served by a worker
+            host: String containing the address to bind to
+            port: Port to listen on
+            workers: Number of worker processes, defaults to the number of cores
+            max_requests: Number of requests a worker serves before being replaced,
+                bounds the memory growth of long-running workers. Zero to disable
+            graceful_timeout: Number of seconds workers are given to finish in-flight
+                requests before being killed
+            asgi: Boolean indicating if the application is an ASGI application, served
+                through uvicorn. Defaults to a WSGI application
+            on_exit: Callable run inside a worker once it stops serving, before it
+                exits - for example, to close the database
+        """
+
+        self.__app_factory = app_factory
+        self.__address = (host, port)
+        self.__workers = workers or os.cpu_count() or 1
+        self.__max_requests = max_requests
+        self.__graceful_timeout = graceful_timeout
+        self.__asgi = asgi
+        self.__on_exit = on_exit
+
+        self.__socket: Optional[socket.socket] = None
+        self.__children: Dict[int, float] = {}  # pid -> time the worker was started
+        self.__retiring: Dict[int, float] = {}  # pid -> time the worker was stopped
+
+        self.__running = False
+        self.__reload = False
+
+        # Consecutive workers that failed to boot, and the time before which no worker
+        # is started
+        self.__failed_boots = 0
+        self.__spawn_after = 0.0
+
+    def serve_forever(self) -> None:
+        """
+        Binds the socket, starts the workers, and supervises them till a shutdown
+        signal is received.
+        """
+
+        self.__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__socket.bind(self.__address)
+        self.__socket.listen(2048)
+
+        # All workers are woken up for every new connection, only one of them gets to
+        # accept it - the rest should not be left blocked in `accept`.
+        self.__socket.setblocking(False)
+        self.__socket.set_inheritable(True)
+        log.info("serving on %s:%d with %d workers", *self.__address, self.__workers)
+
+        self.__running = True
+        signal.signal(signal.SIGTERM, self.__on_shutdown)
+        signal.signal(signal.SIGINT, self.__on_shutdown)
+        signal.signal(signal.SIGHUP, self.__on_reload)
+
+        try:
+            self.__supervise()
+        finally:
+            self.__stop_workers(list(self.__children))
+            self.__reap(block=True)
+            self.__socket.close()
+            log.info("server shut down")
+
+    def __on_shutdown(self, signum: int, frame: Any) -> None:
+        self.__running = False
+
+    def __on_reload(self, signum: int, frame: Any) -> None:
+        self.__reload = True
+
+    def __supervise(self) -> None:
+        while self.__running:
+            if self.__reload:
+                self.__reload = False
+                log.info("reloading workers")
+
+                # Start the new workers before retiring the old ones, the socket is
+                # never left without anyone accepting connections.
+                old_workers = list(self.__children)
+                for _ in range(self.__workers):
+                    self.__spawn()
+                self.__stop_workers(old_workers)
+
+            while (
+                len(self.__children) < self.__workers
+                and time.monotonic() >= self.__spawn_after
+            ):
+                self.__spawn()
+
+            self.__reap(block=False)
+            time.sleep(0.1)
+
+    def __spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover - runs in the child process
+            code = 0
+            try:
+                self.__run_worker()
+            except BaseException as e:
+                log.error("worker %d crashed: %s\n%s", os.getpid(), type(e), e)
+                code = 1
+            finally:
+                # `os._exit` skips the exit handlers, queued log records would be lost
+                stop_logging()
+                os._exit(code)
+
+        self.__children[pid] = time.monotonic()
+        log.debug("started worker %d", pid)
+
+    def __stop_workers(self, pids: Iterable[int]) -> None:
+        for pid in pids:
+            self.__children.pop(pid, None)
+            self.__retiring[pid] = time.monotonic()
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.__retiring.pop(pid, None)
+
+    def __reap(self, block: bool) -> None:
+        """
+        Collects exited workers. Workers that exit on their own are replaced by the
+        supervisor loop, workers that do not stop within the graceful timeout are
+        killed.
+
+        Args:
+            block: Boolean indicating if the call should wait till all retiring
+                workers have exited
+        """
+
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.__children.clear()
+                self.__retiring.clear()
+                return
+
+            if pid == 0:
+                now = time.monotonic()
+                for retiring, since in list(self.__retiring.items()):
+                    if now - since > self.__graceful_timeout:
+                        log.warning("worker %d did not exit in time, killing", retiring)
+                        try:
+                            os.kill(retiring, signal.SIGKILL)
+                        except ProcessLookupError:
+                            pass
+
+                if not block or not self.__retiring:
+                    return
+
+                time.sleep(0.1)
+                continue
+
+            self.__retiring.pop(pid, None)
+            started = self.__children.pop(pid, None)
+            if started is not None:
+                self.__on_worker_exit(pid, status, started)
+
+    def __on_worker_exit(self, pid: int, status: int, started: float) -> None:
+        """
+        Schedules the replacement of a worker that exited on its own. Workers failing
+        to boot are replaced after a growing delay, the server is shut down if they
+        keep failing.
+
+        Args:
+            pid: Process id of the worker
+            status: Exit status of the worker, as returned by `os.waitpid`
+            started: Time the worker was started at
+        """
+
+        now = time.monotonic()
+        if status == 0 or now - started >= BOOT_TIMEOUT:
+            self.__failed_boots = 0
+            log.info("worker %d exited with status %d, replacing it", pid, status)
+            return
+
+        self.__failed_boots += 1
+        if self.__failed_boots >= MAX_FAILED_BOOTS:
+            log.error(
+                "%d workers in a row failed to boot, shutting down", self.__failed_boots
+            )
+            self.__running = False
+            return
+
+        delay = min(0.1 * 2**self.__failed_boots, MAX_RESPAWN_DELAY)
+        self.__spawn_after = now + delay
+        log.warning(
+            "worker %d failed to boot (status %d), replacing it in %.1f seconds",
+            pid,
+            status,
+            delay,
+        )
+
+    def __run_worker(self) -> None:  # pragma: no cover - runs in the child process
+        # Reset the signal handlers inherited from the master process
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, signal.SIG_DFL)
+
+        # Build the application only after forking, no database handles are shared
+        # between processes.
+        app = self.__app_factory()
+
+        try:
+            if self.__asgi:
+                import uvicorn
+
+                uvicorn.run(
+                    app,
+                    fd=self.__socket.fileno(),
+                    limit_max_requests=self.__max_requests or None,
+                    timeout_graceful_shutdown=int(self.__graceful_timeout),
+                    log_level="warning",
+                )
+            else:
+                self.__serve_wsgi(app)
+        finally:
+            if self.__on_exit is not None:
+                self.__on_exit()
+
+    def __serve_wsgi(self, app: Any) -> None:  # pragma: no cover - child process
+        from werkzeug.serving import make_server
+
+        lock = Lock()
+        served = 0
+
+        def shutdown() -> None:
+            # Has to run on a separate thread, blocks till the server loop exits
+            Thread(target=server.shutdown, daemon=True).start()
+
+        def counting_app(environ: Dict[str, Any], start_response: Any) -> Any:
+            nonlocal served
+            with lock:
+                served += 1
+                recycle = served == self.__max_requests
+
+            try:
+                return app(environ, start_response)
+            finally:
+                if recycle:
+                    log.info(
+                        "worker %d served %d requests, recycling", os.getpid(), served
+                    )
+                    shutdown()
+
+        server = make_server(
+            *self.__address, counting_app, threaded=True, fd=self.__socket.fileno()
+        )
+
+        # Track request threads, closing the server waits for in-flight requests
+        server.daemon_threads = False
+        signal.signal(signal.SIGTERM, lambda signum, frame: shutdown())
+
+        server.serve_forever()
+
+        # Waits for in-flight requests to complete
+        server.server_close()
@@ -0,0 +1,115 @@
+import asyncio
+import json
+
+import pytest
+from src import ContactBook
+from src.asgi import AsyncContactBook
+from src.database import create_database
+from src.limits import AdmissionController
+
+
+def request(app, method, path, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b""
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path}
+    asyncio.run(app(scope, receive, send))
+
+    headers = dict(sent[0]["headers"])
+    return sent[0]["status"], json.loads(sent[1]["body"]), headers
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = ContactBook(root_path=str(tmp_path), debug_mode=True).asgi(max_workers=2)
+    yield app
+    app.close()
+
+
+def test_routes(app):
+    contact = {"name": "one", "email": "one@github.com", "phone": "1"}
+    assert request(app, "POST", "/post", contact)[0] == 200
+    assert request(app, "POST", "/post", contact)[0] == 500
+
+    status, result, _ = request(app, "GET", "/search", {"name": "one"})
+    assert status == 200
+    assert result == [{"email": "one@github.com", "name": "one", "phone_number": "1"}]
+
+    update = {"email": "one@github.com", "new_name": "uno"}
+    assert request(app, "POST", "/update", update)[0] == 200
+    assert request(app, "DELETE", "/delete", {"email": "one@github.com"})[0] == 200
+
+
+def test_malformed_requests(app):
+    assert request(app, "GET", "/search", {})[0] == 400
+    for search in (
+        {"name": 5},
+        {"name": "a", "after": []},
+        {"email": ["a"]},
+        {"email": {"a": 1}},
+        {"phone": 123},
+        {"name": "a", "limit": True},
+    ):
+        assert request(app, "GET", "/search", search)[0] == 400
+    assert request(app, "GET", "/post")[0] == 405
+    assert request(app, "GET", "/missing")[0] == 404
+
+
+def test_search_pagination(app):
+    for index in range(3):
+        contact = {"name": "user", "email": f"{index}@github.com", "phone": index}
+        request(app, "POST", "/post", contact)
+
+    status, result, headers = request(
+        app, "GET", "/search", {"name": "use", "limit": 2}
+    )
+    assert len(result) == 2
+    assert headers[b"x-next-after"] == b"1@github.com"
+
+
+def test_limits(tmp_path):
+    book = ContactBook(
+        root_path=str(tmp_path),
+        debug_mode=True,
+        limit_options={"rate": 1, "burst": 1, "max_in_flight": 1},
+    )
+    app = book.asgi(max_workers=2)
+
+    search = {"email": "a@github.com"}
+    assert request(app, "GET", "/search", search)[0] == 200
+    status, result, headers = request(app, "GET", "/search", search)
+    assert status == 429 and headers[b"retry-after"] == b"1"
+    app.close()
+
+
+def test_cancelled_admission(tmp_path):
+    admission = AdmissionController(max_in_flight=1, max_queued=1, timeout=5)
+    app = AsyncContactBook(
+        create_database("sqlite", str(tmp_path)), admission=admission
+    )
+    assert admission.acquire()
+
+    async def cancel_queued():
+        messages = [{"type": "http.request", "body": b'{"email": "a@github.com"}'}]
+        scope = {"type": "http", "method": "GET", "path": "/search"}
+        task = asyncio.ensure_future(app(scope, messages.pop, lambda _: None))
+        while not admission.stats["queued"]:
+            await asyncio.sleep(0.01)
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_queued())
+
+    # The slot granted to the cancelled request is handed back right away
+    admission.release()
+    app.close()
+    assert admission.stats["in_flight"] == 0
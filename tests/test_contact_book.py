@@ -0,0 +1,438 @@
+import gzip
+import json
+import time
+from threading import Thread
+
+import pytest
+from src import ContactBook
+from src.limits import AdmissionController
+
+
+@pytest.fixture
+def client(tmp_path):
+    book = ContactBook(root_path=str(tmp_path), debug_mode=True)
+    return book.app.test_client()
+
+
+def test_bulk_import_ndjson(client):
+    body = "\n".join(
+        [
+            json.dumps({"name": "one", "email": "one@github.com", "phone": "1"}),
+            json.dumps({"name": "two", "email": "two@github.com", "phone": "2"}),
+            "not json",
+            json.dumps({"name": "dup", "email": "one@github.com", "phone": "3"}),
+        ]
+    )
+
+    response = client.post("/bulk", data=body, content_type="application/x-ndjson")
+
+    assert response.status_code == 200
+    assert response.json["added"] == 2
+    assert response.json["failed"] == 2
+    assert [error["row"] for error in response.json["errors"]] == [3, 4]
+
+
+def test_bulk_import_export_csv(client):
+    body = "name,email,phone\none,one@github.com,1\ntwo,two@github.com,2\n"
+
+    response = client.post("/bulk", data=body, content_type="text/csv")
+    assert response.json == {"added": 2, "failed": 0, "errors": []}
+
+    response = client.get("/bulk?format=csv")
+    assert response.data.decode().splitlines() == body.splitlines()
+
+    response = client.get("/bulk")
+    assert [json.loads(line)["email"] for line in response.data.splitlines()] == [
+        "one@github.com",
+        "two@github.com",
+    ]
+
+
+def test_search_pagination_and_streaming(client):
+    body = "\n".join(
+        json.dumps({"name": f"user-{i}", "email": f"{i:02}@github.com", "phone": i})
+        for i in range(5)
+    )
+    client.post("/bulk", data=body, content_type="application/x-ndjson")
+
+    response = client.get("/search", json={"name": "user", "limit": 2})
+    assert [row["email"] for row in response.json] == [
+        "00@github.com",
+        "01@github.com",
+    ]
+
+    after = response.headers["X-Next-After"]
+    response = client.get("/search", json={"name": "user", "limit": 3, "after": after})
+    assert len(response.json) == 3
+    assert "X-Next-After" not in response.headers
+
+    response = client.get("/search", json={"name": "user", "stream": "json"})
+    assert len(json.loads(response.data)) == 5
+
+    response = client.get("/search", json={"name": "user", "stream": "ndjson"})
+    assert len(response.data.splitlines()) == 5
+
+    # Names, emails, phone numbers and cursors have to be strings, limits integers
+    for search in (
+        {"name": 5},
+        {"name": "user", "after": []},
+        {"email": ["a"]},
+        {"email": {"a": 1}},
+        {"phone": 123},
+        {"name": "user", "limit": True},
+    ):
+        assert client.get("/search", json=search).status_code == 400
+
+
+def test_search_by_phone(client):
+    body = "\n".join(
+        json.dumps(
+            {"name": "user", "email": f"{i}@github.com", "phone": f"+1 555-01{i}"}
+        )
+        for i in range(3)
+    )
+    client.post("/bulk", data=body, content_type="application/x-ndjson")
+
+    response = client.get("/search", json={"phone": "+155501 2"})
+    assert [row["email"] for row in response.json] == ["2@github.com"]
+
+    search = {"phone": "+1 (555)", "phone_prefix": True, "limit": 2}
+    response = client.get("/search", json=search)
+    assert [row["email"] for row in response.json] == ["0@github.com", "1@github.com"]
+
+    response = client.get("/search", json={**search, "stream": "ndjson"})
+    assert len(response.data.splitlines()) == 3
+
+    response = client.get("/search", json={"phone": "1", "phone_prefix": "yes"})
+    assert response.status_code == 400
+
+
+def test_fuzzy_search(client):
+    body = "\n".join(
+        json.dumps({"name": name, "email": f"{i}@github.com", "phone": i})
+        for i, name in enumerate(["Jonathan Smith", "John Smyth", "Jane Doe"])
+    )
+    client.post("/bulk", data=body, content_type="application/x-ndjson")
+
+    response = client.get("/search", json={"name": "jonathon", "fuzzy": True})
+    assert [row["email"] for row in response.json] == ["0@github.com"]
+
+    response = client.get("/search", json={"name": "doe", "fuzzy": True, "limit": 1})
+    assert [row["name"] for row in response.json] == ["Jane Doe"]
+
+    response = client.get("/search", json={"email": "0@github.com", "fuzzy": True})
+    assert response.status_code == 400
+
+
+def test_metrics(tmp_path):
+    client = ContactBook(
+        root_path=str(tmp_path), debug_mode=True, metrics=True
+    ).app.test_client()
+
+    client.post("/post", json={"name": "one", "email": "one@github.com", "phone": "1"})
+    client.get("/search", json={"email": "one@github.com"})
+    client.get("/search", json={"email": "one@github.com"})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+
+    text = response.data.decode()
+    assert (
+        'fast_track_request_seconds_count{method="GET",route="/search",status="200"} 2'
+        in text
+    )
+    assert (
+        'fast_track_db_seconds_count{operation="search_entry",phase="fetch"} 1' in text
+    )
+    assert 'fast_track_db_rows_count{operation="search_entry"} 2' in text
+    assert 'fast_track_db_cache_hit_ratio{database="SQLite3"} 0.5' in text
+
+    # Not exposed unless enabled
+    (tmp_path / "disabled").mkdir()
+    book = ContactBook(root_path=str(tmp_path / "disabled"), debug_mode=True)
+    assert book.app.test_client().get("/metrics").status_code == 404
+    assert book.metrics.render() == "\n"
+
+
+def test_search_batch(client):
+    for index in range(3):
+        client.post(
+            "/post",
+            json={
+                "name": f"user {index}",
+                "email": f"{index}@github.com",
+                "phone": index,
+            },
+        )
+
+    # Spans more than one chunk, duplicates are collapsed
+    emails = [f"{index}@github.com" for index in range(600)] + ["1@github.com"]
+    response = client.post("/search/batch", json={"emails": emails})
+
+    assert response.status_code == 200
+    assert len(response.json) == 600
+    assert response.json["1@github.com"] == {
+        "email": "1@github.com",
+        "name": "user 1",
+        "phone_number": "1",
+    }
+    assert response.json["599@github.com"] is None
+
+    assert client.post("/search/batch", json={"emails": []}).status_code == 400
+    assert client.post("/search/batch", json={"emails": [1]}).status_code == 400
+
+
+def test_search_etags_and_compression(tmp_path):
+    client = ContactBook(
+        root_path=str(tmp_path), debug_mode=True, compression_threshold=200
+    ).app.test_client()
+    client.post("/post", json={"name": "rem", "email": "rem@github.com", "phone": "1"})
+
+    response = client.get("/search", json={"email": "rem@github.com"})
+    etag = response.headers["ETag"]
+    assert response.headers["Vary"] == "Accept-Encoding"
+
+    # Unchanged results are not sent again
+    response = client.get(
+        "/search", json={"email": "rem@github.com"}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304 and response.headers["ETag"] == etag
+
+    # Other searches, and writes, change the tag
+    response = client.get(
+        "/search", json={"name": "rem"}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200 and response.headers["ETag"] != etag
+
+    client.post("/update", json={"email": "rem@github.com", "new_name": "ram"})
+    response = client.get(
+        "/search", json={"email": "rem@github.com"}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200 and response.json[0]["name"] == "ram"
+
+    # Large results are compressed, small ones are not
+    for index in range(10):
+        client.post(
+            "/post",
+            json={
+                "name": f"user {index}",
+                "email": f"{index}@github.com",
+                "phone": str(index + 10),
+            },
+        )
+
+    response = client.get(
+        "/search", json={"name": "user"}, headers={"Accept-Encoding": "gzip"}
+    )
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["ETag"].endswith('-gzip"')
+    assert len(json.loads(gzip.decompress(response.data))) == 10
+
+    etag = response.headers["ETag"]
+    response = client.get(
+        "/search",
+        json={"name": "user"},
+        headers={"Accept-Encoding": "gzip", "If-None-Match": etag},
+    )
+    assert response.status_code == 304
+
+    response = client.get("/search", json={"name": "user"})
+    assert "Content-Encoding" not in response.headers
+    assert len(response.json) == 10
+
+
+def test_changes(client):
+    client.post("/post", json={"name": "rem", "email": "rem@github.com", "phone": "1"})
+    client.delete("/delete", json={"email": "rem@github.com"})
+
+    response = client.get("/changes")
+    changes = [json.loads(line) for line in response.data.splitlines()]
+    assert response.mimetype == "application/x-ndjson"
+    assert [(change["op"], change["email"]) for change in changes] == [
+        ("put", "rem@github.com"),
+        ("delete", "rem@github.com"),
+    ]
+    assert changes[0]["name"] == "rem" and changes[1]["name"] is None
+
+    response = client.get(f"/changes?since={changes[0]['seq']}")
+    assert [json.loads(line) for line in response.data.splitlines()] == changes[1:]
+
+    assert client.get("/changes?since=-1").status_code == 400
+
+
+def test_changes_not_tracked(tmp_path):
+    client = ContactBook(
+        root_path=str(tmp_path), debug_mode=True, db_options={"backend": "memory"}
+    ).app.test_client()
+    assert client.get("/changes").status_code == 501
+
+
+def test_rate_limit(tmp_path):
+    client = ContactBook(
+        root_path=str(tmp_path),
+        debug_mode=True,
+        metrics=True,
+        limit_options={"rate": 0.001, "burst": 2, "routes": {"/delete": 0}},
+    ).app.test_client()
+
+    assert client.get("/search", json={"email": "a@github.com"}).status_code == 200
+    assert client.get("/search", json={"email": "a@github.com"}).status_code == 200
+    response = client.get("/search", json={"email": "a@github.com"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+
+    # Routes are limited separately, and can be exempt
+    assert client.post("/post", json={"name": "a"}).status_code == 400
+    for _ in range(5):
+        assert (
+            client.delete("/delete", json={"email": "a@github.com"}).status_code != 429
+        )
+
+    metrics = client.get("/metrics").data.decode()
+    assert "fast_track_rate_limit_limited 1" in metrics
+
+
+def test_rate_limit_disabled(tmp_path):
+    # Exempting a route from a disabled limit does not install the limiter
+    book = ContactBook(
+        root_path=str(tmp_path),
+        debug_mode=True,
+        limit_options={"rate": 0, "routes": {"/post": 0}},
+    )
+    assert not book.app.before_request_funcs.get(None, [])
+
+
+def test_admission_control():
+    admission = AdmissionController(max_in_flight=1, max_queued=1, timeout=0.05)
+    assert admission.acquire()
+
+    # Waits in the queue and times out, rejected once the queue is full
+    waiter = Thread(target=admission.acquire)
+    waiter.start()
+    time.sleep(0.01)
+    assert not admission.acquire()
+    waiter.join()
+    assert not admission.acquire()
+
+    admission.release()
+    assert admission.acquire()
+    assert admission.stats == {
+        "admitted": 2,
+        "rejected": 1,
+        "timed_out": 2,
+        "in_flight": 1,
+        "queued": 0,
+    }
+
+
+def test_load_shedding(tmp_path):
+    book = ContactBook(
+        root_path=str(tmp_path),
+        debug_mode=True,
+        limit_options={"max_in_flight": 1, "queue_timeout": 0.01},
+    )
+    client = book.app.test_client()
+
+    with book.app.test_request_context():
+        # Occupy the only slot, as a long running request would
+        book.app.preprocess_request()
+        response = client.get("/search", json={"email": "a@github.com"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+    assert client.get("/search", json={"email": "a@github.com"}).status_code == 200
+
+    # Streamed responses keep their slot till they are sent
+    stream = client.get(
+        "/search", json={"email": "a@github.com", "stream": "json"}, buffered=False
+    )
+    other = book.app.test_client()
+    assert other.get("/search", json={"email": "a@github.com"}).status_code == 503
+    stream.close()
+    assert other.get("/search", json={"email": "a@github.com"}).status_code == 200
+
+
+def test_tenants(tmp_path):
+    book = ContactBook(
+        root_path=str(tmp_path),
+        debug_mode=True,
+        metrics=True,
+        tenant_options={"max_open": 1},
+    )
+    client = book.app.test_client()
+    contact = {"name": "rem", "email": "rem@github.com", "phone": "1"}
+
+    assert client.post("/post", json=contact).status_code == 400
+    assert (
+        client.post("/post", json=contact, headers={"X-Tenant-ID": "../a"}).status_code
+        == 400
+    )
+
+    first = {"X-Tenant-ID": "first"}
+    second = {"X-Tenant-ID": "second"}
+    assert client.post("/post", json=contact, headers=first).status_code == 200
+
+    # Tenants do not see each other's contacts
+    search = {"email": "rem@github.com"}
+    assert client.get("/search", json=search, headers=second).json == []
+    response = client.get("/search", json=search, headers=first)
+    assert response.json[0]["name"] == "rem"
+
+    # Opened again after being evicted, earlier tags no longer match
+    etag = response.headers["ETag"]
+    response = client.get(
+        "/search", json=search, headers={**first, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+
+    client.get("/search", json=search, headers=second)
+    response = client.get(
+        "/search", json=search, headers={**first, "If-None-Match": etag}
+    )
+    assert response.status_code == 200 and response.headers["ETag"] != etag
+
+    response = client.get("/bulk", headers=first)
+    assert len(response.data.splitlines()) == 1
+    response.close()
+
+    metrics = client.get("/metrics").data.decode()
+    assert "fast_track_tenants_open 1" in metrics
+    assert "fast_track_tenants_evictions 4" in metrics
+    assert (tmp_path / "tenants" / "second" / "contacts.db").exists()
+
+    with pytest.raises(ValueError):
+        book.asgi()
+
+
+def test_admin_backup_and_snapshot(tmp_path):
+    client = ContactBook(
+        root_path=str(tmp_path), debug_mode=True, admin_token="s3cret"
+    ).app.test_client()
+    client.post("/post", json={"name": "rem", "email": "rem@github.com", "phone": "1"})
+
+    # Requests without the token are turned away
+    for headers in ({}, {"Authorization": "Bearer wrong"}, {"Authorization": "s3cret"}):
+        response = client.post("/admin/backup", headers=headers)
+        assert response.status_code == 401
+        assert response.headers["WWW-Authenticate"] == "Bearer"
+    assert client.get("/admin/snapshot").status_code == 401
+    assert not (tmp_path / "backups").exists()
+
+    admin = {"Authorization": "Bearer s3cret"}
+    response = client.post("/admin/backup", headers=admin)
+    assert response.status_code == 200 and response.json["pages"] > 0
+    assert (tmp_path / "backups" / response.json["backup"]).exists()
+
+    response = client.get("/admin/snapshot", headers=admin)
+    assert response.mimetype == "application/gzip"
+    assert [
+        json.loads(line) for line in gzip.decompress(response.data).splitlines()
+    ] == [{"email": "rem@github.com", "name": "rem", "phone_number": "1"}]
+
+    # Not exposed unless enabled
+    (tmp_path / "disabled").mkdir()
+    client = ContactBook(
+        root_path=str(tmp_path / "disabled"), debug_mode=True
+    ).app.test_client()
+    assert client.post("/admin/backup").status_code == 404
@@ -0,0 +1,786 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from itertools import count
+from sqlite3 import Connection, OperationalError, ProgrammingError, connect
+from threading import Event, Thread
+
+import pytest
+from src.database import (
+    ConnectionPool,
+    InMemoryDB,
+    ShardedSQLite,
+    SQLite,
+    TenantDatabases,
+    backends,
+    create_database,
+    register_backend,
+    sqlite_db,
+)
+from src.database.writer import GroupCommitWriter
+from src.objects import Contact
+
+
+@pytest.fixture
+def database(tmp_path):
+    db = SQLite(str(tmp_path / "contacts.db"), pool_size=2)
+    yield db
+    db.close()
+
+
+def test_pool_reuses_connections(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=2)
+
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+
+    assert first is second
+    assert pool.open_connections == 1
+
+
+def test_pool_is_bounded(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=1, timeout=0.05)
+
+    with pool.connection():
+        with pytest.raises(TimeoutError):
+            pool.acquire()
+
+
+def test_pool_replaces_unhealthy_connections(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=1)
+
+    connection = pool.acquire()
+    connection.close()
+    pool.release(connection)
+
+    with pool.connection() as replacement:
+        assert replacement is not connection
+        assert replacement.execute("select 1").fetchone() == (1,)
+
+
+def test_pool_close_drains_connections(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=2)
+    with pool.connection():
+        pass
+
+    pool.close()
+
+    assert pool.open_connections == 0
+    with pytest.raises(ProgrammingError):
+        pool.acquire()
+
+
+def test_crud(database):
+    contact = Contact(name="demon-rem", email="rem@github.com", phone_number="007")
+
+    assert database.add_entry(contact)
+    assert not database.add_entry(contact)
+    assert database.update_entry(
+        email="rem@github.com", update=Contact(name="", email="", phone_number="008")
+    )
+    assert database.remove_entry(email="rem@github.com") == 1
+    assert database.remove_entry(email="rem@github.com") == 0
+
+
+@pytest.mark.parametrize("columns", range(8))
+def test_update_columns(database, columns):
+    database.add_entry(Contact(name="rem", email="rem@github.com", phone_number="1"))
+
+    # Every combination of updated columns has a query of its own
+    email, name, phone = (bool(columns & (1 << bit)) for bit in range(3))
+    update = Contact(
+        name="ram" if name else "",
+        email="ram@github.com" if email else "",
+        phone_number="2" if phone else "",
+    )
+    assert bool(database.update_entry(email="rem@github.com", update=update)) == bool(
+        columns
+    )
+
+    expected = (
+        "ram@github.com" if email else "rem@github.com",
+        "ram" if name else "rem",
+        "2" if phone else "1",
+    )
+    assert database.search_entry(email=expected[0], raw=True) == [expected]
+
+
+def test_concurrent_writes(database):
+    def worker(offset):
+        for index in range(offset, offset + 25):
+            database.add_entry(
+                Contact(
+                    name=f"user-{index}",
+                    email=f"user-{index}@github.com",
+                    phone_number=str(index),
+                )
+            )
+
+    threads = [Thread(target=worker, args=(offset,)) for offset in range(0, 100, 25)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(database.search_entry(name="user-")) == 100
+
+
+def test_name_index_backfill_and_sync(tmp_path):
+    db_file = str(tmp_path / "legacy.db")
+    with closing(connect(db_file)) as connection:
+        # Database created before the full-text index existed
+        connection.execute(
+            "create table contacts (email text primary key, "
+            "contact_name text not null, contact_number text unique not null)"
+        )
+        connection.execute("insert into contacts values ('a@github.com', 'Alpha', '1')")
+        connection.commit()
+
+    database = SQLite(db_file)
+    assert [c.email for c in database.search_entry(name="lph")] == ["a@github.com"]
+
+    database.update_entry(
+        email="a@github.com", update=Contact(name="Omega", email="", phone_number="")
+    )
+    assert database.search_entry(name="lph") == []
+    assert len(database.search_entry(name="MEG")) == 1
+
+    database.remove_entry(email="a@github.com")
+    assert database.search_entry(name="meg") == []
+    database.close()
+
+
+def test_search_cache_invalidation(database):
+    alpha = Contact(name="Alpha", email="a@github.com", phone_number="1")
+    database.add_entry(alpha)
+
+    assert database.search_entry(name="alp", raw=True) == [
+        ("a@github.com", "Alpha", "1")
+    ]
+    assert database.search_entry(name="alp", raw=True) == [
+        ("a@github.com", "Alpha", "1")
+    ]
+    assert database.search_entry(email="b@github.com") == []
+    assert database.cache_stats["hits"] == 1
+
+    # Unrelated write keeps the cached result for `alp`, but not the negative result
+    database.add_entry(Contact(name="Beta", email="b@github.com", phone_number="2"))
+    assert len(database.search_entry(email="b@github.com")) == 1
+    assert database.cache_stats["hits"] == 1
+    database.search_entry(name="alp")
+    assert database.cache_stats["hits"] == 2
+
+    # A contact that starts matching a cached search evicts it
+    database.update_entry(
+        email="b@github.com", update=Contact(name="Alphabet", email="", phone_number="")
+    )
+    assert len(database.search_entry(name="alp")) == 2
+
+    database.remove_entry(email="a@github.com")
+    assert [c.email for c in database.search_entry(name="alp")] == ["b@github.com"]
+
+
+def test_pragmas(tmp_path):
+    database = SQLite(str(tmp_path / "contacts.db"), pragmas={"synchronous": "off"})
+    with closing(connect(str(tmp_path / "contacts.db"))) as connection:
+        assert connection.execute("pragma journal_mode").fetchone() == ("wal",)
+    database.close()
+
+    with pytest.raises(ValueError):
+        SQLite(str(tmp_path / "contacts.db"), pragmas={"synchronous": "off; drop"})
+
+
+def test_write_batching(tmp_path):
+    database = SQLite(str(tmp_path / "contacts.db"), write_batching=True)
+
+    def worker(index):
+        phone = str(index % 31)
+        contact = Contact(name=f"user-{index}", email=f"{index}@x", phone_number=phone)
+        return database.add_entry(contact)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(worker, range(32)))
+
+    # A conflicting write fails on its own, without affecting the rest of its group
+    assert results.count(False) == 1
+    assert len(database.search_entry(name="user")) == 31
+    assert (
+        database.update_entry(
+            email="missing@x", update=Contact(name="x", email="", phone_number="")
+        )
+        == 0
+    )
+
+    database.close()
+
+
+def test_write_batching_failed_begin(tmp_path):
+    class Locked(Connection):
+        def execute(self, sql, *args):
+            if sql == "begin immediate":
+                raise OperationalError("database is locked")
+
+            return super().execute(sql, *args)
+
+    writer = GroupCommitWriter(
+        connect(str(tmp_path / "contacts.db"), factory=Locked, check_same_thread=False)
+    )
+    future = writer.submit(lambda connection: connection.execute("select 1"))
+
+    # Fails the callers instead of leaving them waiting
+    with pytest.raises(OperationalError):
+        future.result(timeout=5)
+
+    writer.close()
+
+
+def test_in_memory_database(tmp_path):
+    database = InMemoryDB(str(tmp_path), snapshot_interval=3)
+    rows = [
+        ("ada@github.com", "Ada Lovelace", "1"),
+        ("alan@github.com", "Alan Turing", "2"),
+        ("grace@github.com", "Grace Hopper", "3"),
+    ]
+    assert database.add_entries(Contact.from_row(row) for row in rows) == []
+
+    # Same constraints as SQLite, email and phone number are unique
+    assert not database.add_entry(
+        Contact(name="x", email="x@github.com", phone_number="1")
+    )
+    assert not database.update_entry(
+        email="ada@github.com", update=Contact(name="", email="", phone_number="2")
+    )
+
+    assert database.search_entry(name="LOVE", raw=True) == [rows[0]]
+    assert database.search_entry(name="a", limit=2, raw=True) == rows[:2]
+    assert database.search_entry(name="a", after=rows[0][0], raw=True) == rows[1:]
+    assert database.search_entry(name="g%r", raw=True) == [rows[2]]
+
+    assert database.update_entry(
+        email="alan@github.com",
+        update=Contact(
+            name="Alan M Turing", email="turing@github.com", phone_number=""
+        ),
+    )
+    assert database.remove_entry("grace@github.com") == 1
+    assert database.search_entry(name="Grace", raw=True) == []
+
+    # Written entries survive a restart, without the database being closed
+    restarted = InMemoryDB(str(tmp_path))
+    assert [contact.to_row() for contact in restarted.export_entries()] == [
+        contact.to_row() for contact in database.export_entries()
+    ]
+    assert restarted.search_entry(email="turing@github.com", raw=True) == [
+        ("turing@github.com", "Alan M Turing", "2")
+    ]
+    # Phone numbers loaded from the disk are searchable by their prefix
+    assert restarted.search_entry(phone="1", prefix=True, raw=True) == [
+        ("ada@github.com", "Ada Lovelace", "1")
+    ]
+    restarted.close()
+    database.close()
+
+
+def test_backend_registry(tmp_path):
+    assert {"memory", "postgres", "sqlite"} <= set(backends())
+
+    database = create_database("memory", str(tmp_path), snapshot_interval=10)
+    assert isinstance(database, InMemoryDB)
+    database.close()
+
+    register_backend("volatile", lambda root_path, **options: InMemoryDB(**options))
+    assert create_database("VOLATILE", str(tmp_path)).db_name == "InMemory"
+
+    with pytest.raises(ValueError):
+        create_database("missing", str(tmp_path))
+
+
+@pytest.mark.skipif(
+    "FAST_TRACK_POSTGRES_DSN" not in os.environ,
+    reason="needs a disposable server, set `FAST_TRACK_POSTGRES_DSN` to run",
+)
+def test_postgres_database():
+    pytest.importorskip("psycopg_pool")
+    database = create_database(
+        "postgres", "", dsn=os.environ["FAST_TRACK_POSTGRES_DSN"], pool_size=2
+    )
+    database.execute_query("truncate table contacts")
+
+    contact = Contact(name="demon-rem", email="rem@github.com", phone_number="007")
+    assert database.add_entry(contact)
+    assert not database.add_entry(contact)
+    failures = database.add_entries(
+        [contact, Contact(name="Ada", email="ada@github.com", phone_number="1")]
+    )
+    assert [index for index, _ in failures] == [0]
+
+    assert database.search_entry(name="DEMON", raw=True) == [contact.to_row()]
+    assert database.search_entry(name="a", limit=1, raw=True) == [
+        ("ada@github.com", "Ada", "1")
+    ]
+    assert database.update_entry(
+        email="rem@github.com", update=Contact(name="", email="", phone_number="008")
+    )
+    assert (
+        database.update_entry(
+            email="rem@github.com", update=Contact(name="", email="", phone_number="")
+        )
+        is False
+    )
+    assert [row.email for row in database.export_entries()] == [
+        "ada@github.com",
+        "rem@github.com",
+    ]
+    assert database.remove_entry(email="rem@github.com") == 1
+    database.close()
+
+
+def test_sharded_database(tmp_path):
+    database = ShardedSQLite(str(tmp_path), shards=3)
+    contacts = [
+        Contact(
+            name=f"user {index}",
+            email=f"user-{index}@github.com",
+            phone_number=str(index),
+        )
+        for index in range(30)
+    ]
+    assert database.add_entries(contacts) == []
+
+    # Phone numbers are unique across shards
+    assert not database.add_entry(
+        Contact(name="x", email="x@github.com", phone_number="7")
+    )
+    assert not database.update_entry(
+        email="user-1@github.com", update=Contact(name="", email="", phone_number="2")
+    )
+
+    expected = sorted(contact.to_row() for contact in contacts if "1" in contact.name)
+    assert database.search_entry(name="1", raw=True) == expected
+    assert database.search_entry(name="1", limit=3, raw=True) == expected[:3]
+    assert list(database.search_entries(name="1", raw=True)) == expected
+
+    # Moves the contact to (most likely) another shard, freeing up its number
+    assert database.update_entry(
+        email="user-1@github.com",
+        update=Contact(name="", email="moved@github.com", phone_number="100"),
+    )
+    assert database.search_entry(email="user-1@github.com", raw=True) == []
+    assert database.search_entry(email="moved@github.com", raw=True) == [
+        ("moved@github.com", "user 1", "100")
+    ]
+    assert database.add_entry(Contact(name="y", email="y@github.com", phone_number="1"))
+
+    assert database.remove_entry("y@github.com") == 1
+    assert database.add_entry(Contact(name="z", email="z@github.com", phone_number="1"))
+
+    emails = [contact.email for contact in database.export_entries()]
+    assert emails == sorted(emails) and len(emails) == 31
+    database.close()
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "memory", "sharded"])
+def test_get_many(tmp_path, backend):
+    database = create_database(backend, str(tmp_path))
+    for index in range(5):
+        database.add_entry(
+            Contact(
+                name=f"user {index}",
+                email=f"{index}@github.com",
+                phone_number=str(index),
+            )
+        )
+
+    emails = ["4@github.com", "missing@github.com", "0@github.com", "4@github.com"]
+    expected = {
+        "4@github.com": ("4@github.com", "user 4", "4"),
+        "missing@github.com": None,
+        "0@github.com": ("0@github.com", "user 0", "0"),
+    }
+    assert database.get_many(emails, raw=True) == expected
+    assert list(database.get_many(emails, raw=True)) == list(expected)
+    assert database.get_many(["0@github.com"])["0@github.com"].name == "user 0"
+
+    if backend == "sqlite":
+        # Repeated lookups are served from the search cache
+        assert database.cache_stats["hits"] >= 2
+
+    database.remove_entry("0@github.com")
+    assert database.get_many(["0@github.com"], raw=True) == {"0@github.com": None}
+    database.close()
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "memory", "sharded"])
+def test_phone_search(tmp_path, backend):
+    database = create_database(backend, str(tmp_path))
+    database.add_entries(
+        [
+            Contact(name="Alpha", email="a@github.com", phone_number="+1 (555) 010-01"),
+            Contact(name="Beta", email="b@github.com", phone_number="1555-01002"),
+            Contact(name="Gamma", email="c@github.com", phone_number="+44 20 7946"),
+        ]
+    )
+    database.add_entry(Contact(name="Delta", email="d@github.com", phone_number="155"))
+
+    def emails(**search):
+        return sorted(row[0] for row in database.search_entry(raw=True, **search))
+
+    assert emails(phone="+1.555.010.01") == ["a@github.com"]
+    assert emails(phone="155501002") == ["b@github.com"]
+    assert emails(phone="+1555") == []
+    assert emails(phone="+1", prefix=True) == ["a@github.com"]
+    assert emails(phone="1 55", prefix=True) == ["b@github.com", "d@github.com"]
+    assert emails(phone="1 55", prefix=True, limit=1, after="b@github.com") == [
+        "d@github.com"
+    ]
+    assert emails(phone="155", prefix=True, name="bet") == ["b@github.com"]
+    assert emails(phone="155", prefix=True, email="a@github.com") == []
+    assert emails(phone="-", prefix=True) == []
+    assert [
+        contact.email
+        for contact in database.search_entries("", "", phone="+", prefix=True)
+    ] == []
+
+    # Updated phone numbers are normalized again
+    database.update_entry(
+        email="d@github.com", update=Contact(name="", email="", phone_number="+4420")
+    )
+    assert emails(phone="+44", prefix=True) == ["c@github.com", "d@github.com"]
+    assert emails(phone="155", prefix=True) == ["b@github.com"]
+    assert [
+        contact.email
+        for contact in database.search_entries("", "", phone="+44", prefix=True)
+    ] == ["c@github.com", "d@github.com"]
+
+    database.remove_entry("c@github.com")
+    assert emails(phone="+4420", prefix=True) == ["d@github.com"]
+    database.close()
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "memory", "sharded"])
+def test_fuzzy_search(tmp_path, backend):
+    database = create_database(backend, str(tmp_path))
+    names = ["Jonathan Smith", "John Smyth", "Jane Doe", "Johnny Cash", "Smitty Werben"]
+    database.add_entries(
+        Contact(name=name, email=f"{index}@github.com", phone_number=str(index))
+        for index, name in enumerate(names)
+    )
+
+    def names_found(name, **search):
+        return [contact.name for contact in database.fuzzy_search(name, **search)]
+
+    # Misspelled names are found, the closest ones first
+    assert names_found("Jonathon Smith") == ["Jonathan Smith"]
+    assert names_found("jonathon") == ["Jonathan Smith"]
+    assert names_found("smith") == ["Jonathan Smith", "Smitty Werben"]
+    assert names_found("smith", limit=1) == ["Jonathan Smith"]
+    assert names_found("smyth", threshold=0.2)[0] == "John Smyth"
+    assert names_found("zzz") == []
+    assert database.fuzzy_search("") is None
+
+    # The index is kept up to date by writes
+    database.update_entry(
+        email="2@github.com",
+        update=Contact(name="Jane Smithe", email="", phone_number=""),
+    )
+    assert names_found("smith")[:2] == ["Jonathan Smith", "Jane Smithe"]
+    database.remove_entry("0@github.com")
+    assert "Jonathan Smith" not in names_found("jonathon smith")
+    database.close()
+
+
+def test_fuzzy_search_skips_common_trigrams(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite_db, "MAX_POSTINGS", 3)
+    database = SQLite(str(tmp_path / "contacts.db"))
+    database.add_entries(
+        Contact(name=f"user {name}", email=f"{name}@github.com", phone_number=name)
+        for name in ["alpha", "bravo", "charlie", "delta", "echo"]
+    )
+
+    # `use`, `ser`, ... are held by every contact, `bravo` is found through the rest
+    assert database.fuzzy_search("user brav", raw=True) == [
+        ("bravo@github.com", "user bravo", "bravo")
+    ]
+
+    # Nothing but common trigrams, still some of the contacts holding them are found
+    assert len(database.fuzzy_search("user", limit=2)) == 2
+    assert len(database.fuzzy_search("user", limit=2)) == 2
+    database.close()
+
+
+def test_phone_index_migration(tmp_path):
+    db_file = str(tmp_path / "legacy.db")
+    with closing(connect(db_file)) as connection:
+        # Database created before phone numbers were normalized
+        connection.execute(
+            "create table contacts (email text primary key, "
+            "contact_name text not null, contact_number text unique not null)"
+        )
+        connection.execute("insert into contacts values ('a@github.com', 'A', '0-12')")
+        connection.commit()
+
+    SQLite(db_file).close()
+    with closing(connect(db_file)) as connection:
+        # Rows added by tools unaware of the column are normalized on the next start
+        connection.execute(
+            "insert into contacts(email, contact_name, contact_number) "
+            "values ('b@github.com', 'B', '+0 13')"
+        )
+        connection.commit()
+
+    database = SQLite(db_file)
+    assert [c.email for c in database.search_entry(phone="012")] == ["a@github.com"]
+    assert [c.email for c in database.search_entry(phone="+01", prefix=True)] == [
+        "b@github.com"
+    ]
+
+    # Phone lookups are answered by the index, not by scanning the table
+    with closing(connect(db_file)) as connection:
+        plan = connection.execute(
+            "explain query plan select email from contacts "
+            "where contact_number_normalized >= ? and contact_number_normalized < ? "
+            "order by email limit ?",
+            ("01", "01:", 10),
+        ).fetchall()
+    assert "contacts_contact_number_normalized" in " ".join(row[-1] for row in plan)
+
+    # Backfilling the column is not reported as a change
+    assert [change[2] for change in database.changes()] == [
+        "a@github.com",
+        "b@github.com",
+    ]
+    database.close()
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "memory", "sharded"])
+def test_version(tmp_path, backend):
+    database = create_database(backend, str(tmp_path))
+    versions = [database.version]
+
+    database.add_entry(Contact(name="rem", email="rem@github.com", phone_number="1"))
+    versions.append(database.version)
+    database.search_entry(email="rem@github.com")
+    versions.append(database.version)
+    database.update_entry(
+        email="rem@github.com",
+        update=Contact(name="", email="ram@github.com", phone_number=""),
+    )
+    versions.append(database.version)
+    database.remove_entry("ram@github.com")
+    versions.append(database.version)
+
+    # Reads leave the version alone, every write bumps it
+    assert versions[1] == versions[2]
+    assert versions[0] < versions[1] < versions[3] < versions[4]
+    database.close()
+
+
+def test_change_log(tmp_path):
+    db_file = str(tmp_path / "contacts.db")
+    with closing(connect(db_file)) as connection:
+        # Contacts present before the change log existed are logged as inserts
+        connection.execute(
+            "create table contacts (email text primary key, "
+            "contact_name text not null, contact_number text unique not null)"
+        )
+        connection.execute("insert into contacts values ('a@github.com', 'a', '1')")
+        connection.commit()
+
+    database = SQLite(db_file, change_compact_interval=0)
+    database.add_entry(Contact(name="b", email="b@github.com", phone_number="2"))
+    database.update_entry(
+        email="b@github.com",
+        update=Contact(name="", email="c@github.com", phone_number=""),
+    )
+    database.remove_entry("a@github.com")
+
+    changes = list(database.changes())
+    assert [change[1:] for change in changes] == [
+        ("put", "a@github.com", "a", "1"),
+        ("put", "b@github.com", "b", "2"),
+        ("delete", "b@github.com", None, None),
+        ("put", "c@github.com", "b", "2"),
+        ("delete", "a@github.com", None, None),
+    ]
+    assert [change[0] for change in database.changes(since=changes[2][0])] == [
+        changes[3][0],
+        changes[4][0],
+    ]
+
+    # Superseded changes are dropped, the rest still lead to the same contacts
+    assert database.compact_changes() == 2
+    assert [change[1:3] for change in database.changes()] == [
+        ("delete", "b@github.com"),
+        ("put", "c@github.com"),
+        ("delete", "a@github.com"),
+    ]
+    database.close()
+
+    # Changes past the retention period are dropped, older cursors are rejected
+    database = SQLite(db_file, change_retention=0, change_compact_interval=0)
+    database.compact_changes()
+    assert list(database.changes(since=changes[-1][0])) == []
+    with pytest.raises(ValueError):
+        database.changes(since=changes[-2][0])
+
+    database.add_entry(Contact(name="d", email="d@github.com", phone_number="4"))
+    assert [change[0] for change in database.changes(since=changes[-1][0])] == [
+        changes[-1][0] + 1
+    ]
+    database.close()
+
+
+def test_tenant_databases(tmp_path):
+    closed = []
+
+    class Tracked(SQLite):
+        def close(self):
+            closed.append(self)
+            super().close()
+
+    tenants = TenantDatabases(
+        lambda tenant: Tracked(str(tmp_path / f"{tenant}.db")), max_open=2
+    )
+
+    first, serial = tenants.acquire("a")
+    first.add_entry(Contact(name="a", email="a@github.com", phone_number="1"))
+    assert tenants.acquire("a") == (first, serial)
+    tenants.release("a")
+
+    # Databases in use are kept open past the limit
+    tenants.acquire("b")
+    tenants.acquire("c")
+    assert closed == [] and tenants.stats["open"] == 3
+
+    # Least recently used databases are closed once released
+    tenants.release("a")
+    assert closed == [first]
+    tenants.release("b")
+    tenants.release("c")
+    assert tenants.stats == {"hits": 1, "misses": 3, "evictions": 1, "open": 2}
+
+    # Reopened under a new number, with its data intact
+    reopened, new_serial = tenants.acquire("a")
+    assert reopened is not first and new_serial != serial
+    assert reopened.search_entry(email="a@github.com")[0].name == "a"
+    tenants.release("a")
+
+    with pytest.raises(ValueError):
+        tenants.acquire("../a")
+
+    tenants.close()
+    assert tenants.stats["open"] == 0 and len(closed) == 4
+
+
+def test_tenant_databases_idle_timeout(tmp_path):
+    tenants = TenantDatabases(
+        lambda tenant: SQLite(str(tmp_path / f"{tenant}.db")), idle_timeout=0
+    )
+
+    tenants.acquire("a")
+    tenants.acquire("b")
+    tenants.release("a")
+    assert tenants.stats["open"] == 1
+
+    tenants.release("b")
+    assert tenants.stats == {"hits": 0, "misses": 2, "evictions": 2, "open": 0}
+
+
+def test_backup_and_snapshot(tmp_path):
+    database = SQLite(str(tmp_path / "contacts.db"))
+    database.add_entries(
+        Contact(name=f"user {i}", email=f"{i:03}@github.com", phone_number=str(i))
+        for i in range(300)
+    )
+
+    # Writes carry on while the copy is taken, a few pages at a time
+    writer = Thread(
+        target=lambda: [
+            database.add_entry(
+                Contact(name="late", email=f"late-{i}@github.com", phone_number=f"x{i}")
+            )
+            for i in range(20)
+        ]
+    )
+    writer.start()
+    pages = database.backup(str(tmp_path / "backup.db"), pages=2, pause=0)
+    writer.join()
+
+    assert pages > 2 and not (tmp_path / "backup.db.partial").exists()
+    with closing(connect(str(tmp_path / "backup.db"))) as copy:
+        assert copy.execute("pragma integrity_check").fetchone() == ("ok",)
+        (copied,) = copy.execute("select count(*) from contacts").fetchone()
+        assert 300 <= copied <= 320
+
+    # Restarted by a steady stream of writes, the copy is completed in a single step
+    done = Event()
+
+    def write_steadily():
+        for i in count():
+            if done.is_set():
+                return
+            database.update_entry(
+                email="000@github.com",
+                update=Contact(name=f"user {i}", email="", phone_number=""),
+            )
+
+    writer = Thread(target=write_steadily)
+    writer.start()
+    try:
+        database.backup(str(tmp_path / "steady.db"), pages=1, max_restarts=0)
+    finally:
+        done.set()
+        writer.join()
+        database.update_entry(
+            email="000@github.com",
+            update=Contact(name="user 0", email="", phone_number=""),
+        )
+
+    with closing(connect(str(tmp_path / "steady.db"))) as copy:
+        assert copy.execute("pragma integrity_check").fetchone() == ("ok",)
+        assert copy.execute("select count(*) from contacts").fetchone() == (320,)
+
+    # Writes made after the snapshot is taken are left out
+    rows = database.snapshot_entries(batch_size=10)
+    assert next(rows) == ("000@github.com", "user 0", "0")
+    database.remove_entry(email="299@github.com")
+    database.add_entry(Contact(name="new", email="new@github.com", phone_number="y"))
+    rows = list(rows)
+    assert len(rows) == 319 and rows[-1][0] == "late-9@github.com"
+
+    assert InMemoryDB().backup(str(tmp_path / "memory.db")) is None
+    database.close()
+
+
+def test_read_write_split(tmp_path):
+    db_file = str(tmp_path / "contacts.db")
+    database = SQLite(db_file, pool_size=2, cache_size=0)
+    database.add_entry(Contact(name="a", email="a@github.com", phone_number="1"))
+
+    # Searches are served while another writer holds the database locked
+    with closing(connect(db_file)) as writer:
+        writer.execute("begin immediate")
+        writer.execute("delete from contacts")
+        assert database.search_entry(email="a@github.com")[0].name == "a"
+        assert database.get_many(["a@github.com"])["a@github.com"].name == "a"
+        writer.rollback()
+
+    # Searches can not write, writes go through a single connection
+    database.search_entry(email="a@github.com")
+    with database._SQLite__read_pool.connection() as connection:
+        with pytest.raises(OperationalError):
+            connection.execute("delete from contacts")
+
+    database.add_entry(Contact(name="b", email="b@github.com", phone_number="2"))
+    assert database._SQLite__pool.open_connections == 1
+
+    # Streamed pages are read from the snapshot taken by the first one
+    rows = database.search_entries(name="b", batch_size=1, raw=True)
+    assert next(rows) == ("b@github.com", "b", "2")
+    database.add_entry(Contact(name="bb", email="bb@github.com", phone_number="3"))
+    assert list(rows) == []
+    assert len(list(database.search_entries(name="b", batch_size=1))) == 2
+    assert database.stats()["pool_size"] == 2
+    database.close()
@@ -1,5 +1,94 @@
+import json
+import logging
+import os
+from logging.handlers import QueueHandler
+
+import pytest
 from src import __version__
+from src.logger import DebugSampler, configure_logging, stop_logging
+from src.objects import (
+    Contact,
+    dump_rows,
+    iter_changes,
+    iter_json_array,
+    iter_ndjson,
+    normalize_phone,
+    serializer,
+)
 
 
 def test_version():
     assert __version__ == "0.1.0"
+
+
+@pytest.mark.parametrize("fast_backend", [True, False])
+def test_contact_serialization(monkeypatch, fast_backend):
+    if not fast_backend:
+        monkeypatch.setattr(serializer, "orjson", None)
+
+    rows = [("a@github.com", "Alpha", "1"), ("b@github.com", 'Be"ta', 2)]
+    contacts = [Contact.from_row(row) for row in rows]
+
+    assert json.loads(dump_rows(rows)) == [contact.encode() for contact in contacts]
+    assert [json.loads(line) for line in iter_ndjson(rows)] == json.loads(
+        b"".join(iter_json_array(rows))
+    )
+    assert contacts[0].stringify(indent=0) == json.dumps(
+        {"email": "a@github.com", "name": "Alpha", "phone_number": "1"}
+    )
+
+    with pytest.raises(AttributeError):
+        contacts[0].nickname = "alpha"
+
+    changes = [(1, "put", "a@github.com", "Alpha", "1"), (2, "delete", "b", None, None)]
+    assert [json.loads(line) for line in iter_changes(changes)] == [
+        {
+            "seq": 1,
+            "op": "put",
+            "email": "a@github.com",
+            "name": "Alpha",
+            "phone_number": "1",
+        },
+        {"seq": 2, "op": "delete", "email": "b", "name": None, "phone_number": None},
+    ]
+
+
+@pytest.mark.parametrize(
+    "phone, normalized",
+    [
+        ("+1 (555) 010-0199", "+15550100199"),
+        (" +1.555.010.0199 ", "+15550100199"),
+        ("007_0063", "0070063"),
+        (324451, "324451"),
+        ("+", ""),
+        ("ext.", ""),
+    ],
+)
+def test_normalize_phone(phone, normalized):
+    assert normalize_phone(phone) == normalized
+
+
+def test_logging_pipeline(tmp_path):
+    log_file = str(tmp_path / "logs.txt")
+    listener = configure_logging(log_file, max_bytes=200, backup_count=2)
+
+    for index in range(20):
+        logging.info("record %d", index)
+
+    # Queued records are written once the pipeline is stopped
+    stop_logging()
+    assert listener._thread is None
+    assert "record 19" in (tmp_path / "logs.txt").read_text()
+    assert sorted(os.listdir(tmp_path)) == ["logs.txt", "logs.txt.1", "logs.txt.2"]
+
+    # Reconfiguring replaces the pipeline instead of stacking handlers
+    configure_logging(None, debug_mode=True, sample_every=3)
+    configure_logging(None, debug_mode=True, sample_every=3)
+    assert sum(isinstance(h, QueueHandler) for h in logging.getLogger().handlers) == 1
+
+    sampler = DebugSampler()
+    assert [sampler.sample() for _ in range(6)] == [True, False, False] * 2
+
+    configure_logging(None, debug_mode=False)
+    assert not DebugSampler(every=1).sample()
+    stop_logging()